@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import shutil
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import openai
+import pydantic
+from openai import Client
+
+from story_writer import settings
+from story_writer.cache import make_cache_key
+from story_writer.cassette import get_cassette
+from story_writer.llm import clean_llm_output, get_llm_settings, validate_or_repair_llm_output
+from story_writer.metrics import CallMetrics, metrics
+from story_writer.story_config import StageOverrideSettings
+
+log = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Streaming isn't supported by the Batch API.
+IGNORED_SETTINGS_KEYS = ["stream", "stream_options"]
+FINISHED_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+
+class OpenAIBatchExecutor:
+    """Runs a batch file with the OpenAI Batch API: upload the file, create the batch, poll it, download the output."""
+
+    def __init__(self, client: Client, completion_window: str = "24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: Path) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+        )
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            log.info(
+                f"Batch {batch_id} is {batch.status}: {counts.completed}/{counts.total} done, {counts.failed} failed."
+            )
+        if batch.status == "failed":
+            raise RuntimeError(f"Batch {batch_id} failed: {batch.errors}")
+        return batch.status in FINISHED_STATUSES
+
+    def download(self, batch_id: str, output_path: Path) -> None:
+        """Writes the output (and errors) of every finished request to output_path. Expired batches are partial."""
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text.rstrip("\n") + "\n")
+
+
+class LocalBatchExecutor:
+    """
+    File-based stand-in for the Batch API, for testing, or for LLM platforms without a batch endpoint.
+    Sends each request of the batch file through the chat completions endpoint, one at a time, when the batch is
+    submitted, and writes the responses in the Batch API output format. The batch id is the path of the output file.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+
+    def submit(self, input_path: Path) -> str:
+        output_path = input_path.with_name(f"{input_path.stem}-local-output.jsonl")
+        with open(input_path, encoding="utf-8") as input_file, open(output_path, "w", encoding="utf-8") as output_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                result = {"id": f"batch_req_{request['custom_id']}", "custom_id": request["custom_id"]}
+                try:
+                    completion = self.client.chat.completions.create(**request["body"])
+                    result["response"] = {"status_code": 200, "body": completion.model_dump(mode="json")}
+                    result["error"] = None
+                except openai.APIError as err:
+                    log.error(f"Batch request {request['custom_id']} failed: {err}")
+                    result["response"] = None
+                    result["error"] = {"code": type(err).__name__, "message": str(err)}
+                output_file.write(json.dumps(result) + "\n")
+        return str(output_path)
+
+    def is_done(self, batch_id: str) -> bool:
+        return True
+
+    def download(self, batch_id: str, output_path: Path) -> None:
+        if Path(batch_id) != output_path:
+            shutil.copyfile(batch_id, output_path)
+
+
+def get_batch_executor(client: Client) -> OpenAIBatchExecutor | LocalBatchExecutor:
+    if settings.batch.executor == "local":
+        return LocalBatchExecutor(client)
+    return OpenAIBatchExecutor(client, completion_window=settings.batch.completion_window)
+
+
+def build_batch_request(
+    custom_id: str, messages: list[dict[str, str]], response_format: dict | None, llm_settings: dict
+) -> dict:
+    """One line of a Batch API input file."""
+    body = {key: value for key, value in llm_settings.items() if key not in IGNORED_SETTINGS_KEYS}
+    body["messages"] = messages
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def read_batch_output(output_path: Path, usage: dict[str, dict] | None = None) -> dict[str, list[str]]:
+    """
+    Returns the cleaned-up output of every choice, per custom_id. Failed requests are left out.
+    :param usage: Filled in with the token usage reported for each succeeded request, per custom_id.
+    """
+    results = {}
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                log.error(f"Batch request {result.get('custom_id')} failed: {result.get('error') or response}")
+                continue
+            choices = sorted(response["body"]["choices"], key=lambda choice: choice["index"])
+            results[result["custom_id"]] = [clean_llm_output(choice["message"]["content"] or "") for choice in choices]
+            if usage is not None and response["body"].get("usage"):
+                usage[result["custom_id"]] = response["body"]["usage"]
+    return results
+
+
+def run_batch(
+    client: Client,
+    stage: str,
+    requests: dict[str, list[dict[str, str]]],
+    response_format: dict | None = None,
+    model_settings: StageOverrideSettings | None = None,
+) -> dict[str, list[str]]:
+    """
+    Sends every request as a single batch, waits for it to finish, and returns the outputs per request id.
+    The batch files are kept in /stories/<story>/batch/<stage>/. If the script is stopped while waiting, running it
+    again with the same requests picks the submitted batch back up instead of submitting it again.
+
+    :param requests: Messages per request id (custom_id).
+    :return: The output of every choice, per request id. Failed requests are left out, the caller should fall back to
+             a regular LLM call for them. When replaying a cassette, the requests are served from it instead.
+    """
+    batch_dir = settings.story_dir / "batch" / stage
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    input_path = batch_dir / "input.jsonl"
+    state_path = batch_dir / "batch.json"
+    output_path = batch_dir / "output.jsonl"
+
+    llm_settings = get_llm_settings(model_settings)
+    cassette = get_cassette()
+    if cassette and cassette.mode == "replay":
+        results = {}
+        for custom_id, messages in requests.items():
+            outputs = cassette.replay(make_cache_key(messages, llm_settings, response_format))
+            if outputs is not None:
+                results[custom_id] = outputs
+                metrics.record_call(CallMetrics(stage=stage, latency=0.0, choices=len(outputs), replayed=True))
+        log.info(f"Replayed {len(results)} of {len(requests)} {stage} requests from the cassette.")
+        return results
+
+    lines = [
+        json.dumps(build_batch_request(custom_id, messages, response_format, llm_settings))
+        for custom_id, messages in requests.items()
+    ]
+    input_text = "\n".join(lines) + "\n"
+    input_hash = hashlib.sha256(input_text.encode("utf-8")).hexdigest()
+
+    executor = get_batch_executor(client)
+    state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+    if state.get("input_sha256") == input_hash:
+        batch_id = state["batch_id"]
+        log.info(f"Resuming {stage} batch {batch_id}.")
+    else:
+        input_path.write_text(input_text, encoding="utf-8")
+        log.info(f"Submitting {len(requests)} {stage} requests as a batch.")
+        batch_id = executor.submit(input_path)
+        state_path.write_text(json.dumps({"batch_id": batch_id, "input_sha256": input_hash}), encoding="utf-8")
+
+    start = time.perf_counter()
+    try:
+        while not executor.is_done(batch_id):
+            time.sleep(settings.batch.poll_interval)
+    except RuntimeError:
+        state_path.unlink()  # Submit a new batch next time.
+        raise
+    executor.download(batch_id, output_path)
+
+    usage = {}
+    results = read_batch_output(output_path, usage)
+    duration = time.perf_counter() - start
+    for custom_id, outputs in results.items():
+        # The Batch API doesn't report the latency of each request, they all take as long as the batch.
+        record_batch_call(stage, duration, len(outputs), usage.get(custom_id))
+    if cassette and cassette.mode == "record":
+        for custom_id, outputs in results.items():
+            messages = requests[custom_id]
+            key = make_cache_key(messages, llm_settings, response_format)
+            cassette.record(key, stage, messages, llm_settings, response_format, outputs, duration)
+    log.info(
+        f"Batch {batch_id} finished in {time.perf_counter() - start:.0f}s. "
+        f"{len(results)} of {len(requests)} {stage} requests succeeded."
+    )
+    return results
+
+
+def record_batch_call(stage: str, latency: float, choices: int, usage: dict | None) -> None:
+    """Adds a batch request to the stage's metrics, like llm.request_llm_outputs does for a regular call."""
+    usage = usage or {}
+    metrics.record_call(
+        CallMetrics(
+            stage=stage,
+            latency=latency,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            cached_prompt_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            choices=choices,
+        )
+    )
+
+
+def select_batch_output(
+    outputs: list[str],
+    validation_model: type[pydantic.BaseModel] | None = None,
+    stage: str = "unknown",
+    accept: Callable[[Any], bool] | None = None,
+) -> Any | None:
+    """
+    Validates the choices of a batch request, like llm.get_validated_llm_output does for a regular call.
+    Returns the first valid choice that passes the accept check (or the first valid choice), None if none are valid.
+    """
+    valid = []
+    for output in outputs:
+        try:
+            _, model = validate_or_repair_llm_output(output, validation_model, stage)
+        except pydantic.ValidationError as err:
+            log.error(f"Batch output failed validation: {err}")
+            continue
+        if model in ("", []):
+            continue
+        valid.append(model)
+    if not valid:
+        return None
+    return next((model for model in valid if accept is None or accept(model)), valid[0])
@@ -0,0 +1,364 @@
+"""
+End-to-end benchmarks of generate_story_outline and generate_story_rough_draft, against the fake LLM (fake_llm.py).
+
+Sweeps the number of chapters, scenes per chapter, and characters, for every save_story_file_type and
+consolidate_saved_output combination, and reports per case:
+    wall_time: Seconds for the outline and the draft.
+    cpu_time: CPU seconds spent by StoryWriter (and the libraries it calls), not counting the fake LLM.
+    bytes_written: Bytes written by the process (Linux only), ie every save of the outline, not just the last one.
+    output_bytes: Size of the story directory at the end.
+    peak_rss: Peak memory of the process, in bytes.
+The scaling exponent of each metric (n in O(x^n)) is fitted per sweep, so an O(chapters^2) save pattern shows up as a
+bytes_written exponent of about 2.
+
+Each case runs in its own process, for a clean peak_rss, settings, and caches.
+
+    python -m story_writer.benchmark --output results.json
+    python -m story_writer.benchmark --output new.json --compare results.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from statistics import median
+
+import httpx
+from openai import OpenAI
+
+from story_writer import settings
+from story_writer.fake_llm import FakeLLM, FakeLLMResponse, FakeLLMTransport
+from story_writer.metrics import metrics
+from story_writer.scripts.generate_story_outline import generate_story_outline
+from story_writer.scripts.generate_story_rough_draft import generate_story_rough_draft
+from story_writer.serializers import SERIALIZERS
+from story_writer.story_config import FakeLLMSettings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+PROMPT = "A lighthouse keeper finds a map that redraws itself every night."
+# The base case, and the values each dimension is swept over (the others are kept at the base case).
+BASE_CASE = {"chapters": 4, "scenes": 4, "characters": 4}
+SWEEPS = {"chapters": [2, 4, 8, 16], "scenes": [2, 4, 8], "characters": [2, 4, 8, 16]}
+# msgpack is benchmarked when its optional dependency is installed.
+FILE_TYPES = ["json", "yaml", *(["msgpack"] if SERIALIZERS["msgpack"].available else [])]
+CONSOLIDATE = [True, False]
+METRICS = ["wall_time", "cpu_time", "bytes_written", "output_bytes", "peak_rss"]
+# Metrics noisy enough that they're left out of the regression check.
+NOISY_METRICS = ["wall_time"]
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    chapters: int
+    scenes: int
+    characters: int
+    file_type: str = "yaml"
+    consolidate: bool = True
+    in_memory: bool = False  # settings.pipeline.in_memory
+    journal: bool = False  # settings.pipeline.journal
+    latency: float = 0.0  # Fake LLM seconds to first token.
+    tokens_per_second: float | None = None  # Fake LLM output speed, None is instant.
+    seed: int = 0
+
+    @property
+    def key(self) -> str:
+        layout = "consolidated" if self.consolidate else "split"
+        if self.in_memory:
+            layout += "/in-memory"
+        if self.journal:
+            layout += "/journal"
+        return f"{self.file_type}/{layout} chapters={self.chapters} scenes={self.scenes} characters={self.characters}"
+
+
+class TimedFakeLLM(FakeLLM):
+    """FakeLLM that keeps track of the CPU time spent generating responses, so it can be left out of the results."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cpu_time = 0.0
+
+    def handle(self, method: str, path: str, body: bytes) -> FakeLLMResponse:
+        start = time.thread_time()
+        try:
+            return super().handle(method, path, body)
+        finally:
+            with self._lock:
+                self.cpu_time += time.thread_time() - start
+
+
+def get_cases(
+    sweeps: dict[str, list[int]] = SWEEPS,
+    file_types: list[str] = FILE_TYPES,
+    consolidate: list[bool] = CONSOLIDATE,
+    **case_settings,
+) -> list[BenchmarkCase]:
+    """Every case of the sweeps, for every file type/consolidate combination. Cases shared by sweeps are run once."""
+    cases = {}
+    for file_type in file_types:
+        for consolidated in consolidate:
+            for dimension, values in sweeps.items():
+                for value in values:
+                    case = BenchmarkCase(
+                        **dict(BASE_CASE, **{dimension: value}),
+                        file_type=file_type,
+                        consolidate=consolidated,
+                        **case_settings,
+                    )
+                    cases[case.key] = case
+    return list(cases.values())
+
+
+def read_bytes_written() -> int | None:
+    """Bytes written by the process so far (files, and the terminal). None if the OS doesn't report it."""
+    try:
+        with open("/proc/self/io", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def read_peak_rss() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports kilobytes.
+
+
+def configure(case: BenchmarkCase) -> None:
+    """Points the settings at the case, and turns off anything that skips or adds LLM calls."""
+    settings.chapter_minimum_count = case.chapters
+    settings.scenes_per_chapter_minimum_count = case.scenes
+    settings.save_story_file_type = case.file_type
+    settings.consolidate_saved_output = case.consolidate
+    settings.pipeline.in_memory = case.in_memory
+    settings.pipeline.journal = case.journal
+    settings.llm_cache.enabled = False
+    settings.batch.scenes = settings.batch.draft = False
+    settings.hedging.enabled = False
+    settings.fake_llm = FakeLLMSettings(
+        enabled=True,
+        seed=case.seed,
+        latency=case.latency,
+        tokens_per_second=case.tokens_per_second,
+        array_items={"CharacterData": case.characters, "ChapterData": case.chapters, "SceneData": case.scenes},
+    )
+
+
+def run_case(case: BenchmarkCase) -> dict:
+    """Runs the outline and the draft for the case, in this process. Use benchmark_case() for a clean process."""
+    configure(case)
+    fake_llm = TimedFakeLLM(settings.fake_llm, model=settings.llm.model)
+    client = OpenAI(
+        base_url="http://fake-llm/v1",
+        api_key="fake",
+        http_client=httpx.Client(transport=FakeLLMTransport(fake_llm)),
+        max_retries=0,
+    )
+
+    with tempfile.TemporaryDirectory() as stories_dir, redirect_stdout(io.StringIO()):
+        bytes_written = read_bytes_written()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+
+        story_data = generate_story_outline(client, PROMPT, stories_dir=Path(stories_dir))
+        # The draft starts its own metrics (metrics-draft.json).
+        llm_calls = metrics.summary()["total"]["llm_calls"]
+        generate_story_rough_draft(client, story_data if case.in_memory else None)
+        llm_calls += metrics.summary()["total"]["llm_calls"]
+
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start - fake_llm.cpu_time
+        if bytes_written is not None:
+            bytes_written = read_bytes_written() - bytes_written
+        output_bytes = sum(path.stat().st_size for path in Path(stories_dir).rglob("*") if path.is_file())
+
+    return dict(
+        asdict(case),
+        key=case.key,
+        wall_time=round(wall_time, 4),
+        cpu_time=round(cpu_time, 4),
+        backend_cpu_time=round(fake_llm.cpu_time, 4),
+        llm_calls=llm_calls,
+        bytes_written=bytes_written,
+        output_bytes=output_bytes,
+        peak_rss=read_peak_rss(),
+    )
+
+
+def benchmark_case(case: BenchmarkCase, repeat: int = 1) -> dict:
+    """Runs the case repeat times, each in a new process. Timings are the median of the runs."""
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-m", "story_writer.benchmark", "--run-case", json.dumps(asdict(case))],
+            cwd=Path(__file__).parents[1],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"Benchmark case '{case.key}' failed:\n{process.stderr}")
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    result = runs[0]
+    for metric in ("wall_time", "cpu_time", "backend_cpu_time", "peak_rss"):
+        values = [run[metric] for run in runs if run[metric] is not None]
+        result[metric] = median(values) if values else None
+    return result
+
+
+def scaling_exponent(points: list[tuple[float, float]]) -> float | None:
+    """Least squares slope of log(y) over log(x): about 1 for linear growth, 2 for quadratic."""
+    points = [(math.log(x), math.log(y)) for x, y in points if x and y]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / variance, 2)
+
+
+def get_scaling(results: list[dict], sweeps: dict[str, list[int]] = SWEEPS) -> dict:
+    """Scaling exponent of every metric, per swept dimension and file type/consolidate combination."""
+    scaling = {}
+    for dimension in sweeps:
+        scaling[dimension] = {}
+        layouts = sorted({(result["file_type"], result["consolidate"]) for result in results})
+        for file_type, consolidate in layouts:
+            others = {key: value for key, value in BASE_CASE.items() if key != dimension}
+            sweep = [
+                result
+                for result in results
+                if (result["file_type"], result["consolidate"]) == (file_type, consolidate)
+                and all(result[key] == value for key, value in others.items())
+            ]
+            layout = f"{file_type}/{'consolidated' if consolidate else 'split'}"
+            scaling[dimension][layout] = {
+                metric: scaling_exponent([(result[dimension], result[metric]) for result in sweep])
+                for metric in METRICS
+            }
+    return scaling
+
+
+def compare_results(results: list[dict], baseline: list[dict], threshold: float = 0.2) -> list[str]:
+    """Returns a line per metric that got worse than the baseline by more than the threshold (0.2 = 20%)."""
+    baseline_results = {result["key"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(result["key"])
+        if not previous:
+            continue
+        for metric in METRICS:
+            if metric in NOISY_METRICS or not result.get(metric) or not previous.get(metric):
+                continue
+            ratio = result[metric] / previous[metric]
+            if ratio > 1 + threshold:
+                regressions.append(f"{result['key']}: {metric} {previous[metric]} -> {result[metric]} ({ratio:.2f}x)")
+    return regressions
+
+
+def print_results(results: list[dict], scaling: dict) -> None:
+    print(f"{'case':<64} {'wall s':>8} {'cpu s':>8} {'written KB':>11} {'output KB':>10} {'peak MB':>8}")
+    for result in results:
+        written = f"{result['bytes_written'] / 1024:.0f}" if result["bytes_written"] is not None else "-"
+        peak = f"{result['peak_rss'] / 2**20:.0f}" if result["peak_rss"] is not None else "-"
+        print(
+            f"{result['key']:<64} {result['wall_time']:>8.2f} {result['cpu_time']:>8.2f} {written:>11} "
+            f"{result['output_bytes'] / 1024:>10.0f} {peak:>8}"
+        )
+    print("\nScaling exponents (1 = linear, 2 = quadratic):")
+    for dimension, layouts in scaling.items():
+        for layout, exponents in layouts.items():
+            values = ", ".join(f"{metric}={exponent}" for metric, exponent in exponents.items())
+            print(f"  {dimension:<10} {layout:<18} {values}")
+
+
+def parse_sweep(value: str) -> tuple[str, list[int]]:
+    dimension, _, values = value.partition("=")
+    if dimension not in SWEEPS or not values:
+        raise argparse.ArgumentTypeError(f"Expected one of {list(SWEEPS)}=<n>,<n>,..., got '{value}'.")
+    return dimension, [int(v) for v in values.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the outline and draft pipeline against the fake LLM.")
+    parser.add_argument("--output", type=Path, help="Writes the results to this json file.")
+    parser.add_argument("--compare", type=Path, help="Results file of a previous run to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed growth per metric, 0.2 = 20%%.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each case, timings are the median.")
+    parser.add_argument(
+        "--sweep",
+        type=parse_sweep,
+        action="append",
+        help=f"Overrides the values of a sweep, ie chapters=2,4,8. Default: {SWEEPS}",
+    )
+    parser.add_argument("--file-types", type=lambda v: v.split(","), default=FILE_TYPES)
+    parser.add_argument("--consolidate", type=lambda v: [s == "true" for s in v.split(",")], default=CONSOLIDATE)
+    parser.add_argument("--in-memory", action="store_true", help="Runs with settings.pipeline.in_memory.")
+    parser.add_argument("--journal", action="store_true", help="Runs with settings.pipeline.journal.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake LLM seconds to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Fake LLM output speed.")
+    parser.add_argument("--run-case", type=str, help=argparse.SUPPRESS)  # Runs one case, used by benchmark_case().
+    args = parser.parse_args()
+
+    if args.run_case:
+        logging.disable(logging.WARNING)
+        print(json.dumps(run_case(BenchmarkCase(**json.loads(args.run_case)))))
+        return
+
+    sweeps = dict(args.sweep) if args.sweep else SWEEPS
+    cases = get_cases(
+        sweeps,
+        args.file_types,
+        args.consolidate,
+        in_memory=args.in_memory,
+        journal=args.journal,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+    )
+    results = []
+    for number, case in enumerate(cases, start=1):
+        log.info(f"Benchmark {number}/{len(cases)}: {case.key}")
+        results.append(benchmark_case(case, repeat=args.repeat))
+
+    scaling = get_scaling(results, sweeps)
+    print_results(results, scaling)
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+            "scaling": scaling,
+        }
+        args.output.write_text(json.dumps(report, indent=4), encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["results"]
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
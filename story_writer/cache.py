@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from story_writer import settings
+
+log = logging.getLogger(__name__)
+
+# LLM settings that don't change the generated output, and so shouldn't change the cache key.
+IGNORED_SETTINGS_KEYS = ["stream", "stream_options"]
+
+
+def make_cache_key(messages: list[dict[str, str]], llm_settings: dict, response_format: dict | None) -> str:
+    """
+    Creates a content-addressed key for an LLM call.
+    Identical messages, (output affecting) settings, and response schema will always produce the same key.
+    """
+    obj = {
+        "messages": messages,
+        "llm_settings": {k: v for k, v in llm_settings.items() if k not in IGNORED_SETTINGS_KEYS},
+        "response_format": response_format,
+    }
+    serialized = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent, size-bounded cache of LLM output strings. Each entry is saved as a separate file in cache_dir.
+
+    Entries are evicted in least-recently-used order once the total size of the cache exceeds max_size_bytes.
+    Recency is tracked with the file modification time, so it survives between runs.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()  # key: file size, least recently used first.
+        self._size = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._size += size
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> list[str] | None:
+        """Returns the cached outputs for the key, or None if the key isn't cached."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    outputs = json.load(f)["outputs"]
+            except (OSError, ValueError, KeyError) as err:
+                log.warning(f"Discarding unreadable cache entry '{path}': {err}")
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            os.utime(path)  # Mark as recently used for future runs.
+            return outputs
+
+    def set(self, key: str, outputs: list[str]) -> None:
+        """Saves the outputs under the key, then evicts the least recently used entries if over max size."""
+        data = json.dumps({"outputs": outputs}, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            path = self._path(key)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_path, mode="wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # Atomic, a crash can't leave a half-written entry.
+
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+
+            while self._size > self.max_size_bytes and len(self._entries) > 1:
+                oldest_key = next(iter(self._entries))
+                log.debug(f"Evicting LLM cache entry '{oldest_key}'.")
+                self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._entries.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
+
+
+_response_cache: ResponseCache | None = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache, creating it from the user settings on first use."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            cache_dir = settings.llm_cache.directory or Path(__file__).parents[1] / "stories" / ".llm_cache"
+            _response_cache = ResponseCache(
+                cache_dir=cache_dir, max_size_bytes=int(settings.llm_cache.max_size_mb * 1024 * 1024)
+            )
+            log.debug(f"Using LLM response cache at '{cache_dir}'.")
+        return _response_cache
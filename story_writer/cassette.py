@@ -0,0 +1,103 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from story_writer import settings
+
+log = logging.getLogger(__name__)
+
+CASSETTE_FILE_NAME = "cassette.jsonl"
+
+
+class CassetteMissError(LookupError):
+    """A replayed request isn't in the cassette."""
+
+
+class Cassette:
+    """
+    Recorded LLM calls, one json object per line: the request key (cache.make_cache_key), the stage, the request
+    (messages, LLM settings, response format), the output of every choice, and how long the call took.
+
+    When recording, calls are appended to path, or to /stories/<story>/cassette.jsonl if path is None. Calls made before
+    the story directory exists (the first call names the story) are kept in memory until it does.
+    When replaying, every recording of a request is served once, in order. The last recording of a request is served
+    again to any further identical requests.
+    """
+
+    def __init__(self, mode: str, path: Path | None = None):
+        if mode == "replay" and path is None:
+            raise ValueError("Replaying LLM calls requires the cassette.path setting.")
+        self.mode = mode
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: list[str] = []  # Recorded lines not written to the file yet.
+        self._recordings: dict[str, deque[dict]] = {}
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    recording = json.loads(line)
+                    self._recordings.setdefault(recording["key"], deque()).append(recording)
+        log.info(f"Replaying {sum(len(r) for r in self._recordings.values())} LLM calls from '{self.path}'.")
+
+    def replay(self, key: str) -> list[str] | None:
+        """Returns the recorded outputs of the request, or None if it wasn't recorded."""
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                return None
+            recording = recordings.popleft() if len(recordings) > 1 else recordings[0]
+            return recording["outputs"]
+
+    def record(
+        self,
+        key: str,
+        stage: str,
+        messages: list[dict[str, str]],
+        llm_settings: dict,
+        response_format: dict | None,
+        outputs: list[str],
+        duration: float,
+    ) -> None:
+        recording = {
+            "key": key,
+            "stage": stage,
+            "timestamp": time.time(),
+            "messages": messages,
+            "settings": llm_settings,
+            "response_format": response_format,
+            "outputs": outputs,
+            "duration": round(duration, 3),
+        }
+        with self._lock:
+            self._pending.append(json.dumps(recording, ensure_ascii=False, default=str))
+            self._flush()
+
+    def _flush(self) -> None:
+        path = self.path or (settings.story_dir / CASSETTE_FILE_NAME if settings.story_dir else None)
+        if path is None or not path.parent.exists():
+            return
+        with open(path, mode="a", encoding="utf-8") as f:
+            f.write("\n".join(self._pending) + "\n")
+        self._pending = []
+
+
+_cassette: Cassette | None = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette | None:
+    """Returns the process-wide cassette, or None if LLM calls aren't recorded or replayed (settings.cassette)."""
+    global _cassette
+    if settings.cassette.mode == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None or _cassette.mode != settings.cassette.mode:
+            _cassette = Cassette(settings.cassette.mode, settings.cassette.path)
+        return _cassette
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from typing import Any
+
+from story_writer import settings
+from story_writer.journal import PatchPath, StoryJournal
+from story_writer.models.outline import LazyStoryData, StoryData
+from story_writer.resume import get_run_progress
+
+log = logging.getLogger(__name__)
+
+
+class StoryDataWriter:
+    """
+    Write-behind saving of the outline. save() writes the outline if it wasn't saved in the last `interval` seconds,
+    otherwise it's only marked as changed, and written by the next save() past the interval, or by flush().
+    The write happens on the calling (pipeline) thread, so the outline can't change halfway through being saved.
+
+    With `journal`, save_patch() appends small changes to the outline journal (see journal.StoryJournal) instead of
+    writing the whole outline. Every full write compacts the journal into the outline file.
+
+    mark_complete() saves a completion marker (see resume.RunProgress) once the outline it marks is saved.
+    """
+
+    def __init__(self, interval: float = 0.0, journal: bool = False, compact_every: int = 25):
+        self.interval = interval
+        self.journal = journal
+        self.compact_every = compact_every
+        self.saves = 0
+        self.skipped_saves = 0
+        self.journal_entries = 0
+        self._lock = threading.Lock()
+        self._last_save: float | None = None
+        self._unsaved: StoryData | None = None
+        self._markers: list[tuple[str, int | None]] = []
+
+    def save(self, story_data: StoryData, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if force or self._last_save is None or now - self._last_save >= self.interval:
+                self._write(story_data)
+            else:
+                self._unsaved = story_data
+                self.skipped_saves += 1
+
+    def save_patch(self, story_data: StoryData, path: PatchPath, value: Any) -> None:
+        """
+        Saves a change to the outline: `value` replaces the value at `path`, ie ["chapters", 2, "scenes"].
+        story_data must already contain the change, it's written in full when the journal is disabled or compacted.
+        """
+        if not self.journal:
+            self.save(story_data)
+            return
+
+        with self._lock:
+            if self._last_save is None or self._unsaved is not None:
+                # The journal patches the outline file, so the outline file has to be up to date first.
+                self._write(story_data)
+                return
+            StoryJournal(settings.story_dir).append(path, value)
+            self.journal_entries += 1
+            if self.journal_entries >= self.compact_every:
+                self._write(story_data)
+            else:
+                self._save_markers()
+
+    def compact(self, story_data: StoryData) -> None:
+        """Saves the outline in full if the journal has entries, folding them into the outline file."""
+        if self.journal_entries:
+            self.save(story_data)
+
+    def mark_complete(self, stage: str, chapter: int | None = None) -> None:
+        """
+        Marks a stage, or a chapter of a stage, as complete. Call it after saving the outline with the stage's changes.
+        When the save was coalesced, the marker is saved by the next write.
+        """
+        with self._lock:
+            self._markers.append((stage, chapter))
+            if self._unsaved is None:
+                self._save_markers()
+
+    def flush(self) -> None:
+        """Writes the outline if it changed since the last write."""
+        with self._lock:
+            if self._unsaved is not None:
+                self._write(self._unsaved)
+
+    def _write(self, story_data: StoryData) -> None:
+        story_data.save_to_file(output_dir=settings.story_dir)
+        # The outline file now has every change, a journal left over would replay outdated changes on load.
+        StoryJournal(settings.story_dir).clear()
+        self.journal_entries = 0
+        self._last_save = time.monotonic()
+        self._unsaved = None
+        self.saves += 1
+        self._save_markers()
+
+    def _save_markers(self) -> None:
+        progress = get_run_progress()
+        for stage, chapter in self._markers:
+            progress.mark_complete(stage, chapter)
+        self._markers.clear()
+
+
+_writer: StoryDataWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_story_data_writer() -> StoryDataWriter:
+    """
+    Returns the process-wide outline writer. Saves every change, unless settings.pipeline.in_memory is set.
+    reset_story_data_writer() starts a new one, ie for a new story.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            pipeline = settings.pipeline
+            _writer = StoryDataWriter(
+                interval=pipeline.checkpoint_interval if pipeline.in_memory else 0.0,
+                journal=pipeline.journal,
+                compact_every=pipeline.journal_compact_every,
+            )
+        return _writer
+
+
+def reset_story_data_writer() -> None:
+    global _writer
+    with _writer_lock:
+        _writer = None
+
+
+def save_story_data(story_data: StoryData) -> None:
+    """Saves the outline to the story directory, or schedules it to be saved (see settings.pipeline)."""
+    get_story_data_writer().save(story_data)
+
+
+def save_chapter_scenes(story_data: StoryData, index: int) -> None:
+    """
+    Saves the scenes of the chapter at `index` (zero-based), as a journal entry with settings.pipeline.journal.
+    Marks the chapter's scenes as complete, so a resumed story doesn't generate them again.
+    """
+    writer = get_story_data_writer()
+    chapter = story_data.chapters[index]
+    writer.save_patch(story_data, ["chapters", index, "scenes"], chapter.scenes)
+    writer.mark_complete("scenes", chapter.number)
+
+
+def compact_story_data(story_data: StoryData) -> None:
+    """Folds the outline journal, if any, into the outline file."""
+    get_story_data_writer().compact(story_data)
+
+
+def load_story_data(story_data: StoryData | None = None, lazy: bool = False) -> StoryData | LazyStoryData:
+    """
+    Returns the outline handed over by the previous stage, or loads it from the story directory.
+    :param lazy: For read-only use. Stories saved in the split layout are loaded section by section, as they're used.
+    """
+    if story_data is not None:
+        return story_data
+    if lazy:
+        return StoryData.load_lazily(saved_dir=settings.story_dir)
+    return StoryData.load_from_file(saved_dir=settings.story_dir)
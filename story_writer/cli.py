@@ -1,26 +1,45 @@
 import argparse
+from pathlib import Path
 
-from openai import OpenAI
-
+from story_writer import settings
+from story_writer.client import get_client, override_llm_url
 from story_writer.scripts.generate_story_outline import generate_story_outline
 from story_writer.scripts.generate_story_rough_draft import generate_story_rough_draft
 
 
 def cli():
     parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=str, help="Overrides the port in the llm_url setting.")
+    parser.add_argument("--host", type=str, help="Overrides the host in the llm_url setting.")
+    parser.add_argument("--api-key", type=str, help="Overrides the api_key setting.")
+    parser.add_argument("--record", action="store_true", help="Records every LLM call to the story's cassette.jsonl.")
+    parser.add_argument("--replay", type=Path, help="Replays the LLM calls recorded in this cassette.jsonl file.")
+    parser.add_argument(
+        "--resume", type=Path, help="Story directory of a failed run to finish, skipping the completed stages/chapters."
+    )
     parser.add_argument(
-        "--port",
-        type=str,
-        default="1234",
+        "--fake-llm", action="store_true", help="Uses the local fake LLM (see the fake_llm setting), for benchmarks."
     )
-    parser.add_argument("--host", type=str, default="http://127.0.0.1")
-    parser.add_argument("--api-key", type=str, default="story-writer")
 
     args = parser.parse_args()
-    client = OpenAI(base_url=f"{args.host}:{args.port}/v1", api_key=args.api_key)
+    if args.host or args.port:
+        settings.llm_url = override_llm_url(settings.llm_url, args.host, args.port)
+    if args.api_key:
+        settings.api_key = args.api_key
+    if args.record:
+        settings.cassette.mode = "record"
+    if args.replay:
+        settings.cassette.mode = "replay"
+        settings.cassette.path = args.replay
+    if args.fake_llm:
+        settings.fake_llm.enabled = True
+
+    # One client, and one connection pool, shared by every stage.
+    client = get_client()
 
     with open("stories/prompt.txt", encoding="utf-8") as f:
         prompt = f.read()
 
-    generate_story_outline(client, prompt.strip())
-    generate_story_rough_draft(client)
+    story_data = generate_story_outline(client, prompt.strip(), resume_dir=args.resume)
+    # Without in_memory, the draft loads the saved outline, like when drafting a story outlined in an earlier run.
+    generate_story_rough_draft(client, story_data if settings.pipeline.in_memory else None)
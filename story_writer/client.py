@@ -0,0 +1,112 @@
+import importlib.util
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+from story_writer import settings
+from story_writer.fake_llm import FakeLLMTransport
+from story_writer.load_balancer import Backend, LoadBalancedClient, LoadBalancer
+
+log = logging.getLogger(__name__)
+
+_client: OpenAI | LoadBalancedClient | None = None
+_client_lock = threading.Lock()
+
+
+def override_llm_url(llm_url: str, host: str | None = None, port: str | int | None = None) -> str:
+    """
+    Returns llm_url with only the given parts replaced, ie the --host and --port command line options.
+    The scheme, path (ie /v1), and the part that isn't given are kept.
+
+    :param host: Host name or IP address. May include a scheme, ie "https://example.com", which replaces the scheme too.
+    :param port: Port number.
+    """
+    url = urlsplit(llm_url)
+    scheme, hostname = url.scheme, url.hostname or ""
+    if host:
+        if "://" in host:
+            host_url = urlsplit(host)
+            scheme, hostname = host_url.scheme, host_url.hostname or ""
+        else:
+            hostname = host
+    port = port or url.port
+    if ":" in hostname:  # IPv6
+        hostname = f"[{hostname}]"
+    netloc = f"{hostname}:{port}" if port else hostname
+    return urlunsplit((scheme, netloc, url.path, url.query, url.fragment))
+
+
+def create_client(llm_url: str | None = None, api_key: str | None = None) -> OpenAI:
+    """
+    Creates an OpenAI client with a pooled, keep-alive http transport configured by settings.http_client.
+
+    :param llm_url: URL to the LLM platform. Defaults to settings.llm_url
+    :param api_key: API key for the LLM platform. Defaults to settings.api_key
+    """
+    http_settings = settings.http_client
+
+    http2 = http_settings.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        log.warning("HTTP/2 requires the 'h2' package (pip install httpx[http2]). Falling back to HTTP/1.1.")
+        http2 = False
+
+    transport = None
+    if settings.fake_llm.enabled:
+        log.info("Using the fake LLM (settings.fake_llm) instead of the LLM platform.")
+        transport = FakeLLMTransport()
+
+    http_client = DefaultHttpxClient(
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=http_settings.max_connections,
+            max_keepalive_connections=http_settings.max_keepalive_connections,
+            keepalive_expiry=http_settings.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(http_settings.timeout, connect=http_settings.connect_timeout),
+        http2=http2,
+    )
+
+    return OpenAI(
+        base_url=llm_url or settings.llm_url,
+        api_key=api_key or settings.api_key,
+        http_client=http_client,
+        # Retries are handled by llm.create_chat_completion, using the shared rate limiter.
+        max_retries=0,
+    )
+
+
+def create_load_balanced_client() -> LoadBalancedClient:
+    """Creates a client per settings.load_balancer backend, behind a load balancer."""
+    balancer_settings = settings.load_balancer
+    backends = [
+        Backend(url=backend.url, client=create_client(backend.url, backend.api_key), weight=backend.weight)
+        for backend in balancer_settings.backends
+    ]
+    balancer = LoadBalancer(
+        backends,
+        strategy=balancer_settings.strategy,
+        max_failures=balancer_settings.max_failures,
+        ejection_time=balancer_settings.ejection_time,
+    )
+    return LoadBalancedClient(balancer)
+
+
+def get_client() -> OpenAI | LoadBalancedClient:
+    """
+    Returns the process-wide OpenAI client, shared by every outline stage and the draft stage.
+    If settings.load_balancer has backends, the client spreads the calls over them.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if settings.load_balancer.backends:
+                urls = [backend.url for backend in settings.load_balancer.backends]
+                log.debug(f"Creating load balanced LLM client for {urls}.")
+                _client = create_load_balanced_client()
+            else:
+                log.debug(f"Creating LLM client for '{settings.llm_url}'.")
+                _client = create_client()
+        return _client
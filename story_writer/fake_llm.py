@@ -0,0 +1,406 @@
+"""
+Deterministic stand-in for an OpenAI-compatible LLM platform, for load testing and benchmarks without a model.
+
+FakeLLM answers /chat/completions requests with synthetic output: json that matches the request's response_format
+(see models.utils.create_json_schema), or plain text without one. Latency, output speed, streaming, and error rates
+are set with settings.fake_llm. Responses only depend on the seed, the request, and how many times the same request
+was sent before, so runs are repeatable regardless of the order concurrent calls come in.
+
+Use it in-process with FakeLLMTransport (client.create_client does when settings.fake_llm.enabled is set), or as a
+standalone server: python -m story_writer.fake_llm --port 1234
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import httpx
+
+from story_writer import settings
+from story_writer.rate_limit import CHARS_PER_TOKEN, estimate_text_tokens, estimate_tokens
+from story_writer.story_config import FakeLLMSettings
+
+log = logging.getLogger(__name__)
+
+WORDS = [
+    "ancient",
+    "amber",
+    "bridge",
+    "cinder",
+    "copper",
+    "dawn",
+    "ember",
+    "falcon",
+    "forest",
+    "glass",
+    "harbor",
+    "hollow",
+    "iron",
+    "lantern",
+    "meadow",
+    "midnight",
+    "mirror",
+    "north",
+    "oath",
+    "orchard",
+    "raven",
+    "river",
+    "salt",
+    "shadow",
+    "silver",
+    "stone",
+    "storm",
+    "thorn",
+    "tide",
+    "valley",
+    "willow",
+    "winter",
+    "ash",
+    "bell",
+    "crown",
+    "drift",
+    "echo",
+    "feather",
+    "frost",
+    "gale",
+    "grove",
+    "hearth",
+    "ivory",
+    "marsh",
+    "quill",
+    "rune",
+    "spire",
+    "veil",
+    "wander",
+    "whisper",
+]
+NAMES = [
+    "Aria",
+    "Bram",
+    "Cora",
+    "Dain",
+    "Elin",
+    "Fenn",
+    "Galen",
+    "Hale",
+    "Isla",
+    "Joren",
+    "Kira",
+    "Lorn",
+    "Mira",
+    "Nox",
+    "Orin",
+    "Pell",
+    "Quinn",
+    "Rhea",
+    "Soren",
+    "Tamsin",
+]
+DEFAULT_ARRAY_ITEMS = 2
+MALFORMATIONS = ["truncated", "trailing_comma", "code_fence", "not_json"]
+
+
+class FakeLLMResponse:
+    """Status code, headers, and the body of a response, as chunks of bytes sent with the given delays."""
+
+    def __init__(self, status_code: int, body: list[tuple[float, bytes]], content_type: str = "application/json"):
+        self.status_code = status_code
+        self.headers = {"content-type": content_type}
+        self.body = body  # (seconds to wait before sending the chunk, chunk)
+
+    def iter_body(self) -> Iterator[bytes]:
+        for delay, chunk in self.body:
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+
+class FakeLLM:
+    """Generates the responses. Thread-safe."""
+
+    def __init__(self, fake_settings: FakeLLMSettings | None = None, model: str = "fake-llm"):
+        self.settings = fake_settings or FakeLLMSettings()
+        self.model = model
+        self._lock = threading.Lock()
+        self._attempts: dict[str, int] = {}  # Times each request was seen, so a retried request gets a new response.
+
+    def handle(self, method: str, path: str, body: bytes) -> FakeLLMResponse:
+        path = path.split("?")[0].rstrip("/")
+        if method == "GET" and path.endswith("/models"):
+            return self._json_response(200, {"object": "list", "data": [{"id": self.model, "object": "model"}]})
+        if method == "POST" and path.endswith("/chat/completions"):
+            try:
+                request = json.loads(body)
+            except json.JSONDecodeError:
+                return self._error(400, "invalid_request_error", "The request body isn't valid json.")
+            return self.chat_completion(request)
+        return self._error(404, "not_found", f"Unknown endpoint: {method} {path}")
+
+    def chat_completion(self, request: dict) -> FakeLLMResponse:
+        request_hash = hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(request_hash, 0)
+            self._attempts[request_hash] = attempt + 1
+        rng = random.Random(f"{self.settings.seed}:{request_hash}:{attempt}")
+
+        latency = self.settings.latency * (1 + rng.uniform(-1, 1) * self.settings.latency_jitter)
+        if rng.random() < self.settings.failure_rate:
+            return self._error(500, "server_error", "Injected failure.", delay=latency)
+
+        response_format = request.get("response_format") or None
+        choice_count = request.get("n") or 1
+        outputs = [self.generate_output(response_format, rng) for _ in range(choice_count)]
+        completion_id = f"chatcmpl-{request_hash[:16]}-{attempt}"
+        usage = {
+            "prompt_tokens": estimate_tokens(request.get("messages") or []),
+            "completion_tokens": sum(max(estimate_text_tokens(output), 1) for output in outputs),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            return self._stream(completion_id, outputs, usage if include_usage else None, latency)
+
+        completion = {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [
+                {"index": index, "message": {"role": "assistant", "content": output}, "finish_reason": "stop"}
+                for index, output in enumerate(outputs)
+            ],
+            "usage": usage,
+        }
+        generation_time = self._generation_time(max(estimate_text_tokens(output) for output in outputs))
+        return self._json_response(200, completion, delay=latency + generation_time)
+
+    def generate_output(self, response_format: dict | None, rng: random.Random) -> str:
+        """Synthetic json matching the response_format's schema (maybe malformed, see malformed_json_rate), or text."""
+        if not response_format or response_format.get("type") != "json_schema":
+            return self._text(rng, self.settings.text_tokens)
+        json_schema = response_format["json_schema"]
+        schema = json_schema["schema"]
+        top_level_items = self.settings.array_items.get(json_schema.get("name"), DEFAULT_ARRAY_ITEMS)
+        output = json.dumps(generate_from_schema(schema, rng, root=schema, array_items=top_level_items), indent=2)
+        if rng.random() < self.settings.malformed_json_rate:
+            output = malform_json(output, rng)
+        return output
+
+    def _generation_time(self, tokens: int) -> float:
+        return tokens / self.settings.tokens_per_second if self.settings.tokens_per_second else 0.0
+
+    def _stream(self, completion_id: str, outputs: list[str], usage: dict | None, latency: float) -> FakeLLMResponse:
+        chunk_chars = self.settings.chunk_tokens * CHARS_PER_TOKEN
+        chunk_delay = self._generation_time(self.settings.chunk_tokens)
+        created = int(time.time())
+
+        def event(choices: list[dict], chunk_usage: dict | None = None) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": self.model,
+                "choices": choices,
+            }
+            if chunk_usage:
+                chunk["usage"] = chunk_usage
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        body = []
+        longest = max(len(output) for output in outputs)
+        for start in range(0, longest, chunk_chars):
+            # Every choice gets its next piece of output in the same step, like a batched inference server.
+            choices = [
+                {"index": index, "delta": {"role": "assistant", "content": output[start : start + chunk_chars]}}
+                for index, output in enumerate(outputs)
+                if start < len(output)
+            ]
+            body.append((latency if start == 0 else chunk_delay, event(choices)))
+        finished = [{"index": index, "delta": {}, "finish_reason": "stop"} for index in range(len(outputs))]
+        body.append((0.0 if body else latency, event(finished)))
+        if usage:
+            body.append((0.0, event([], usage)))
+        body.append((0.0, b"data: [DONE]\n\n"))
+        return FakeLLMResponse(200, body, content_type="text/event-stream")
+
+    @staticmethod
+    def _text(rng: random.Random, tokens: int) -> str:
+        """Paragraphs of made-up sentences, about the given number of tokens long."""
+        sentences = []
+        length = 0
+        while length < tokens * CHARS_PER_TOKEN:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        paragraphs = [" ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)]
+        return "\n\n".join(paragraphs)
+
+    @staticmethod
+    def _json_response(status_code: int, content: dict, delay: float = 0.0) -> FakeLLMResponse:
+        return FakeLLMResponse(status_code, [(delay, json.dumps(content).encode("utf-8"))])
+
+    def _error(self, status_code: int, error_type: str, message: str, delay: float = 0.0) -> FakeLLMResponse:
+        return self._json_response(status_code, {"error": {"message": message, "type": error_type}}, delay=delay)
+
+
+def generate_from_schema(schema: dict, rng: random.Random, root: dict, array_items: int | None = None) -> Any:
+    """
+    Returns a random value valid against the json schema. Covers what pydantic generates for the outline models:
+    $ref/$defs, anyOf/oneOf/allOf, enum/const, objects (every property is filled in), arrays, and the scalar types.
+
+    :param root: The top-level schema, $refs are resolved against it.
+    :param array_items: Number of items, if the schema is an array. Nested arrays get DEFAULT_ARRAY_ITEMS.
+    """
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"].removeprefix("#/").split("/"):
+            target = target[part]
+        return generate_from_schema(target, rng, root, array_items)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            # Prefer a real value over null, so optional fields are filled in too.
+            options = [option for option in schema[key] if option.get("type") != "null"] or schema[key]
+            return generate_from_schema(options[0], rng, root, array_items)
+    if "allOf" in schema:
+        merged = {}
+        for part in schema["allOf"]:
+            merged.update(part)
+        return generate_from_schema(merged, rng, root, array_items)
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if schema_type == "object" or "properties" in schema:
+        return {
+            name: generate_from_schema(property_schema, rng, root)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        count = max(array_items or DEFAULT_ARRAY_ITEMS, schema.get("minItems", 0))
+        count = min(count, schema.get("maxItems", count))
+        return [generate_from_schema(schema.get("items", {}), rng, root) for _ in range(count)]
+    if schema_type == "integer":
+        return rng.randint(schema.get("minimum", 1), schema.get("maximum", 100))
+    if schema_type == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 100)), 2)
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    if schema_type == "null":
+        return None
+    return _string(schema, rng)
+
+
+def _string(schema: dict, rng: random.Random) -> str:
+    if schema.get("title") == "Name":
+        value = f"{rng.choice(NAMES)} {rng.choice(WORDS).capitalize()}"
+    else:
+        value = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize()
+    value = value.ljust(schema.get("minLength", 0), "x")
+    return value[: schema["maxLength"]] if "maxLength" in schema else value
+
+
+def malform_json(output: str, rng: random.Random) -> str:
+    """Breaks the json in one of the ways LLMs do."""
+    malformation = rng.choice(MALFORMATIONS)
+    if malformation == "truncated":  # Cut off by max_tokens.
+        return output[: rng.randint(1, max(len(output) - 1, 1))]
+    if malformation == "trailing_comma":
+        index = output.rfind("}")
+        return output[:index].rstrip() + ",\n" + output[index:] if index > 0 else output + ","
+    if malformation == "code_fence":
+        return f"Here is the json:\n```json\n{output}\n```"
+    return "I'm sorry, I can't produce that right now."
+
+
+_fake_llm: FakeLLM | None = None
+_fake_llm_lock = threading.Lock()
+
+
+def get_fake_llm() -> FakeLLM:
+    """
+    Returns the process-wide FakeLLM, configured by settings.fake_llm. Shared by every client (and load balancer
+    backend), so a request retried on another backend is still counted as a retry.
+    """
+    global _fake_llm
+    with _fake_llm_lock:
+        if _fake_llm is None:
+            _fake_llm = FakeLLM(settings.fake_llm, model=settings.llm.model or "fake-llm")
+        return _fake_llm
+
+
+class FakeLLMTransport(httpx.BaseTransport):
+    """httpx transport that answers the OpenAI client's requests with a FakeLLM, without any network I/O."""
+
+    def __init__(self, fake_llm: FakeLLM | None = None):
+        self.fake_llm = fake_llm or get_fake_llm()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.fake_llm.handle(request.method, request.url.path, request.read())
+        return httpx.Response(
+            response.status_code, headers=response.headers, content=response.iter_body(), request=request
+        )
+
+
+class FakeLLMRequestHandler(BaseHTTPRequestHandler):
+    fake_llm: FakeLLM
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._respond(self.fake_llm.handle("GET", self.path, b""))
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+        self._respond(self.fake_llm.handle("POST", self.path, body))
+
+    def _respond(self, response: FakeLLMResponse) -> None:
+        self.send_response(response.status_code)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        for chunk in response.iter_body():
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug(format % args)
+
+
+def create_server(host: str, port: int, fake_llm: FakeLLM | None = None) -> ThreadingHTTPServer:
+    """An OpenAI-compatible http server backed by a FakeLLM. Its base url is http://<host>:<port>/v1"""
+    handler = type("Handler", (FakeLLMRequestHandler,), {"fake_llm": fake_llm or get_fake_llm()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the fake OpenAI-compatible LLM server (see settings.fake_llm).")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.host, args.port, get_fake_llm())
+    log.info(f"Fake LLM listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import logging
+import math
+import threading
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Any, TypeVar
+
+from story_writer import settings
+
+log = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+class LatencyTracker:
+    """Thread-safe window of the most recent call latencies, per stage."""
+
+    def __init__(self, window: int = 50):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque[float]] = {}
+
+    def record(self, stage: str, latency: float) -> None:
+        with self._lock:
+            if stage not in self._latencies:
+                self._latencies[stage] = deque(maxlen=self.window)
+            self._latencies[stage].append(latency)
+
+    def percentile(self, stage: str, percentile: float, min_samples: int = 1) -> float | None:
+        """Nearest-rank percentile (0-100) of the stage's recent latencies. None if there are fewer than min_samples."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(stage, []))
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return latencies[max(0, math.ceil(percentile / 100 * len(latencies)) - 1)]
+
+
+latency_tracker = LatencyTracker(window=settings.hedging.window)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    Threads the hedged calls (the original and its duplicates) run on, while the calling thread waits.
+    Sized so every concurrent stage call can have its duplicates in flight at the same time, without queueing.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            concurrency = max(settings.scenes_max_concurrency, settings.draft_max_concurrency)
+            _executor = ThreadPoolExecutor(
+                max_workers=concurrency * (1 + settings.hedging.max_hedges), thread_name_prefix="hedge"
+            )
+        return _executor
+
+
+def get_hedge_delay(stage: str) -> float | None:
+    """Seconds to wait on a call of the stage before sending a duplicate. None if hedging is off, or still warming up."""
+    hedging = settings.hedging
+    if not hedging.enabled:
+        return None
+    delay = latency_tracker.percentile(stage, hedging.percentile, hedging.min_samples)
+    if delay is None:
+        return None
+    return max(delay, hedging.min_delay)
+
+
+def run_hedged(
+    call: Callable[[], R],
+    is_valid: Callable[[R], bool],
+    delay: float,
+    max_hedges: int = 1,
+    on_hedge: Callable[[], None] | None = None,
+    on_discard: Callable[[R], None] | None = None,
+) -> tuple[R, bool]:
+    """
+    Runs call(), and sends up to max_hedges duplicates of it, delay seconds apart, while no valid result is back.
+    Returns the first valid result. If no result is valid, the first result is returned, so the caller's usual
+    invalid output handling (retries) still applies.
+
+    The delay is counted from when the latest call starts running, not from when it's queued, so calls waiting for a
+    free thread don't trigger duplicates.
+
+    The other calls lose the race. Losers that haven't started yet are cancelled. A request that's already in flight
+    can't be aborted with the (sync) OpenAI client, so it's left to finish in the background. Every result that isn't
+    returned is passed to on_discard, ie to count the wasted tokens.
+
+    :return: The result, and True if it came from a duplicate rather than the original call.
+    :raises Exception: The error of the last call, if every call failed.
+    """
+    executor = get_hedge_executor()
+    started = threading.Event()
+    first = _submit(executor, call, started)
+    pending: set[Future] = {first}
+    finished: list[Future] = []
+    hedges = 0
+    error = None
+    while pending:
+        if hedges < max_hedges:
+            # Set once the latest call starts running, or any call finishes.
+            started.wait()
+        done, pending = wait(pending, timeout=delay if hedges < max_hedges else None, return_when=FIRST_COMPLETED)
+        if not done:
+            hedges += 1
+            log.info(f"Call is slower than {delay:.1f}s, sending duplicate {hedges} of {max_hedges}.")
+            if on_hedge:
+                on_hedge()
+            started = threading.Event()
+            for future in pending:
+                future.add_done_callback(lambda _, event=started: event.set())
+            pending.add(_submit(executor, call, started))
+            continue
+
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            finished.append(future)
+            if is_valid(future.result()):
+                return _settle(future, finished, pending, first, on_discard)
+
+    if finished:
+        return _settle(finished[0], finished, pending, first, on_discard)
+    raise error
+
+
+def _submit(executor: ThreadPoolExecutor, call: Callable[[], R], started: threading.Event) -> Future:
+    def run() -> R:
+        started.set()
+        return call()
+
+    future = executor.submit(run)
+    future.add_done_callback(lambda _: started.set())
+    return future
+
+
+def _settle(
+    winner: Future, finished: list[Future], pending: set[Future], first: Future, on_discard: Callable | None
+) -> tuple[Any, bool]:
+    for future in [*finished, *pending]:
+        if future is winner or future.cancel():
+            continue
+        future.add_done_callback(partial(_discard, on_discard=on_discard))
+    return winner.result(), winner is not first
+
+
+def _discard(future: Future, on_discard: Callable | None) -> None:
+    if on_discard and not future.cancelled() and future.exception() is None:
+        on_discard(future.result())
@@ -0,0 +1,62 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any
+
+from pydantic_core import to_jsonable_python
+
+log = logging.getLogger(__name__)
+
+JOURNAL_FILE_NAME = "story_data.journal.jsonl"
+
+PatchPath = list[str | int]
+
+
+class StoryJournal:
+    """
+    Append-only log of changes to the outline, saved next to the outline file as story_data.journal.jsonl.
+    Each line is a patch: {"path": ["chapters", 2, "scenes"], "value": [...]}, which replaces the value at the path.
+    Patches only ever replace values, so replaying a patch that's already in the outline file is harmless.
+    Not thread-safe, writes are serialized by the caller (checkpoint.StoryDataWriter).
+    """
+
+    def __init__(self, story_dir: Path):
+        self.path = story_dir / JOURNAL_FILE_NAME
+
+    def append(self, path: PatchPath, value: Any) -> None:
+        line = json.dumps({"path": path, "value": to_jsonable_python(value)}, ensure_ascii=False)
+        with open(self.path, mode="a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def read(self) -> list[dict]:
+        """Returns the patches in the journal, in order. A partly written last line (ie from a crash) is skipped."""
+        if not self.path.exists():
+            return []
+        patches = []
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    patches.append(json.loads(line))
+                except json.JSONDecodeError as err:
+                    log.warning(f"Skipping unreadable line {number} of the outline journal '{self.path}': {err}")
+        return patches
+
+    def clear(self) -> None:
+        """Empties the journal, once its patches are saved in the outline file."""
+        self.path.unlink(missing_ok=True)
+
+
+def apply_patches(data: Any, patches: list[dict]) -> Any:
+    """Applies the journal patches to the (json) outline data, in place. Returns the patched data."""
+    for patch in patches:
+        if not patch["path"]:
+            data = patch["value"]  # The whole value is replaced.
+            continue
+        *parents, key = patch["path"]
+        target = data
+        for part in parents:
+            target = target[part]
+        target[key] = patch["value"]
+    return data
@@ -0,0 +1,96 @@
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+CLOSING = {"{": "}", "[": "]"}
+CONTROL_CHAR_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+STRING_AT_END = re.compile(r'"(?:[^"\\]|\\.)*"$')
+KEY_AT_END = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"$')
+TOKEN_AT_END = re.compile(r"[A-Za-z0-9.+\-]+$")
+NUMBER_PATTERN = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+
+
+def repair_json(text: str) -> str | None:
+    """
+    Fixes the common ways LLM output fails to be valid json, without another LLM call:
+        - Markdown code fences and stray text before/after the json value ("Here is the JSON: {...}").
+        - Trailing commas before a closing bracket.
+        - Unescaped newlines/tabs (control characters) in strings.
+        - Output cut off part way (ie, at max_tokens). Unfinished strings, keys, and literals are closed or dropped,
+          then the open objects/arrays are closed.
+    The repaired output still has to be validated, ie an object that was cut off may be missing required keys.
+
+    :return: The repaired json string. None if the text doesn't contain the start of a json object or array.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        return None
+
+    out: list[str] = []
+    stack: list[str] = []
+    in_string = False
+    escaped = False
+    for char in text[min(starts) :]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif ord(char) < 0x20:
+                char = CONTROL_CHAR_ESCAPES.get(char, f"\\u{ord(char):04x}")
+            out.append(char)
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in CLOSING:
+            stack.append(char)
+        elif char in "}]":
+            if not stack or CLOSING[stack[-1]] != char:
+                break  # Mismatched bracket, treat the rest as trailing text.
+            _remove_trailing_comma(out)
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return "".join(out)
+            continue
+        out.append(char)
+
+    # The text ended before the json value was closed.
+    if in_string:
+        if escaped:
+            out.pop()  # A lone backslash would escape the closing quote.
+        out.append('"')
+    repaired = _trim_incomplete_tail("".join(out), stack)
+    return repaired + "".join(CLOSING[bracket] for bracket in reversed(stack))
+
+
+def _remove_trailing_comma(out: list[str]) -> None:
+    index = len(out) - 1
+    while index >= 0 and out[index] in " \t\r\n":
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index]
+
+
+def _trim_incomplete_tail(text: str, stack: list[str]) -> str:
+    """Drops a trailing comma, a key without a value, or a cut-off literal, until the text ends on a complete value."""
+    while True:
+        text = text.rstrip()
+        if text.endswith(","):
+            text = text[:-1]
+        elif text.endswith(":"):
+            text = STRING_AT_END.sub("", text[:-1].rstrip())
+        elif stack and stack[-1] == "{" and KEY_AT_END.search(text):
+            text = KEY_AT_END.sub(r"\1", text)
+        elif (token := TOKEN_AT_END.search(text)) and not _is_complete_literal(token.group()):
+            text = text[: token.start()]
+        else:
+            return text
+
+
+def _is_complete_literal(token: str) -> bool:
+    return token in ("true", "false", "null") or NUMBER_PATTERN.fullmatch(token) is not None
@@ -2,23 +2,43 @@ import json
 import logging
 import re
 import time
+from collections.abc import Callable
 from json import JSONDecodeError
-from typing import TypeVar
+from typing import Any, TypeVar
 
+import httpx
+import openai
 import pydantic
 from openai import Client, Stream
+from openai.types.chat import ChatCompletion
 from pydantic import BaseModel
 
 from story_writer import settings
+from story_writer.cache import get_response_cache, make_cache_key
+from story_writer.cassette import CassetteMissError, get_cassette
+from story_writer.hedging import get_hedge_delay, latency_tracker, run_hedged
+from story_writer.json_repair import repair_json
+from story_writer.load_balancer import BACKEND_FAILURES, Backend, LoadBalancedClient
+from story_writer.metrics import CallMetrics, metrics
 from story_writer.models.base import StoryStructure
-from story_writer.models.utils import create_json_schema
+from story_writer.models.utils import create_json_schema, get_type_adapter
+from story_writer.prompt_layout import prefix_tracker
+from story_writer.prompts import repair_output_prompt
+from story_writer.rate_limit import backoff_delay, estimate_tokens, get_rate_limiter, parse_retry_after
 from story_writer.story_config import StageOverrideSettings
+from story_writer.streaming import IncrementalJsonValidator, StreamValidationError
 
 T = TypeVar("T", bound=BaseModel)
 SS = TypeVar("SS", bound=StoryStructure)
 
 log = logging.getLogger(__name__)
 
+# Stage settings used by StoryWriter itself, ie when building the prompt. Not passed to the OpenAI package.
+STORY_WRITER_STAGE_SETTINGS = ("cache", "prompt_token_budget")
+
+# Errors worth retrying. APITimeoutError is a subclass of APIConnectionError.
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
 
 def remove_directional_single_quotes(inp: str) -> str:
     """Removes left and right single quotes."""
@@ -40,49 +60,119 @@ def process_out_non_utf8(inp: str) -> str:
     return inp.encode("utf-8", "ignore").decode()
 
 
+def get_llm_settings(model_settings: StageOverrideSettings | None = None) -> dict:
+    """Returns the chat completion kwargs: the default LLM settings, updated with the stage-specific settings."""
+    llm_settings: dict = settings.llm.model_dump(mode="python")
+    if model_settings:
+        llm_settings.update(model_settings.model_dump(mode="python", exclude_unset=True))
+
+    # StoryWriter-only settings, these aren't passed to the OpenAI package.
+    for key in STORY_WRITER_STAGE_SETTINGS:
+        llm_settings.pop(key, None)
+    return llm_settings
+
+
 def get_validated_llm_output(
     client: Client,
     messages: list[dict[str, str]],
     log_file_name: str,
     validation_model: type[T] | None = None,
     model_settings: StageOverrideSettings | None = None,
+    refresh_cache: bool = False,
+    accept: Callable[[Any], bool] | None = None,
+    stage: str | None = None,
 ) -> (type[T | SS] | list[type[T]], float):
+    """
+    Calls the LLM until the output validates against the validation_model (or is a string, if no model is given).
 
-    # Get the default settings.
-    llm_settings: dict = settings.llm.model_dump(mode="python")
-    # Update default settings with stage-specific settings.
-    if model_settings:
-        llm_settings.update(model_settings.model_dump(mode="python", exclude_unset=True))
+    When the LLM settings request more than one completion (n > 1), every choice is validated and the first valid
+    choice that passes the accept check is returned. That way one round-trip can stand in for several retries.
+
+    :param refresh_cache: Skip reading from the response cache, ie when the caller rejected the previous output.
+    :param accept: Optional check used to pick between valid choices, ie "has enough scenes". If no valid choice
+                   passes the check, the first valid choice is returned and the caller decides what to do with it.
+    :param stage: Name of the outline stage (ie "general", "scenes", "draft") the call metrics are recorded under.
+                  Defaults to the log_file_name.
+    """
+    stage = stage or log_file_name
+
+    llm_settings = get_llm_settings(model_settings)
+    use_cache = model_settings.cache if model_settings and model_settings.cache is not None else None
+    if use_cache is None:
+        use_cache = settings.llm_cache.enabled
 
     start = time.time()
     attempt = 0
     max_retries = settings.llm_invalid_output_retry_count
 
+    response_format = create_json_schema(validation_model) if validation_model else None
+    # Set after an output fails validation. The next call asks the LLM to fix that output instead of starting over.
+    repair_messages = None
+    repairs = 0
     while attempt < max_retries:
-        content = call_llm(
+        if repair_messages:
+            log.info(
+                f"Asking the LLM to repair its output. Repair {repairs} of {settings.llm_validation_repair_attempts}"
+            )
+            metrics.record_retry(stage, "repair")
+        choices = call_llm_choices(
             client=client,
-            messages=messages,
-            response_format=create_json_schema(validation_model) if validation_model else None,
-            llm_settings=llm_settings,
+            messages=repair_messages or messages,
+            response_format=response_format,
+            # Only one corrected output is needed.
+            llm_settings={**llm_settings, "n": 1} if repair_messages else llm_settings,
+            use_cache=use_cache,
+            # Retrying means the last output was rejected, so don't serve it from the cache again.
+            refresh_cache=refresh_cache or attempt > 0,
+            stage=stage,
+            # The output strings are validated straight into the model(s), skipping the json.loads dict step.
+            raw=True,
         )
 
-        try:
-            if isinstance(content, dict):
-                log.debug("Validating Dict-style output.")
-                valid_model = validation_model(**content)
-            elif isinstance(content, list):
-                log.debug("Validating List-style output.")
-                valid_model = [validation_model(**item) for item in content]
-            else:
-                log.error(f"LLM Output: '{content}' is not supported.")
-                attempt += 1
+        valid_models = []
+        decode_failed = False
+        # The invalid (but parsable) output with the fewest errors, and its errors.
+        repairable: tuple[str, pydantic.ValidationError] | None = None
+        for count, output in enumerate(choices):
+            try:
+                output, valid_model = validate_or_repair_llm_output(output, validation_model, stage)
+            except pydantic.ValidationError as err:
+                if is_json_decode_error(err):
+                    log.error(f"JSONDecodeError (choice {count}): {err}")
+                    decode_failed = True
+                else:
+                    log.error(f"ValidationError (choice {count}): {err}")
+                    if repairable is None or err.error_count() < repairable[1].error_count():
+                        repairable = (output, err)
                 continue
-            attempt = 0
-            break
 
-        except pydantic.ValidationError as err:
-            log.error(f"ValidationError: {err}")
+            if valid_model == []:
+                log.error(f"No content returned from LLM (choice {count}). Empty list.")
+                continue
+            valid_models.append(valid_model)
+
+        if not valid_models:
+            if choices:  # An empty list means call_llm_choices failed, and already recorded its retries.
+                metrics.record_retry(stage, "json_decode" if decode_failed else "validation")
             attempt += 1
+            if repairable and repairs < settings.llm_validation_repair_attempts:
+                repairs += 1
+                output, err = repairable
+                repair_messages = [
+                    *messages,
+                    {"role": "assistant", "content": output},
+                    {"role": "user", "content": repair_output_prompt(format_validation_errors(err))},
+                ]
+            else:
+                # Out of repairs (or nothing to repair), regenerate the output from scratch.
+                repair_messages = None
+            continue
+
+        valid_model = valid_models[0]
+        if accept and len(valid_models) > 1:
+            valid_model = next((model for model in valid_models if accept(model)), valid_model)
+        log.debug(f"{len(valid_models)} of {len(choices)} LLM choices were valid.")
+        break
 
     else:
         log.error(f"Failed to get valid story data in {max_retries} attempts.")
@@ -95,15 +185,101 @@ def get_validated_llm_output(
     return valid_model, elapsed
 
 
-def call_llm(client: Client, messages: list[dict[str, str]], response_format: dict | None, llm_settings: dict):
+def validate_or_repair_llm_output(
+    output: str, validation_model: type[T] | None, stage: str = "unknown"
+) -> tuple[str, T | list[T] | str]:
+    """
+    Validates the output. If it isn't valid json, the output is repaired locally (see json_repair.repair_json) and the
+    repaired output is validated instead, so fixable json doesn't cost another LLM call.
+
+    :return: The output that was validated (the repaired output, if it was repaired), and the validated model.
+    :raises pydantic.ValidationError: Neither the output, nor the repaired output, are valid.
+    """
+    try:
+        return output, validate_llm_output(output, validation_model)
+    except pydantic.ValidationError as err:
+        if not (settings.llm_local_json_repair and is_json_decode_error(err)):
+            raise
+        repaired = repair_json(output)
+        if repaired is None or repaired == output:
+            raise
+        log.warning(f"Output is not valid json, validating a locally repaired copy instead: {err.errors()[0]['msg']}")
+    metrics.record_retry(stage, "local_json_repair")
+    return repaired, validate_llm_output(repaired, validation_model)
+
+
+def validate_llm_output(output: str, validation_model: type[T] | None) -> T | list[T] | str:
+    """
+    Parses and validates the LLM output string into the validation_model (or a list of the model) in one step.
+    Without a validation_model, the output string is returned as-is.
+
+    :raises pydantic.ValidationError: The output isn't valid json, or doesn't match the model.
+    """
+    if validation_model is None:
+        log.debug("No validation model provided, returning raw string output.")
+        return output
+    log.debug(f"Validating output as {validation_model.__name__}.")
+    return get_type_adapter(validation_model).validate_json(output)
+
+
+def format_validation_errors(err: pydantic.ValidationError, max_errors: int = 20) -> str:
+    """Compact, one line per error, summary of a validation error. ie "2.title: Value error, String is empty" """
+    errors = err.errors(include_url=False)
+    lines = [f"- {'.'.join(str(loc) for loc in error['loc']) or '(root)'}: {error['msg']}" for error in errors]
+    if len(lines) > max_errors:
+        lines = lines[:max_errors] + [f"- ... and {len(lines) - max_errors} more errors."]
+    return "\n".join(lines)
+
+
+def is_json_decode_error(err: pydantic.ValidationError) -> bool:
+    """True if the validation failed because the output wasn't valid json, rather than not matching the model."""
+    return any(error["type"] == "json_invalid" for error in err.errors())
+
+
+def call_llm(
+    client: Client,
+    messages: list[dict[str, str]],
+    response_format: dict | None,
+    llm_settings: dict,
+    use_cache: bool = False,
+    refresh_cache: bool = False,
+    stage: str = "unknown",
+):
     """
     Calls the LLM. If stream=True (set using user-accessible via config.yaml), the output is streamed to the terminal.
+    Returns the first usable choice, or None if the LLM failed to return anything usable.
+
+    See call_llm_choices for the parameters.
+    """
+    choices = call_llm_choices(client, messages, response_format, llm_settings, use_cache, refresh_cache, stage)
+    return choices[0] if choices else None
+
+
+def call_llm_choices(
+    client: Client,
+    messages: list[dict[str, str]],
+    response_format: dict | None,
+    llm_settings: dict,
+    use_cache: bool = False,
+    refresh_cache: bool = False,
+    stage: str = "unknown",
+    raw: bool = False,
+) -> list:
+    """
+    Calls the LLM and returns every usable (non-empty, and deserializable if using a response_format) choice.
+    More than one choice is only returned when the llm_settings request more than one completion (n > 1).
 
     :param client: OpenAI Client object. Used to make calls to the LLM.
     :param messages: Array of {"role": "system|user", "content": "to LLM str"}
     :param llm_settings:
     :param response_format: Optional[dict] json schema for the LLM to output using. Requires platform/model to support
                             "Structured Output"
+    :param use_cache: Serve the output from the response cache when possible, and save new output to the cache.
+    :param refresh_cache: Skip reading from the response cache, but still save the new output to it.
+    :param stage: Name of the outline stage the call metrics are recorded under.
+    :param raw: Return the cleaned-up output strings without deserializing them. The caller is expected to parse
+                and validate them, ie with validate_llm_output.
+    :return: List of the usable choices. Empty if the LLM failed to return anything usable.
     """
     max_retries = settings.llm_empty_output_retry_count
     retries = 0
@@ -116,64 +292,365 @@ def call_llm(client: Client, messages: list[dict[str, str]], response_format: di
 
     print(f"{response_format=}")
 
+    cassette = get_cassette()
+    request_key = make_cache_key(messages, llm_settings, response_format) if use_cache or cassette else None
+    cache_key = request_key if use_cache else None
+
     log.debug(f"Calling LLM with settings: {llm_settings}")
     while retries < max_retries:
-        response = client.chat.completions.create(
-            messages=messages,
-            response_format=response_format,
-            stream_options={"include_usage": True},  # Doesn't work for LM Studio?
-            **llm_settings,
-        )
+        replayed_outputs = cassette.replay(request_key) if cassette and cassette.mode == "replay" else None
+        cached_outputs = None
+        if replayed_outputs is not None:
+            log.debug(f"Replaying LLM output from the cassette. Key: {request_key}")
+            metrics.record_call(CallMetrics(stage=stage, latency=0.0, choices=len(replayed_outputs), replayed=True))
+            outputs = replayed_outputs
+        elif cassette and cassette.mode == "replay" and not settings.cassette.allow_misses:
+            raise CassetteMissError(f"The '{stage}' request {request_key} isn't in the cassette '{cassette.path}'.")
+        else:
+            # Only the first attempt is served from the cache, a retry means the cached output wasn't usable.
+            read_cache = cache_key and not refresh_cache and retries == 0
+            cached_outputs = get_response_cache().get(cache_key) if read_cache else None
+            request_start = time.perf_counter()
+            if cached_outputs:
+                log.debug(f"Serving LLM output from the response cache. Key: {cache_key}")
+                metrics.record_call(CallMetrics(stage=stage, latency=0.0, choices=len(cached_outputs), cached=True))
+                outputs = cached_outputs
+            else:
+                outputs = request_llm_outputs(client, messages, response_format, llm_settings, stage)
+            if cassette and cassette.mode == "record":
+                cassette.record(
+                    request_key,
+                    stage,
+                    messages,
+                    llm_settings,
+                    response_format,
+                    outputs,
+                    duration=time.perf_counter() - request_start,
+                )
+
+        decode_failed = False
+        usable_outputs = []
+        choices = []
+        for count, output in enumerate(outputs):
+            if response_format and not raw:  # Expectation is that the output will always be an object.
+                log.debug("LLM called with a response schema, output will be ran through a json serializer.")
+                try:
+                    content = json.loads(output)
+                    log.debug("Serialized LLM output successfully")
+                except JSONDecodeError as err:
+                    repaired = repair_json(output) if settings.llm_local_json_repair else None
+                    try:
+                        content = json.loads(repaired) if repaired else None
+                    except JSONDecodeError:
+                        content = None
+                    if content is None:
+                        log.error(f'JSONDecodeError (choice {count}): "{err}". Attempts: {retries}')
+                        decode_failed = True
+                        continue
+                    log.warning(f'Repaired invalid json output (choice {count}): "{err}"')
+                    metrics.record_retry(stage, "local_json_repair")
+
+            else:  # Output is a string because there was no structured output/response format (or raw was requested).
+                log.debug("Returning the raw output string.")
+                # Todo: Check to see if the openai package will return an integer if the LLM output is "1" or similar.
+                content = output  # Without a response_format, output is expected to just be a string.
+
+            if content == {} or content == [] or content == "":
+                log.error(f'No content returned from LLM (choice {count}). "{content}". Attempts: {retries}')
+                continue
+
+            usable_outputs.append(output)
+            choices.append(content)
+
+        if choices:
+            if cache_key and not cached_outputs and replayed_outputs is None:
+                get_response_cache().set(cache_key, usable_outputs)
+            return choices
+
+        log.error(f"No usable output returned from the LLM. Attempts: {retries}, Retrying...")
+        metrics.record_retry(stage, "json_decode" if decode_failed else "empty_output")
+        retries += 1
+
+    else:
+        log.error(f"Failed to get any data from the LLM in {retries} attempts.")
+        return []
 
+
+def request_llm_outputs(
+    client: Client,
+    messages: list[dict[str, str]],
+    response_format: dict | None,
+    llm_settings: dict,
+    stage: str = "unknown",
+) -> list[str]:
+    """
+    Makes a single chat completion call and returns the cleaned-up string output of every choice, in choice order.
+    Streamed output (of the first choice) is printed to the terminal as it's received.
+    Token usage and timings are recorded in the metrics under the stage name.
+    """
+    # Tokens reserved against the tokens-per-minute limit. Corrected once the real usage is known.
+    max_tokens = llm_settings.get("max_tokens") or 0
+    estimated_tokens = estimate_tokens(messages) + max(max_tokens, 0) * (llm_settings.get("n") or 1)
+    # How much of the prompt the LLM platform could serve from its prompt (KV) cache, based on the stage's last call.
+    shared_prefix_ratio = prefix_tracker.shared_prefix_ratio(stage, messages)
+
+    start = time.perf_counter()
+    time_to_first_token = None
+    usage = None
+    request = dict(
+        messages=messages,
+        response_format=response_format,
+        stream_options={"include_usage": True},  # Doesn't work for LM Studio?
+        **llm_settings,
+    )
+    hedge_delay = None if llm_settings.get("stream") else get_hedge_delay(stage)
+    if hedge_delay is not None:
+        response, backend = hedged_chat_completion(client, hedge_delay, estimated_tokens, stage, **request), None
+    else:
+        response, backend = create_chat_completion(client, estimated_tokens=estimated_tokens, stage=stage, **request)
+
+    backend_failed = False
+    try:
         if isinstance(response, Stream):
-            output = ""
-            for chunk in response:
-                if chunk.choices:  # Last response chunk may not have choices, resulting in an IndexError.
-                    print(chunk.choices[0].delta.content or "", end="")
-                    output += chunk.choices[0].delta.content or ""
-            print("")  # Prevents the next print statement from being on the same line as the last chunk.
-            log.debug(f"Output Length: {len(output)}")
-            log.debug("Usage: Unavailable when streaming output.")
-        else:
-            output = response.choices[0].message.content
-            log.debug(f"Output Length: {len(output)}")
-            log.debug(
-                f"Usage: Prompt Tokens: {response.usage.prompt_tokens} - "
-                f"Completion Tokens: {response.usage.completion_tokens} - "
-                f"Total Tokens: {response.usage.total_tokens}"
+            outputs, usage, time_to_first_token = read_chat_completion_stream(
+                response, response_format, llm_settings.get("n") or 1, stage, start
             )
+        else:
+            outputs = [choice.message.content or "" for choice in sorted(response.choices, key=lambda c: c.index)]
+            usage = response.usage
+    except (*BACKEND_FAILURES, httpx.TransportError):
+        backend_failed = True
+        raise
+    finally:
+        if backend:
+            # The backend counts as busy until the whole response is read.
+            client.balancer.release(backend, failed=backend_failed)
+
+    latency = time.perf_counter() - start
+    if hedge_delay is None:
+        latency_tracker.record(stage, latency)  # Hedged calls record the latency of each request separately.
+    call_metrics = CallMetrics(
+        stage=stage,
+        latency=latency,
+        time_to_first_token=time_to_first_token,
+        prompt_tokens=usage.prompt_tokens if usage else None,
+        completion_tokens=usage.completion_tokens if usage else None,
+        cached_prompt_tokens=getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None),
+        shared_prefix_ratio=shared_prefix_ratio,
+        choices=len(outputs),
+    )
+    metrics.record_call(call_metrics)
+    if usage:
+        get_rate_limiter().adjust_tokens(estimated_tokens, usage.total_tokens)
+
+    log.debug(f"Output Length: {[len(output) for output in outputs]}")
+    if shared_prefix_ratio is not None:
+        log.debug(f"Shared prompt prefix with the previous '{stage}' call: {shared_prefix_ratio:.1%}")
+    if usage:
+        log.debug(
+            f"Usage: Prompt Tokens: {usage.prompt_tokens} - "
+            f"Completion Tokens: {usage.completion_tokens} - "
+            f"Total Tokens: {usage.total_tokens} - "
+            f"Latency: {call_metrics.latency:.2f}s"
+        )
+    else:
+        log.debug("Usage: Unavailable, the LLM platform didn't report token usage.")
 
-        log.debug("Processing LLM string output. Removing non-utf-8 characters and other LLM oddities.")
-        output = remove_directional_single_quotes(output)
-        output = remove_end_of_line_indicators(output)
-        output = replace_em_dash_with_regular_dash(output)
-        output = process_out_non_utf8(output)
-        output = output.strip()  # Reduces output that's all spaces and tabs into an empty string for validation.
+    log.debug("Processing LLM string output. Removing non-utf-8 characters and other LLM oddities.")
+    return [clean_llm_output(output) for output in outputs]
 
-        if response_format:  # Expectation is that the output will always be an object. Per structured output specs.
-            log.debug("LLM called with a response schema, output will be ran through a json serializer.")
-            try:
-                content = json.loads(output)
-                log.debug("Serialized LLM output successfully")
-            except JSONDecodeError as err:
-                log.error(f'JSONDecodeError: "{err}". Attempts: {retries}, Retrying...')
-                retries += 1
+
+def read_chat_completion_stream(
+    response: Stream, response_format: dict | None, choice_count: int, stage: str, start: float
+) -> tuple[list[str], Any, float | None]:
+    """
+    Reads a streamed chat completion. The first choice is printed to the terminal as it's received.
+    When validating against a response_format, a choice is cut off as soon as it can no longer match the schema, and
+    the stream is closed once every choice is cut off.
+
+    :param start: time.perf_counter() when the request was sent, used for the time to first token.
+    :return: The output of every choice (empty for aborted choices), the token usage (if reported), and the time to
+             first token.
+    """
+    time_to_first_token = None
+    usage = None
+    streamed: dict[int, str] = {}
+    # Checks each choice as it streams in, so output that can't match the response_format is cut off early.
+    validators: dict[int, IncrementalJsonValidator] = {}
+    aborted: set[int] = set()
+    for chunk in response:
+        # The last chunk holds the token usage (if the platform supports stream_options), and has no choices.
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        # Last response chunk may not have choices, resulting in an IndexError.
+        for choice in chunk.choices:
+            if choice.index in aborted:
                 continue
+            text = choice.delta.content or ""
+            if text and time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start
+            if choice.index == 0:
+                print(text, end="")
+            streamed[choice.index] = streamed.get(choice.index, "") + text
+
+            if response_format and settings.stream_abort_on_invalid_output:
+                if choice.index not in validators:
+                    validators[choice.index] = IncrementalJsonValidator(
+                        response_format["json_schema"]["schema"],
+                        # Don't abort on output that can be repaired locally once the stream is done.
+                        allow_repairable=settings.llm_local_json_repair,
+                    )
+                try:
+                    validators[choice.index].feed(text)
+                except StreamValidationError as err:
+                    log.warning(f"Stopped streaming choice {choice.index}, output can't match the schema: {err}")
+                    metrics.record_retry(stage, "stream_abort")
+                    aborted.add(choice.index)
+
+        if len(aborted) >= choice_count:
+            log.debug("Every choice is invalid, closing the stream.")
+            response.close()
+            break
+    print("")  # Prevents the next print statement from being on the same line as the last chunk.
+    # Partial output from aborted choices is discarded, it's known to be unusable.
+    outputs = ["" if index in aborted else streamed[index] for index in sorted(streamed)]
+    return outputs, usage, time_to_first_token
 
-        else:  # Output is a string because there was no structured output/response format.
-            log.debug("LLM called without a response schema, output is raw.")
-            # Todo: Check to see if the openai package will return an integer if the LLM output is "1" or similar.
-            content = output  # Without a response_format, output is expected to just be a string.
 
-        if content == {} or content == [] or content == "":
-            log.error(f'No content returned from LLM. "{content}". Attempts: {retries}, Retrying...')
-            retries += 1
+def hedged_chat_completion(
+    client: Client | LoadBalancedClient, delay: float, estimated_tokens: int, stage: str, **kwargs
+) -> ChatCompletion:
+    """
+    Non-streaming create_chat_completion() that sends a duplicate request if there's no response after delay seconds,
+    and returns the first usable response (see settings.hedging). The duplicates go through the rate limiter and the
+    load balancer like any other call. The token usage of the discarded responses is recorded as the hedge cost.
+    """
+    hedging = settings.hedging
+    # Shared between the requests, so each one picks a backend none of the others are on.
+    used_backends = set() if hedging.other_backend else None
+
+    def send() -> ChatCompletion:
+        request_start = time.perf_counter()
+        response, backend = create_chat_completion(
+            client, estimated_tokens=estimated_tokens, stage=stage, avoid_backends=used_backends, **kwargs
+        )
+        if backend:
+            client.balancer.release(backend)  # A non-streamed response has been read in full already.
+        latency_tracker.record(stage, time.perf_counter() - request_start)
+        return response
+
+    def discard(response: ChatCompletion) -> None:
+        usage = response.usage
+        if usage:
+            metrics.record_hedge_cost(stage, usage.prompt_tokens, usage.completion_tokens)
+            get_rate_limiter().adjust_tokens(estimated_tokens, usage.total_tokens)
+
+    response, hedge_won = run_hedged(
+        send,
+        is_valid=lambda r: is_usable_completion(r, kwargs.get("response_format")),
+        delay=delay,
+        max_hedges=hedging.max_hedges,
+        on_hedge=lambda: metrics.record_hedge(stage),
+        on_discard=discard,
+    )
+    if hedge_won:
+        metrics.record_hedge(stage, won=True)
+    return response
+
+
+def is_usable_completion(response: ChatCompletion, response_format: dict | None) -> bool:
+    """Quick check that a choice of the response isn't empty, and (with a response_format) could match the schema."""
+    for choice in response.choices:
+        output = clean_llm_output(choice.message.content or "")
+        if not output:
+            continue
+        if not response_format:
+            return True
+        validator = IncrementalJsonValidator(
+            response_format["json_schema"]["schema"], allow_repairable=settings.llm_local_json_repair
+        )
+        try:
+            validator.feed(output)
+        except StreamValidationError:
+            continue
+        if validator.complete or settings.llm_local_json_repair:
+            return True
+    return False
+
+
+def create_chat_completion(
+    client: Client | LoadBalancedClient,
+    estimated_tokens: int,
+    stage: str,
+    avoid_backends: set[Backend] | None = None,
+    **kwargs,
+) -> tuple[ChatCompletion | Stream, Backend | None]:
+    """
+    Calls client.chat.completions.create(**kwargs) through the shared rate limiter.
+    Transient errors are retried with exponential backoff and jitter, or after the server's Retry-After.
+    A rate limit (429) response holds back every other call in the process too, not just this one.
 
-        else:
-            return content
+    With a LoadBalancedClient, every attempt goes to the backend picked by the load balancer, so a failed call is
+    retried on another backend (straight away, if there's another healthy backend).
 
-    else:
-        log.error(f"Failed to get any data from the LLM in {retries} attempts.")
+    :param avoid_backends: Backends not to send the call to, if the load balancer has another healthy backend. The
+                           picked backend is added to it, so the calls sharing the set go to different backends.
+    :return: The response, and the backend it came from (None without a load balancer). The caller must release the
+             backend, with client.balancer.release(), once the response has been read.
+    """
+    rate_limiter = get_rate_limiter()
+    rate_limit_settings = settings.rate_limit
+    balancer = client.balancer if isinstance(client, LoadBalancedClient) else None
+    attempt = 0
+    while True:
+        rate_limiter.acquire(estimated_tokens)
+        backend = None
+        if balancer:
+            backend = balancer.acquire(avoid=avoid_backends or ())
+            if avoid_backends is not None:
+                avoid_backends.add(backend)
+        try:
+            return (backend.client if backend else client).chat.completions.create(**kwargs), backend
+        except TRANSIENT_ERRORS as err:
+            if backend:
+                balancer.release(backend, failed=isinstance(err, BACKEND_FAILURES))
+            if attempt >= rate_limit_settings.max_retries:
+                log.error(f"LLM call failed after {attempt} retries: {err}")
+                raise
+
+            retry_after = parse_retry_after(getattr(getattr(err, "response", None), "headers", None))
+            if retry_after is not None:
+                delay = min(retry_after, rate_limit_settings.backoff_max)
+            elif balancer and isinstance(err, BACKEND_FAILURES) and len(balancer.healthy_backends()) > 1:
+                delay = 0.0  # Another backend can take the call.
+            else:
+                delay = backoff_delay(attempt, rate_limit_settings.backoff_base, rate_limit_settings.backoff_max)
+            backend_url = f" ({backend.url})" if backend else ""
+            log.warning(
+                f"{err.__class__.__name__} from the LLM platform{backend_url}. "
+                f"Retrying in {delay:.1f}s. Attempt: {attempt}"
+            )
+            metrics.record_retry(stage, "transient_error")
+
+            if isinstance(err, openai.RateLimitError):
+                rate_limiter.pause(delay)  # The next acquire() waits, along with every other thread.
+            else:
+                time.sleep(delay)
+            attempt += 1
+        except Exception:
+            if backend:
+                balancer.release(backend)
+            raise
+
+
+def clean_llm_output(output: str) -> str:
+    """Runs the LLM string output through each of the clean-up functions."""
+    output = remove_directional_single_quotes(output)
+    output = remove_end_of_line_indicators(output)
+    output = replace_em_dash_with_regular_dash(output)
+    output = process_out_non_utf8(output)
+    output = output.strip()  # Reduces output that's all spaces and tabs into an empty string for validation.
+    return output
 
 
 # def call_llm(client, messages, model, response_format):
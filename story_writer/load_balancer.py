@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections.abc import Collection
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import openai
+from openai import OpenAI
+
+log = logging.getLogger(__name__)
+
+# Errors that say something about the health of the backend. Rate limits (429) and bad requests (4xx) don't.
+BACKEND_FAILURES = (openai.APIConnectionError, openai.InternalServerError)
+
+
+@dataclass(eq=False)
+class Backend:
+    """An LLM platform instance, and its load/health as seen by the load balancer."""
+
+    url: str
+    client: OpenAI
+    weight: float = 1.0
+    outstanding: int = 0  # Requests sent to the backend that haven't finished yet.
+    failures: int = 0  # Consecutive failures. Reset by a successful request.
+    ejected_until: float = 0.0  # time.monotonic() until which the backend isn't sent any requests.
+    current_weight: float = 0.0  # Smooth weighted round-robin state.
+    requests: int = 0
+
+
+class LoadBalancer:
+    """
+    Spreads LLM calls over several backends.
+
+    Strategies:
+        least_outstanding: Sends the request to the backend with the fewest in-flight requests, relative to its weight.
+        round_robin: Smooth weighted round-robin, a backend with weight 2 gets twice the requests of weight 1.
+    Health checks are passive: a backend that fails max_failures requests in a row is ejected for ejection_time
+    seconds. Once it's back, a single failure ejects it again, a success resets it.
+    """
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        strategy: str = "least_outstanding",
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+    ):
+        if not backends:
+            raise ValueError("The load balancer needs at least one backend.")
+        self.backends = backends
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self._lock = threading.Lock()
+
+    def healthy_backends(self) -> list[Backend]:
+        now = time.monotonic()
+        return [backend for backend in self.backends if backend.ejected_until <= now]
+
+    def acquire(self, avoid: Collection[Backend] = ()) -> Backend:
+        """
+        Picks the backend for the next request. Every acquire() must be followed by a release().
+
+        :param avoid: Backends to skip if there's another healthy backend, ie the backend of the request being hedged.
+        """
+        with self._lock:
+            candidates = self.healthy_backends()
+            if not candidates:
+                # Every backend is ejected. Try the one that's due back first, rather than failing outright.
+                candidates = [min(self.backends, key=lambda b: b.ejected_until)]
+            # Failures only count through ejection, a backend that failed once (or is back) still gets its share.
+            candidates = [backend for backend in candidates if backend not in avoid] or candidates
+
+            if self.strategy == "round_robin":
+                total_weight = sum(backend.weight for backend in candidates)
+                for backend in candidates:
+                    backend.current_weight += backend.weight
+                backend = max(candidates, key=lambda b: b.current_weight)
+                backend.current_weight -= total_weight
+            else:
+                backend = min(candidates, key=lambda b: (b.outstanding + 1) / b.weight)
+
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, failed: bool = False) -> None:
+        """Marks the request as finished. failed=True if the backend errored (see BACKEND_FAILURES)."""
+        with self._lock:
+            backend.outstanding -= 1
+            if not failed:
+                backend.failures = 0
+                return
+            backend.failures += 1
+            if backend.failures >= self.max_failures:
+                backend.ejected_until = time.monotonic() + self.ejection_time
+                log.warning(
+                    f"Ejecting LLM backend {backend.url} for {self.ejection_time}s "
+                    f"after {backend.failures} failures in a row."
+                )
+
+
+class LoadBalancedClient:
+    """
+    Stands in for the OpenAI client, spreading chat completions over the load balancer's backends.
+    Other endpoints (ie, files and batches) go to the first backend.
+
+    llm.create_chat_completion leases the backends itself (acquire/release), so a backend counts as busy until the
+    whole (streamed) response is read. client.chat.completions.create() releases the backend once it returns.
+    """
+
+    def __init__(self, balancer: LoadBalancer):
+        self.balancer = balancer
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+
+    def __getattr__(self, name: str):
+        return getattr(self.balancer.backends[0].client, name)
+
+    def _create_chat_completion(self, **kwargs):
+        backend = self.balancer.acquire()
+        failed = False
+        try:
+            return backend.client.chat.completions.create(**kwargs)
+        except BACKEND_FAILURES:
+            failed = True
+            raise
+        finally:
+            self.balancer.release(backend, failed=failed)
@@ -0,0 +1,198 @@
+import json
+import logging
+import threading
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from statistics import mean, median
+
+log = logging.getLogger(__name__)
+
+# local_json_repair counts invalid json outputs that were repaired locally, instead of being retried.
+RETRY_KINDS = [
+    "json_decode",
+    "empty_output",
+    "validation",
+    "repair",
+    "local_json_repair",
+    "stream_abort",
+    "transient_error",
+]
+
+
+@dataclass
+class CallMetrics:
+    """Performance data for a single chat completion call."""
+
+    stage: str
+    latency: float  # Seconds from sending the request to receiving the last token.
+    time_to_first_token: float | None = None  # Only available when streaming.
+    prompt_tokens: int | None = None  # Only available if the LLM platform reports usage.
+    completion_tokens: int | None = None
+    cached_prompt_tokens: int | None = None  # Prompt tokens served from the platform's prompt cache, if reported.
+    # Share of the prompt identical to the previous prompt of the stage. None for the first call of a stage.
+    shared_prefix_ratio: float | None = None
+    choices: int = 1
+    cached: bool = False  # Served from the response cache, no LLM call was made.
+    replayed: bool = False  # Served from a recorded cassette (settings.cassette), no LLM call was made.
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if not self.completion_tokens or not self.latency:
+            return None
+        return self.completion_tokens / self.latency
+
+
+@dataclass
+class StageMetrics:
+    """Aggregated performance data for an outline stage, ie "scenes" or "draft"."""
+
+    calls: list[CallMetrics] = field(default_factory=list)
+    retries: dict[str, int] = field(default_factory=lambda: {kind: 0 for kind in RETRY_KINDS})
+    hedges_sent: int = 0  # Duplicate requests sent for slow calls, see settings.hedging.
+    hedge_wins: int = 0  # Calls answered by a duplicate, rather than the original request.
+    # Tokens of the responses that lost the race and were thrown away. The added cost of hedging.
+    hedge_prompt_tokens: int = 0
+    hedge_completion_tokens: int = 0
+
+    def summary(self) -> dict:
+        llm_calls = [call for call in self.calls if not call.cached and not call.replayed]
+        latencies = [call.latency for call in llm_calls]
+        ttfts = [call.time_to_first_token for call in llm_calls if call.time_to_first_token is not None]
+        prompt_tokens = sum(call.prompt_tokens or 0 for call in llm_calls)
+        completion_tokens = sum(call.completion_tokens or 0 for call in llm_calls)
+        prefix_ratios = [call.shared_prefix_ratio for call in llm_calls if call.shared_prefix_ratio is not None]
+        return {
+            "llm_calls": len(llm_calls),
+            "cache_hits": sum(call.cached for call in self.calls),
+            "replayed_calls": sum(call.replayed for call in self.calls),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_prompt_tokens": sum(call.cached_prompt_tokens or 0 for call in llm_calls),
+            "total_latency": round(sum(latencies), 3),
+            "mean_latency": round(mean(latencies), 3) if latencies else None,
+            "median_latency": round(median(latencies), 3) if latencies else None,
+            "max_latency": round(max(latencies), 3) if latencies else None,
+            "mean_time_to_first_token": round(mean(ttfts), 3) if ttfts else None,
+            "tokens_per_second": round(completion_tokens / sum(latencies), 2) if sum(latencies) else None,
+            "mean_shared_prefix_ratio": round(mean(prefix_ratios), 3) if prefix_ratios else None,
+            "retries": dict(self.retries),
+            "hedges": {
+                "sent": self.hedges_sent,
+                "won": self.hedge_wins,
+                "wasted_prompt_tokens": self.hedge_prompt_tokens,
+                "wasted_completion_tokens": self.hedge_completion_tokens,
+            },
+        }
+
+
+class MetricsCollector:
+    """
+    Thread-safe collector of LLM call performance data, aggregated per outline stage.
+    The process-wide instance is `story_writer.metrics.metrics`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, StageMetrics] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages = {}
+
+    def _stage(self, stage: str) -> StageMetrics:
+        if stage not in self._stages:
+            self._stages[stage] = StageMetrics()
+        return self._stages[stage]
+
+    def record_call(self, call: CallMetrics) -> None:
+        with self._lock:
+            self._stage(call.stage).calls.append(call)
+
+    def record_retry(self, stage: str, kind: str) -> None:
+        """Counts a retry. kind is one of RETRY_KINDS."""
+        with self._lock:
+            retries = self._stage(stage).retries
+            retries[kind] = retries.get(kind, 0) + 1
+
+    def record_hedge(self, stage: str, won: bool = False) -> None:
+        """Counts a duplicate request sent for a slow call, or (won=True) a call answered by its duplicate."""
+        with self._lock:
+            stage_metrics = self._stage(stage)
+            if won:
+                stage_metrics.hedge_wins += 1
+            else:
+                stage_metrics.hedges_sent += 1
+
+    def record_hedge_cost(self, stage: str, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+        """Adds the token usage of a hedged request whose response was thrown away."""
+        with self._lock:
+            stage_metrics = self._stage(stage)
+            stage_metrics.hedge_prompt_tokens += prompt_tokens or 0
+            stage_metrics.hedge_completion_tokens += completion_tokens or 0
+
+    def summary(self) -> dict:
+        """Returns the per-stage aggregates, and the aggregate of every stage combined."""
+        with self._lock:
+            combined = StageMetrics()
+            for stage_metrics in self._stages.values():
+                combined.calls.extend(stage_metrics.calls)
+                for kind, count in stage_metrics.retries.items():
+                    combined.retries[kind] = combined.retries.get(kind, 0) + count
+                combined.hedges_sent += stage_metrics.hedges_sent
+                combined.hedge_wins += stage_metrics.hedge_wins
+                combined.hedge_prompt_tokens += stage_metrics.hedge_prompt_tokens
+                combined.hedge_completion_tokens += stage_metrics.hedge_completion_tokens
+            return {
+                "stages": {stage: stage_metrics.summary() for stage, stage_metrics in self._stages.items()},
+                "total": combined.summary(),
+            }
+
+    def save(self, story_dir: Path, filename: str = "metrics.json") -> None:
+        """Writes the aggregates, and every individual call, to /stories/<story>/metrics.json"""
+        summary = self.summary()
+        with self._lock:
+            summary["calls"] = [
+                dict(asdict(call), tokens_per_second=call.tokens_per_second)
+                for stage_metrics in self._stages.values()
+                for call in stage_metrics.calls
+            ]
+
+        story_dir.mkdir(parents=True, exist_ok=True)
+        file_path = story_dir / filename
+        log.debug(f"Saving LLM metrics to {file_path}")
+        with open(file_path, mode="w+", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+
+    def load(self, story_dir: Path, filename: str = "metrics.json") -> None:
+        """
+        Adds the metrics saved by an earlier run of the story (see save), ie when resuming it, so the saved file keeps
+        covering every run. A missing or unreadable file is skipped.
+        """
+        file_path = story_dir / filename
+        if not file_path.exists():
+            return
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError) as err:
+            log.warning(f"Skipping the unreadable LLM metrics '{file_path}': {err}")
+            return
+
+        call_fields = {f.name for f in fields(CallMetrics)}
+        with self._lock:
+            for call in saved.get("calls", []):
+                self._stage(call["stage"]).calls.append(
+                    CallMetrics(**{key: value for key, value in call.items() if key in call_fields})
+                )
+            for stage, summary in saved.get("stages", {}).items():
+                stage_metrics = self._stage(stage)
+                for kind, count in summary.get("retries", {}).items():
+                    stage_metrics.retries[kind] = stage_metrics.retries.get(kind, 0) + count
+                hedges = summary.get("hedges", {})
+                stage_metrics.hedges_sent += hedges.get("sent", 0)
+                stage_metrics.hedge_wins += hedges.get("won", 0)
+                stage_metrics.hedge_prompt_tokens += hedges.get("wasted_prompt_tokens", 0)
+                stage_metrics.hedge_completion_tokens += hedges.get("wasted_completion_tokens", 0)
+
+
+metrics = MetricsCollector()
@@ -1,12 +1,12 @@
-import json
 import logging
 from pathlib import Path
 from typing import TypeVar
 
-import yaml
 from pydantic import BaseModel
 
 from story_writer import settings
+from story_writer.resume import atomic_open
+from story_writer.serializers import find_saved_file, get_serializer
 
 log = logging.getLogger(__name__)
 
@@ -39,19 +39,15 @@ class CustomBaseModel(BaseModel):
     def save_to_file(self, output_dir: Path, filename: str = None):
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        serializer = get_serializer(settings.save_story_file_type)
         file_path = output_dir / (
-            f"{filename}.{settings.save_story_file_type}"
-            or f"{self.__class__.__name__}.{settings.save_story_file_type}"
+            f"{filename}.{serializer.extension}" or f"{self.__class__.__name__}.{serializer.extension}"
         )
         log.debug(f"Saving/Updating outline data to {file_path}")
         try:
-            if settings.save_story_file_type == "json":
-                with open(file_path, mode="w+", encoding="utf-8") as f:
-                    json.dump(self.model_dump(mode="json"), f, indent=4)
-
-            elif settings.save_story_file_type == "yaml":
-                with open(file_path, mode="w+", encoding="utf-8") as f:
-                    yaml.dump(self.model_dump(mode="json"), f, default_flow_style=False, sort_keys=False)
+            # Written atomically, so a crash while saving doesn't leave a broken file to resume from.
+            with atomic_open(file_path, binary=True) as f:
+                f.write(serializer.dumps(self.model_dump(mode="json")))
 
         except Exception as err:
             log.error(f"Unable to save file '{file_path}' due to error: {err}")
@@ -65,17 +61,11 @@ class CustomBaseModel(BaseModel):
         :param filename: filename of the saved file.
         :return:
         """
-        file_path = story_dir / f"{filename}.{settings.save_story_file_type}"
+        file_path, serializer = find_saved_file(story_dir, filename, settings.save_story_file_type)
         log.debug(f"Loading outline data from '{file_path}'")
 
         try:
-            if settings.save_story_file_type == "json":
-                with open(file_path, encoding="utf-8") as f:
-                    data = json.load(f)
-
-            elif settings.save_story_file_type == "yaml":
-                with open(file_path, encoding="utf-8") as f:
-                    data = yaml.safe_load(f)
+            data = serializer.loads(file_path.read_bytes())
 
         except Exception as err:
             log.error(f"Failed to load story data due to error: {err}")
@@ -1,8 +1,12 @@
+import json
 import logging
+import threading
+from collections.abc import Callable, Sequence
 from pathlib import Path
-from typing import TypeVar
+from typing import Any, TypeVar
 
 from story_writer import settings
+from story_writer.journal import StoryJournal, apply_patches
 from story_writer.models.base import CustomBaseModel
 from story_writer.models.outline_models import ChapterData, CharacterData, GeneralData, WorldbuildingData
 from story_writer.models.outline_models.story_structure_models import (
@@ -18,11 +22,16 @@ from story_writer.models.outline_models.story_structure_models import (
     TheHerosJourneyStoryStructure,
     ThreeActStructure,
 )
+from story_writer.resume import atomic_open
+from story_writer.serializers import find_saved_file
 
 log = logging.getLogger(__name__)
 
 CBM = TypeVar("CBM", bound="CustomBaseModel")
 
+# Order of the characters and chapters saved in the split layout, see StoryData.save_to_file.
+OUTLINE_INDEX_FILE_NAME = "outline_index.json"
+
 
 class StoryData(CustomBaseModel):
     general: GeneralData | None = None
@@ -47,12 +56,21 @@ class StoryData(CustomBaseModel):
     def __str__(self):
         return f"{self.general.title}"
 
+    @property
+    def chapter_numbers(self) -> list[int]:
+        return [chapter.number for chapter in self.chapters or []]
+
+    def get_chapter(self, number: int) -> ChapterData:
+        return next(chapter for chapter in self.chapters if chapter.number == number)
+
     def save_to_file(self, output_dir: Path, filename: str = None):
         """output_dir is the path to the story directory /stories/<story>/"""
         log.info(f"Saving {filename}.")
         if settings.consolidate_saved_output:
             log.debug("Saving story outline data as one consolidated file.")
             super().save_to_file(output_dir=output_dir, filename="story_data")
+            # Any split layout files left from earlier saves are out of date.
+            (output_dir / OUTLINE_INDEX_FILE_NAME).unlink(missing_ok=True)
         else:
             super().save_to_file(output_dir=output_dir, filename="story_data")
             log.debug("Saving story outline data as a series of files in relevant folders.")
@@ -74,37 +92,169 @@ class StoryData(CustomBaseModel):
                 elif isinstance(value, dict):
                     self.__getattribute__(key).save_to_file(output_dir=output_dir, filename=key)
 
+            # Lists the saved characters and chapters in order, files of removed ones aren't deleted.
+            index = {
+                "characters": [character.name for character in self.characters or []],
+                "chapters": self.chapter_numbers,
+            }
+            with atomic_open(output_dir / OUTLINE_INDEX_FILE_NAME) as f:
+                json.dump(index, f)
+
     # TODO: The load feature needs to do one of two things:
     #  1) Try to load the data both ways (consolidated/Not consolidated) because the style of saving can change between stories.
     #  2) Save a settings.json or similar for each story, then reference that to determine style of saving, file_type, ect.
     @classmethod
     def load_from_file(cls: type[CBM], saved_dir: Path, one_file: bool = True):
         # if one_file:
-        return super().load_from_file(story_dir=saved_dir, filename="story_data")
-
-        # else:
-        #     story_data = {}
-        #     for key in ["general", "structure", "worldbuilding"]:
-        #         file = saved_dir / f"{key}.{file_type}"
-        #         if file.exists():
-        #             print(f"{key} {file=}")
-        #             story_data[key] = globals()[key.capitalize() + "Data"].load_from_file(
-        #                 file_type=file_type, file_path=file
-        #             )
-        #
-        #     char_dir = saved_dir / "characters"
-        #     if char_dir.exists():
-        #         characters = []
-        #         for char_file in char_dir.glob("*.json"):
-        #             characters.append(CharacterData.load_from_file(file_type=file_type, file_path=char_file))
-        #         story_data["characters"] = characters
-        #
-        #     chapter_dir = saved_dir / "chapters"
-        #     if chapter_dir.exists():
-        #         chapters = []
-        #         for chapter_subdir in sorted(chapter_dir.iterdir()):
-        #             if chapter_subdir.is_dir():
-        #                 chapters.append(ChapterData.load_from_file(file_type=file_type, file_path=chapter_subdir))
-        #         story_data["chapters"] = chapters
-        #
-        #     return cls(**story_data)
+        story_data = super().load_from_file(story_dir=saved_dir, filename="story_data")
+        # Changes saved after the last full save of the outline (see settings.pipeline.journal).
+        patches = StoryJournal(saved_dir).read()
+        if patches:
+            log.debug(f"Replaying {len(patches)} outline journal entries.")
+            story_data = cls(**apply_patches(story_data.model_dump(mode="json"), patches))
+        return story_data
+
+    @classmethod
+    def load_lazily(cls, saved_dir: Path) -> "StoryData | LazyStoryData":
+        """
+        Returns a LazyStoryData for stories saved in the split layout, which loads the sections as they're used.
+        Otherwise loads the whole outline.
+        """
+        if (saved_dir / OUTLINE_INDEX_FILE_NAME).exists():
+            return LazyStoryData(saved_dir)
+        return cls.load_from_file(saved_dir=saved_dir)
+
+
+class LazyStoryData:
+    """
+    Read-only outline of a story saved in the split layout (settings.consolidate_saved_output = False).
+    general, structure, and worldbuilding are loaded from their own file the first time they're used, and each chapter
+    from its /chapters/Chapter-N/ directory, so drafting one chapter doesn't deserialize the whole book. Changes in the
+    outline journal (see journal.StoryJournal) are applied to the sections as they're loaded.
+    """
+
+    def __init__(self, story_dir: Path):
+        self.story_dir = story_dir
+        with open(story_dir / OUTLINE_INDEX_FILE_NAME, encoding="utf-8") as f:
+            self.index = json.load(f)
+        self._lock = threading.Lock()
+        self._sections: dict[str, Any] = {}
+
+        # Journal patches by section, with the paths relative to the section.
+        self._patches: dict[str, list[dict]] = {}
+        for patch in StoryJournal(story_dir).read():
+            key, *path = patch["path"]
+            if not path:
+                self._patches[key] = []  # Replaces the whole section, earlier patches don't matter.
+            self._patches.setdefault(key, []).append({"path": path, "value": patch["value"]})
+
+        self.chapters: Sequence[ChapterData] = self._replaced_list("chapters", ChapterData) or LazyChapters(
+            self, self.index["chapters"]
+        )
+
+    def __str__(self):
+        return f"{self.general.title}"
+
+    @property
+    def general(self) -> GeneralData | None:
+        return self._load_section("general", GeneralData.model_validate)
+
+    @property
+    def structure(self):
+        # The structure is validated through StoryData, which picks the structure model.
+        return self._load_section("structure", lambda data: StoryData.model_validate({"structure": data}).structure)
+
+    @property
+    def worldbuilding(self) -> WorldbuildingData | None:
+        return self._load_section("worldbuilding", WorldbuildingData.model_validate)
+
+    @property
+    def characters(self) -> list[CharacterData]:
+        with self._lock:
+            if "characters" not in self._sections:
+                characters = self._replaced_list("characters", CharacterData)
+                if characters is None:
+                    characters = []
+                    for index, name in enumerate(self.index["characters"]):
+                        file_path, serializer = find_saved_file(
+                            self.story_dir / "characters", name, settings.save_story_file_type
+                        )
+                        data = apply_patches(
+                            serializer.loads(file_path.read_bytes()), self._item_patches("characters", index)
+                        )
+                        characters.append(CharacterData.model_validate(data))
+                self._sections["characters"] = characters
+            return self._sections["characters"]
+
+    @property
+    def chapter_numbers(self) -> list[int]:
+        if isinstance(self.chapters, LazyChapters):
+            return list(self.chapters.numbers)
+        return [chapter.number for chapter in self.chapters]
+
+    def get_chapter(self, number: int) -> ChapterData:
+        return self.chapters[self.chapter_numbers.index(number)]
+
+    def load_chapter(self, index: int, number: int) -> ChapterData:
+        """Loads a chapter, with its scenes, from /chapters/Chapter-N/."""
+        chapter = ChapterData.load_from_file(self.story_dir / "chapters" / f"Chapter-{number}")
+        patches = self._item_patches("chapters", index)
+        if patches:
+            chapter = ChapterData.model_validate(apply_patches(chapter.model_dump(mode="json"), patches))
+        return chapter
+
+    def to_story_data(self) -> StoryData:
+        """Loads every section, returning a regular (editable) StoryData."""
+        return StoryData(
+            general=self.general,
+            structure=self.structure,
+            worldbuilding=self.worldbuilding,
+            characters=self.characters,
+            chapters=list(self.chapters),
+        )
+
+    def _load_section(self, key: str, validate: Callable[[Any], Any]) -> Any:
+        with self._lock:
+            if key not in self._sections:
+                file_path, serializer = find_saved_file(self.story_dir, key, settings.save_story_file_type)
+                data = serializer.loads(file_path.read_bytes()) if file_path.exists() else None
+                data = apply_patches(data, self._patches.get(key, []))
+                self._sections[key] = None if data is None else validate(data)
+            return self._sections[key]
+
+    def _item_patches(self, key: str, index: int) -> list[dict]:
+        """The patches of one item of a list section, with the paths relative to the item."""
+        return [
+            {"path": patch["path"][1:], "value": patch["value"]}
+            for patch in self._patches.get(key, [])
+            if patch["path"][0] == index
+        ]
+
+    def _replaced_list(self, key: str, model: type[CBM]) -> list[CBM] | None:
+        """The list section, if the journal replaces it as a whole. None otherwise."""
+        patches = self._patches.get(key, [])
+        if not patches or patches[0]["path"]:
+            return None
+        return [model.model_validate(item) for item in apply_patches(None, patches)]
+
+
+class LazyChapters(Sequence):
+    """The chapters of a LazyStoryData. A chapter is loaded the first time it's accessed, then kept."""
+
+    def __init__(self, story_data: LazyStoryData, numbers: list[int]):
+        self.story_data = story_data
+        self.numbers = numbers
+        self._lock = threading.Lock()
+        self._chapters: dict[int, ChapterData] = {}
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self))[index]  # Supports negative indexes, raises IndexError.
+        with self._lock:
+            if index not in self._chapters:
+                self._chapters[index] = self.story_data.load_chapter(index, self.numbers[index])
+            return self._chapters[index]
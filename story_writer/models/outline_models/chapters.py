@@ -1,9 +1,7 @@
-import json
 import logging
 from pathlib import Path
 from typing import Annotated, TypeVar
 
-import yaml
 from pydantic import AfterValidator
 from pydantic.json_schema import SkipJsonSchema
 
@@ -11,6 +9,7 @@ from story_writer import settings
 from story_writer.models.base import CustomBaseModel
 from story_writer.models.outline_models.scenes import SceneData
 from story_writer.models.validations import str_not_empty
+from story_writer.serializers import find_saved_file, get_serializer
 
 log = logging.getLogger(__name__)
 
@@ -51,26 +50,25 @@ class ChapterData(CustomBaseModel):
 
     @classmethod
     def load_from_file(cls: type[CBM], file_path: Path) -> CBM:
-        # Load chapter data
-        print(f"chapter file path {file_path=}")
-        chapter_file = file_path / f"chapter-{file_path.name.split('-')[-1]}.{settings.save_story_file_type}"
-        if settings.save_story_file_type == "json":
-            with open(chapter_file, encoding="utf-8") as f:
-                chapter_data = json.load(f)
-        elif settings.save_story_file_type == "yaml":
-            with open(chapter_file, encoding="utf-8") as f:
-                chapter_data = yaml.safe_load(f)
-        else:
-            raise Exception(f"File type: '{settings.save_story_file_type}' not supported.")
-
-        scenes = []
-        for scene_path in sorted(file_path.glob(f"scene-*.{settings.save_story_file_type}")):
-            print(f"{scene_path=}")
-            scenes.append(SceneData.load_from_file(story_dir=scene_path))
+        """
+        :param file_path: The /Chapter-n/ directory
+        :return: The chapter. Its scenes are loaded from the scene files if the chapter file has none.
+        """
+        log.debug(f"Loading chapter from {file_path}")
+        chapter_file, serializer = find_saved_file(
+            file_path, f"chapter-{file_path.name.split('-')[-1]}", settings.save_story_file_type
+        )
+        chapter_data = serializer.loads(chapter_file.read_bytes())
 
         # TODO: Know that the scenes are still saved with the chapter.
         #  Possible way of going about it, solution?, is to save the scenes then clear them from the chapter,
         #  maybe with a message indicating the files are saved separately.
-        chapter_data["scenes"] = scenes
+        if not chapter_data.get("scenes"):
+            scene_paths = file_path.glob(f"scene-*.{get_serializer(settings.save_story_file_type).extension}")
+            # Sorted by scene number, scene-10 comes after scene-9.
+            chapter_data["scenes"] = [
+                SceneData.load_from_file(story_dir=file_path, filename=scene_path.stem)
+                for scene_path in sorted(scene_paths, key=lambda path: int(path.stem.split("-")[-1]))
+            ]
 
         return cls(**chapter_data)
@@ -28,4 +28,4 @@ class CharacterData(CustomBaseModel):
 
     @classmethod
     def load_from_file(cls: type[CBM], file_path: Path) -> CBM:
-        return super().load_from_file(file_path=file_path)
+        return super().load_from_file(story_dir=file_path.parent, filename=file_path.stem)
@@ -1,9 +1,11 @@
 import logging
-from typing import Any
+import threading
+from typing import Any, NamedTuple
 
 from pydantic import BaseModel, TypeAdapter
 
 from story_writer.constants import StoryStructureEnum
+from story_writer.models.outline_models import ChapterData, CharacterData, GeneralData, SceneData, WorldbuildingData
 from story_writer.models.outline_models.story_structure_models import (
     ClassicStoryStructure,
     DanHarmonsStoryCircleStructure,
@@ -36,13 +38,31 @@ STORY_STYLE_MODEL_MAPPING = {
 }
 
 
-def create_json_schema(model: type[BaseModel]) -> dict[str, Any] | None:
-    array_models = ["CharacterData", "ChapterData", "SceneData"]
-    if model.__name__ in array_models:
-        schema = TypeAdapter(list[model]).json_schema()
+# Models the LLM is asked to generate a list of, rather than a single object.
+ARRAY_MODELS = ["CharacterData", "ChapterData", "SceneData"]
+
+
+class SchemaEntry(NamedTuple):
+    """Precomputed structured output data for a model."""
+
+    # The response_format passed to the LLM. None if the model has no schema.
+    response_format: dict[str, Any] | None
+    # Validates LLM output into the model, or into a list of the model for ARRAY_MODELS.
+    adapter: TypeAdapter
+
+
+_schema_registry: dict[type[BaseModel], SchemaEntry] = {}
+_schema_registry_lock = threading.Lock()
+
+
+def _build_schema_entry(model: type[BaseModel]) -> SchemaEntry:
+    if model.__name__ in ARRAY_MODELS:
+        adapter = TypeAdapter(list[model])
+        schema = adapter.json_schema()
     else:
+        adapter = TypeAdapter(model)
         schema = model.model_json_schema()
-    return (
+    response_format = (
         {
             "type": "json_schema",
             "json_schema": {"name": model.__name__, "strict": True, "schema": schema, "required": [model.__name__]},
@@ -50,3 +70,42 @@ def create_json_schema(model: type[BaseModel]) -> dict[str, Any] | None:
         if schema
         else None
     )
+    return SchemaEntry(response_format=response_format, adapter=adapter)
+
+
+def build_schema_registry() -> None:
+    """
+    Precomputes the schema entries for every outline model and story structure model.
+    Building the json schemas (especially for the union-heavy StoryData types) is slow, so it's only done once.
+    """
+    with _schema_registry_lock:
+        if _schema_registry:
+            return
+        models = [ChapterData, CharacterData, GeneralData, SceneData, WorldbuildingData]
+        models.extend(STORY_STYLE_MODEL_MAPPING.values())
+        for model in models:
+            _schema_registry[model] = _build_schema_entry(model)
+        log.debug(f"Built json schemas for {len(_schema_registry)} models.")
+
+
+def get_schema_entry(model: type[BaseModel]) -> SchemaEntry:
+    """Returns the precomputed schema entry for the model. Models outside the registry are added on first use."""
+    build_schema_registry()
+    entry = _schema_registry.get(model)
+    if entry is None:
+        with _schema_registry_lock:
+            entry = _schema_registry.setdefault(model, _build_schema_entry(model))
+    return entry
+
+
+def create_json_schema(model: type[BaseModel]) -> dict[str, Any] | None:
+    """
+    Returns the strict structured output response_format for the model.
+    The returned dict is shared between calls, don't modify it.
+    """
+    return get_schema_entry(model).response_format
+
+
+def get_type_adapter(model: type[BaseModel]) -> TypeAdapter:
+    """Returns the reusable validator for the model (or list of the model, for ARRAY_MODELS)."""
+    return get_schema_entry(model).adapter
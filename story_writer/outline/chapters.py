@@ -3,29 +3,40 @@ import logging
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import load_story_data, save_story_data
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
 from story_writer.models.outline_models import ChapterData
+from story_writer.prompt_layout import build_prefix_messages
 from story_writer.prompts import generate_story_chapters_prompt
 
 log = logging.getLogger(__name__)
 
 
-def generate_chapters(client: Client):
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+def generate_chapters(client: Client, story_data: StoryData | None = None) -> StoryData:
+    story_data = load_story_data(story_data)
 
-    character_seed_str = ""
-    for char_dict in [char.dict() for char in story_data.characters]:
-        character_seed_str += ", ".join([f"{key}: {val}" for key, val in char_dict.items()])
+    if settings.prefix_stable_prompts:
+        # Without per-stage prompt_token_budgets, this is the same prefix as the scene and draft prompts, so the LLM
+        # platform can reuse it across stages. A stage's budget trims its prefix, which is then only shared within
+        # the stage.
+        messages = [
+            *build_prefix_messages(story_data),
+            {"role": "user", "content": generate_story_chapters_prompt(story_data, seeded=True)},
+        ]
+    else:
+        character_seed_str = ""
+        for char_dict in [char.dict() for char in story_data.characters]:
+            character_seed_str += ", ".join([f"{key}: {val}" for key, val in char_dict.items()])
 
-    messages = [
-        {"role": "system", "content": settings.basic_system_prompt},
-        {  # Seed data prior to chapter-generation instructions.
-            "role": "user",
-            "content": f"Story characters:\n{character_seed_str}",
-        },
-        {"role": "user", "content": generate_story_chapters_prompt(story_data)},
-    ]
+        messages = [
+            {"role": "system", "content": settings.basic_system_prompt},
+            {  # Seed data prior to chapter-generation instructions.
+                "role": "user",
+                "content": f"Story characters:\n{character_seed_str}",
+            },
+            {"role": "user", "content": generate_story_chapters_prompt(story_data)},
+        ]
 
     content, elapsed = get_validated_llm_output(
         client=client,
@@ -33,6 +44,7 @@ def generate_chapters(client: Client):
         validation_model=ChapterData,
         model_settings=settings.stage.chapters,
         log_file_name="generate_chapters",
+        stage="chapters",
     )
 
     for count, chapter in enumerate(content):
@@ -41,7 +53,7 @@ def generate_chapters(client: Client):
     story_data.chapters = content
 
     log.debug("Saving Chapter Outline Data.")
-    story_data.save_to_file(output_dir=settings.story_dir)
+    save_story_data(story_data)
 
     # utils.log_step(
     #     story_root=story_root,
@@ -52,3 +64,5 @@ def generate_chapters(client: Client):
     #     response_model=ChapterData,
     #     duration=elapsed,
     # )
+
+    return story_data
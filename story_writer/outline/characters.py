@@ -3,6 +3,7 @@ import logging
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import load_story_data, save_story_data
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
 from story_writer.models.outline_models import CharacterData
@@ -11,10 +12,10 @@ from story_writer.prompts import generate_story_characters_prompt
 log = logging.getLogger(__name__)
 
 
-def generate_characters(client: Client):
+def generate_characters(client: Client, story_data: StoryData | None = None) -> StoryData:
 
     # story_data: StoryData = load_story_data(story_path=story_root)
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+    story_data = load_story_data(story_data)
 
     log.info(f"Generating Characters for story: '{story_data.general.title}'")
 
@@ -31,12 +32,12 @@ def generate_characters(client: Client):
         validation_model=CharacterData,
         model_settings=settings.stage.characters,
         log_file_name="generate_characters",
+        stage="characters",
     )
 
     story_data.characters = content
 
-    # save_story_data(story_root, story_data)
-    story_data.save_to_file(output_dir=settings.story_dir)
+    save_story_data(story_data)
 
     # utils.log_step(
     #     story_root=story_root,
@@ -47,3 +48,5 @@ def generate_characters(client: Client):
     #     settings={},
     #     duration=elapsed,
     # )
+
+    return story_data
@@ -3,6 +3,7 @@ import logging
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import load_story_data, save_story_data
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
 from story_writer.models.outline_models import GeneralData
@@ -10,14 +11,14 @@ from story_writer.models.outline_models import GeneralData
 log = logging.getLogger(__name__)
 
 
-def regenerate_general_story_details(client: Client):
+def regenerate_general_story_details(client: Client, story_data: StoryData | None = None) -> StoryData:
     """
     Revise the General themes, genres, and synopsis using the story structure based on the original
     general data. The thought is that the og synopsis triggers a story structure, which inherently gives us the story
     stakes which the synopsis probably lacks. So regenerating the synopsis now that we have a start to finish story
     might give us a better synopsis to work with.
     """
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+    story_data = load_story_data(story_data)
 
     log.info(f"Regenerating general story details: '{story_data.general.title}'")
 
@@ -46,13 +47,14 @@ Story Structure / Outline:\n
         validation_model=GeneralData,
         model_settings=settings.stage.general,
         log_file_name="revise_initial_prompt",
+        stage="general",
     )
 
     story_data.general.themes = content.themes
     story_data.general.genres = content.genres
     story_data.general.synopsis = content.synopsis
 
-    story_data.save_to_file(output_dir=settings.story_dir)
+    save_story_data(story_data)
 
     # utils.log_step(
     #     story_root=story_root,
@@ -63,3 +65,5 @@ Story Structure / Outline:\n
     #     response_model=GeneralData,
     #     duration=elapsed,
     # )
+
+    return story_data
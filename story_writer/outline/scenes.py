@@ -1,93 +1,271 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from openai import Client
 
 from story_writer import settings
+from story_writer.batch import run_batch, select_batch_output
+from story_writer.checkpoint import compact_story_data, load_story_data, save_chapter_scenes
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
-from story_writer.models.outline_models import SceneData
+from story_writer.models.outline_models import ChapterData, SceneData
+from story_writer.models.utils import create_json_schema
+from story_writer.prompt_budget import SeedSection, abbreviate_characters, fit_to_budget, split_characters
+from story_writer.prompt_layout import build_prefix_messages, get_structure_point_details
 from story_writer.prompts import generate_story_chapter_scene_prompt
+from story_writer.rate_limit import estimate_text_tokens
+from story_writer.resume import get_run_progress
 
 log = logging.getLogger(__name__)
 
 
-def generate_scenes_for_chapter(client: Client):
+def generate_scenes_for_chapter(client: Client, story_data: StoryData | None = None) -> StoryData:
     """
     For each chapter, generate a few scenes based on the chapter synopsis, location, and characters.
+
+    Each chapter's scene prompt only depends on the chapter, the characters, and the story structure, so when
+    settings.scenes_max_concurrency is greater than 1 the chapters are sent to the LLM concurrently. The results are
+    still applied (and saved) in chapter order. With settings.batch.scenes, every chapter is sent as one batch job.
+    Chapters marked as complete (a resumed story, see resume.RunProgress) are skipped.
     """
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+    story_data = load_story_data(story_data)
     log.debug(f"Generating Scenes for outline: {story_data.general.title}")
 
     # Generate a non-json string block to seed the context before each scene.
     character_seed_str = "".join([c.list_key_values_str() for c in story_data.characters])
+    progress = get_run_progress()
+    indexes = [
+        index for index, chapter in enumerate(story_data.chapters) if not progress.is_complete("scenes", chapter.number)
+    ]
+    if len(indexes) < len(story_data.chapters):
+        log.info(f"Resuming, {len(story_data.chapters) - len(indexes)} chapters already have scenes.")
+
+    # Built once, so every chapter's prompt starts with the exact same messages. The budget leaves room for the
+    # longest chapter instructions that follow it.
+    prefix_messages = None
+    if settings.prefix_stable_prompts:
+        suffix_tokens = max(
+            (estimate_text_tokens(scenes_prompt_suffix(story_data, story_data.chapters[index])) for index in indexes),
+            default=0,
+        )
+        prefix_messages = build_prefix_messages(
+            story_data, settings.stage.scenes.prompt_token_budget, reserved=suffix_tokens
+        )
 
     log.debug(f"Generating Scenes using model: {settings.llm.model}")
-    for chapter in story_data.chapters:
-        story_structure_seed_str = (
-            f"{story_data.structure.style}\n"
-            f"{chapter.story_structure_point} - "
-            # Get only the relevant story structure point.
-            # Uses a normalized story structure style to pull the correct section.
-            f"{story_data.structure.model_dump(mode='python').get(chapter.story_structure_point.replace(' ', '_').lower(), 'Chapter outline structure point not found in generated outline structure.')}"
+    max_workers = min(settings.scenes_max_concurrency, len(indexes))
+    if settings.batch.scenes:
+        generate_scenes_in_batch(client, story_data, character_seed_str, prefix_messages, indexes)
+    elif max_workers > 1:
+        log.info(f"Generating scenes for {len(indexes)} chapters, {max_workers} at a time.")
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scenes")
+        try:
+            futures = [
+                executor.submit(
+                    generate_scenes, client, story_data, story_data.chapters[index], character_seed_str, prefix_messages
+                )
+                for index in indexes
+            ]
+            # Merge the results back in chapter order, regardless of the order the LLM calls finish in.
+            for index, future in zip(indexes, futures, strict=True):
+                story_data.chapters[index].scenes = future.result()
+                save_chapter_scenes(story_data, index)
+        finally:
+            # Don't start any queued chapters if one of the chapters failed to generate scenes.
+            executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        for index in indexes:
+            chapter = story_data.chapters[index]
+            chapter.scenes = generate_scenes(client, story_data, chapter, character_seed_str, prefix_messages)
+            save_chapter_scenes(story_data, index)
+
+    compact_story_data(story_data)
+    log.info("Scenes generated for all chapters. Story outline is complete.")
+    return story_data
+
+
+def generate_scenes_in_batch(
+    client: Client,
+    story_data: StoryData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+    indexes: list[int] | None = None,
+) -> None:
+    """
+    Sends the scene prompt of every chapter as one batch job (see settings.batch), then applies the results in chapter
+    order. Chapters without a usable result (a failed request, invalid output, or too few scenes) are generated with
+    regular LLM calls instead.
+    :param indexes: Indexes of the chapters to generate scenes for. Defaults to every chapter.
+    """
+    if indexes is None:
+        indexes = list(range(len(story_data.chapters)))
+    requests = {
+        f"chapter-{index}": generate_scenes_messages(
+            story_data, story_data.chapters[index], character_seed_str, prefix_messages
+        )
+        for index in indexes
+    }
+    results = (
+        run_batch(
+            client,
+            stage="scenes",
+            requests=requests,
+            response_format=create_json_schema(SceneData),
+            model_settings=settings.stage.scenes,
         )
+        if requests
+        else {}
+    )
+
+    for index in indexes:
+        chapter = story_data.chapters[index]
+        scenes = select_batch_output(
+            results.get(f"chapter-{index}", []),
+            validation_model=SceneData,
+            stage="scenes",
+            accept=lambda content: len(content) >= settings.scenes_per_chapter_minimum_count,
+        )
+        if scenes is None or len(scenes) < settings.scenes_per_chapter_minimum_count:
+            log.warning(f"No usable batch result for chapter {chapter.number}, generating its scenes directly.")
+            chapter.scenes = generate_scenes(client, story_data, chapter, character_seed_str, prefix_messages)
+        else:
+            for count, scene in enumerate(scenes):
+                scene.number = count + 1  # enumerate is zero-based
+            chapter.scenes = scenes
+        save_chapter_scenes(story_data, index)
+
+
+def generate_scenes(
+    client: Client,
+    story_data: StoryData,
+    chapter: ChapterData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+) -> list[SceneData]:
+    """
+    Generates the scenes for a single chapter. Does not modify the story_data or the chapter.
+
+    :param client: Facilitates LLM connection and communication
+    :param story_data: The story outline, used to seed the scene prompt.
+    :param chapter: The chapter to generate scenes for.
+    :param character_seed_str: Pre-formatted character data used to seed the context.
+    :param prefix_messages: Shared prompt prefix (prompt_layout.build_prefix_messages). When set, only the chapter
+      specific instructions follow it, and character_seed_str is unused.
+    :return: List of numbered scenes for the chapter.
+    """
+    log.info(f"Generating scenes for chapter {chapter.number}.")
+    messages = generate_scenes_messages(story_data, chapter, character_seed_str, prefix_messages)
 
-        log.info(f"Generating scenes for chapter {chapter.number}.")
-        messages = [
-            {"role": "system", "content": settings.basic_system_prompt},
-            {
-                "role": "user",
-                "content": f"Characters: \n{character_seed_str}\nStory Structure/Outline: {story_structure_seed_str}",
-            },
-            {
-                "role": "user",
-                "content": generate_story_chapter_scene_prompt(story_data, chapter),
-            },
-        ]
-
-        max_retries = settings.scenes_per_chapter_retry_count
-        log.debug(f"Number of attempts to generate scenes: {settings.scenes_per_chapter_retry_count}")
-        attempts = 0
-        while attempts < max_retries:
-            log.debug(f"Attempt {attempts} at generating scenes for chapter {chapter.number}")
-            content, elapsed = get_validated_llm_output(
-                client=client,
-                messages=messages,
-                validation_model=SceneData,
-                model_settings=settings.stage.scenes,
-                log_file_name=f"generate_scenes_for_chapter_{chapter.number}",
+    max_retries = settings.scenes_per_chapter_retry_count
+    log.debug(f"Number of attempts to generate scenes: {settings.scenes_per_chapter_retry_count}")
+    attempts = 0
+    while attempts < max_retries:
+        log.debug(f"Attempt {attempts} at generating scenes for chapter {chapter.number}")
+        content, elapsed = get_validated_llm_output(
+            client=client,
+            messages=messages,
+            validation_model=SceneData,
+            model_settings=settings.stage.scenes,
+            log_file_name=f"generate_scenes_for_chapter_{chapter.number}",
+            stage="scenes",
+            # The previous output had too few scenes, don't serve it from the cache again.
+            refresh_cache=attempts > 0,
+            # With n > 1, prefer a choice that has enough scenes.
+            accept=lambda scenes: len(scenes) >= settings.scenes_per_chapter_minimum_count,
+        )
+
+        if len(content) < settings.scenes_per_chapter_minimum_count:
+            log.warning(
+                f"LLM returned fewer than {settings.scenes_per_chapter_minimum_count} "
+                f"scenes for chapter {chapter.number}. This is a user-setting. If the LLM model "
+                f"continues to fail, try updating the scene-generator prompt or lowering the minimum "
+                f"scenes per chapter in config/story_settings.py - SCENES_PER_CHAPTER_MINIMUM_COUNT. "
+                f"Retrying..."
             )
+            attempts += 1
+        else:
+            log.debug(f"Generated {len(content)} scenes for chapter {chapter.number}.")
+            break
+    else:
+        error = f"Failed to generate at least 4 scenes {chapter.number} in {max_retries} attempts."
+        log.exception(error)
+        raise RuntimeError(error)
+
+    for count, scene in enumerate(content):
+        scene.number = count + 1  # enumerate is zero-based
+
+    # utils.log_step(
+    #     story_root=story_root,
+    #     messages=messages,
+    #     file_name=f"generate_scenes_for_chapter_{chapter.number}",
+    #     model=model,
+    #     settings={},
+    #     response_model=SceneData,
+    #     duration=elapsed,
+    # )
+    return content
+
+
+def generate_scenes_messages(
+    story_data: StoryData,
+    chapter: ChapterData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+) -> list[dict[str, str]]:
+    """
+    Builds the messages of a chapter's scene prompt. See generate_scenes for the parameters.
+    With a scenes prompt_token_budget, characters that aren't in the chapter are abbreviated or dropped first.
+    """
+    if prefix_messages:
+        return [*prefix_messages, {"role": "user", "content": scenes_prompt_suffix(story_data, chapter)}]
+
+    story_structure_seed_str = (
+        f"{story_data.structure.style}\n"
+        f"{chapter.story_structure_point} - "
+        # Get only the relevant story structure point.
+        # Uses a normalized story structure style to pull the correct section.
+        f"{story_data.structure.model_dump(mode='python').get(chapter.story_structure_point.replace(' ', '_').lower(), 'Chapter outline structure point not found in generated outline structure.')}"
+    )
 
-            if len(content) < settings.scenes_per_chapter_minimum_count:
-                log.warning(
-                    f"LLM returned fewer than {settings.scenes_per_chapter_minimum_count} "
-                    f"scenes for chapter {chapter.number}. This is a user-setting. If the LLM model "
-                    f"continues to fail, try updating the scene-generator prompt or lowering the minimum "
-                    f"scenes per chapter in config/story_settings.py - SCENES_PER_CHAPTER_MINIMUM_COUNT. "
-                    f"Retrying..."
+    scene_prompt = generate_story_chapter_scene_prompt(story_data, chapter)
+
+    budget = settings.stage.scenes.prompt_token_budget
+    if budget:
+        featured, others = split_characters(story_data.characters, [char.name for char in chapter.characters])
+        sections = [SeedSection("Characters: ", required=True)]
+        if featured:
+            sections.append(
+                SeedSection(
+                    "".join([c.list_key_values_str() for c in featured]),
+                    priority=1,
+                    abbreviated=abbreviate_characters(featured),
                 )
-                attempts += 1
-            else:
-                log.debug(f"Generated {len(content)} scenes for chapter {chapter.number}.")
-                break
-        else:
-            error = f"Failed to generate at least 4 scenes {chapter.number} in {max_retries} attempts."
-            log.exception(error)
-            raise RuntimeError(error)
-
-        for count, scene in enumerate(content):
-            scene.number = count + 1  # enumerate is zero-based
-
-        chapter.scenes = content
-
-        story_data.save_to_file(output_dir=settings.story_dir)
-
-        # utils.log_step(
-        #     story_root=story_root,
-        #     messages=messages,
-        #     file_name=f"generate_scenes_for_chapter_{chapter.number}",
-        #     model=model,
-        #     settings={},
-        #     response_model=SceneData,
-        #     duration=elapsed,
-        # )
-    log.info("Scenes generated for all chapters. Story outline is complete.")
+            )
+        if others:
+            sections.append(
+                SeedSection(
+                    "Other characters:\n" + "".join([c.list_key_values_str() for c in others]),
+                    priority=0,
+                    abbreviated="Other characters: " + ", ".join([c.name for c in others]),
+                )
+            )
+        sections.append(SeedSection(f"Story Structure/Outline: {story_structure_seed_str}", required=True))
+        reserved = estimate_text_tokens(settings.basic_system_prompt) + estimate_text_tokens(scene_prompt)
+        seed_content = "\n".join(fit_to_budget(sections, budget, reserved=reserved))
+    else:
+        seed_content = f"Characters: \n{character_seed_str}\nStory Structure/Outline: {story_structure_seed_str}"
+
+    return [
+        {"role": "system", "content": settings.basic_system_prompt},
+        {"role": "user", "content": seed_content},
+        {"role": "user", "content": scene_prompt},
+    ]
+
+
+def scenes_prompt_suffix(story_data: StoryData, chapter: ChapterData) -> str:
+    """The chapter specific instructions that follow the shared prefix (prompt_layout.build_prefix_messages)."""
+    return (
+        f"Chapter Story Structure Point: {chapter.story_structure_point} - "
+        f"{get_structure_point_details(story_data.structure, chapter.story_structure_point)}\n\n"
+        f"{generate_story_chapter_scene_prompt(story_data, chapter, seeded=True)}"
+    )
@@ -3,6 +3,7 @@ import logging
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import load_story_data, save_story_data
 from story_writer.constants import StoryStructureEnum
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
@@ -15,17 +16,19 @@ log = logging.getLogger(__name__)
 def generate_story_structure(
     client: Client,
     story_structure: StoryStructureEnum = StoryStructureEnum.CLASSIC_STORY_STRUCTURE,
-):
+    story_data: StoryData | None = None,
+) -> StoryData:
     """
     Uses the LLM to generate the story structure based on the user's selected story structure.
 
     :param client: Facilitates LLM connection and communication
     :param story_structure: Enum representing the selected story structure
 
-    :return: None (Saves parameters used in the LLM call in the story directory /logs/,
-             updates the story_data.yaml with the structured return data.)
+    :param story_data: The outline from the previous stage. Loaded from the story directory if None.
+
+    :return: The outline, with the story structure. (Also saved to the story_data.yaml)
     """
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+    story_data = load_story_data(story_data)
 
     if not story_data.general:
         raise Exception("General story details do not exist, create a new story before generating the story structure.")
@@ -44,11 +47,12 @@ def generate_story_structure(
         validation_model=story_structure_model,
         model_settings=settings.stage.structure,
         log_file_name="generate_story_structure",
+        stage="structure",
     )
 
     story_data.structure = story_structure_data
 
-    story_data.save_to_file(output_dir=settings.story_dir)
+    save_story_data(story_data)
 
     # utils.log_step(
     #     story_root=story_root,
@@ -59,3 +63,5 @@ def generate_story_structure(
     #     response_model=story_structure_model,
     #     duration=elapsed,
     # )
+
+    return story_data
@@ -3,6 +3,7 @@ import logging
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import load_story_data, save_story_data
 from story_writer.llm import get_validated_llm_output
 from story_writer.models.outline import StoryData
 from story_writer.models.outline_models import WorldbuildingData
@@ -11,8 +12,8 @@ from story_writer.prompts import generate_worldbuilding_prompt
 log = logging.getLogger(__name__)
 
 
-def generate_worldbuilding(client: Client):
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
+def generate_worldbuilding(client: Client, story_data: StoryData | None = None) -> StoryData:
+    story_data = load_story_data(story_data)
 
     log.info(f"Generating Characters for story: '{story_data.general.title}'")
 
@@ -30,11 +31,12 @@ def generate_worldbuilding(client: Client):
         validation_model=WorldbuildingData,
         model_settings=settings.stage.worldbuilding,
         log_file_name="generate_worldbuilding",
+        stage="worldbuilding",
     )
 
     story_data.worldbuilding = content
 
-    story_data.save_to_file(output_dir=settings.story_dir)
+    save_story_data(story_data)
 
     # Todo: Update the log_step function. Figure out what it's purpose is.
     #  Current issue is that the model used may differ depending on if a stage has a model set, or if it uses the default.
@@ -48,3 +50,5 @@ def generate_worldbuilding(client: Client):
     #     response_model=WorldbuildingData,
     #     duration=elapsed,
     # )
+
+    return story_data
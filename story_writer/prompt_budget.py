@@ -0,0 +1,91 @@
+import logging
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from story_writer.rate_limit import CHARS_PER_TOKEN, estimate_text_tokens
+
+if TYPE_CHECKING:
+    from story_writer.models.outline_models import CharacterData
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class SeedSection:
+    """
+    A block of prompt text. When the prompt is over its token budget, the lowest priority sections are abbreviated
+    first, then dropped, until the prompt fits. Required sections (ie, the instructions) are never trimmed.
+    """
+
+    text: str
+    priority: int = 0
+    required: bool = False
+    # Shorter stand-in for the text, used before the section is dropped.
+    abbreviated: str | None = None
+
+
+def fit_to_budget(sections: list[SeedSection], budget: int | None, reserved: int = 0) -> list[str]:
+    """
+    Returns the text of each section that fits in the token budget, in the original order.
+
+    :param sections: The prompt, split into sections.
+    :param budget: Estimated token budget of the prompt. None keeps every section as-is.
+    :param reserved: Tokens of the budget used elsewhere in the prompt, ie by the system prompt.
+    """
+    texts: list[str | None] = [section.text for section in sections]
+    if budget is None:
+        return texts
+
+    available = budget - reserved
+    total = sum(estimate_text_tokens(text) for text in texts)
+    trimmable = sorted((i for i, s in enumerate(sections) if not s.required), key=lambda i: sections[i].priority)
+
+    for index in trimmable:
+        if total <= available:
+            break
+        abbreviated = sections[index].abbreviated
+        if abbreviated is not None and len(abbreviated) < len(texts[index]):
+            total -= estimate_text_tokens(texts[index]) - estimate_text_tokens(abbreviated)
+            texts[index] = abbreviated
+
+    for index in trimmable:
+        if total <= available:
+            break
+        total -= estimate_text_tokens(texts[index])
+        texts[index] = None
+
+    if total > available:
+        log.warning(f"Prompt is ~{total} tokens after trimming every optional section, the budget is {available}.")
+    return [text for text in texts if text is not None]
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Shortens the text to about max_tokens, cutting at the end of a sentence when possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    return (cut[: sentence_end + 1] if sentence_end > 0 else cut.rstrip()) + " ..."
+
+
+def _normalize_name(name: str) -> str:
+    # Scene/chapter character names can include extra details, ie "Alice (disguised)".
+    return re.sub(r"\s*\(.*", "", name).strip().lower()
+
+
+def split_characters(
+    characters: list["CharacterData"], names: Iterable[str]
+) -> tuple[list["CharacterData"], list["CharacterData"]]:
+    """Splits the story characters into those named in the chapter/scene, and everyone else."""
+    normalized = {_normalize_name(name) for name in names}
+    featured = [c for c in characters if _normalize_name(c.name) in normalized]
+    others = [c for c in characters if _normalize_name(c.name) not in normalized]
+    return featured, others
+
+
+def abbreviate_characters(characters: list["CharacterData"]) -> str:
+    """One short line per character."""
+    return "\n".join(f"{character.name} ({character.role})" for character in characters)
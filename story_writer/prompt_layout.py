@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from story_writer import settings
+from story_writer.prompt_budget import SeedSection, abbreviate_characters, fit_to_budget, truncate_text
+from story_writer.rate_limit import estimate_text_tokens
+
+if TYPE_CHECKING:
+    from story_writer.models.base import StoryStructure
+    from story_writer.models.outline import StoryData
+
+log = logging.getLogger(__name__)
+
+
+def get_structure_point_details(structure: "StoryStructure", story_structure_point: str) -> str:
+    """Returns the story structure details for a chapter's story structure point, ie "Plot Turn 1" -> plot_turn_1"""
+    return structure.model_dump(mode="python").get(
+        story_structure_point.replace(" ", "_").lower(),
+        "Chapter outline structure point not found in generated outline structure.",
+    )
+
+
+def story_seed_prompt(story_data: "StoryData", token_budget: int | None = None, reserved: int = 0) -> str:
+    """
+    Formats the story-wide outline data (general, structure, worldbuilding, characters) as one block of text.
+    The output only depends on the story data, so it's byte-identical for every call made for the same story.
+
+    :param token_budget: Abbreviates, then drops, the worldbuilding, characters, and structure (in that order) to fit.
+    :param reserved: Tokens of the budget used by the messages after the seed, on top of the system prompt.
+    """
+    sections = [
+        SeedSection(
+            "Story Details:\n"
+            f"Title: {story_data.general.title}\n"
+            f"Themes: {', '.join(story_data.general.themes)}\n"
+            f"Genre: {', '.join(story_data.general.genres)}\n"
+            f"Synopsis: {story_data.general.synopsis}\n",
+            required=True,
+        )
+    ]
+    if story_data.structure:
+        sections.append(
+            SeedSection(
+                f"Story Structure/Outline:\n{story_data.structure.style}\n{story_data.structure.list_key_values_str()}",
+                priority=2,
+            )
+        )
+    if story_data.worldbuilding:
+        worldbuilding = f"Worldbuilding:\n{story_data.worldbuilding.list_key_values_str()}"
+        sections.append(
+            SeedSection(worldbuilding, priority=0, abbreviated=truncate_text(worldbuilding, max_tokens=200))
+        )
+    if story_data.characters:
+        sections.append(
+            SeedSection(
+                "Characters:\n" + "\n".join([c.list_key_values_str() for c in story_data.characters]),
+                priority=1,
+                abbreviated="Characters:\n" + abbreviate_characters(story_data.characters),
+            )
+        )
+    reserved += estimate_text_tokens(settings.basic_system_prompt)
+    return "\n".join(fit_to_budget(sections, token_budget, reserved=reserved))
+
+
+def build_prefix_messages(
+    story_data: "StoryData", token_budget: int | None = None, reserved: int = 0
+) -> list[dict[str, str]]:
+    """
+    Returns the canonical, shared start of every message list for the story: the system prompt, then the story seed.
+    Build it once per stage and put only the per-chapter/per-scene instructions after it, so LLM platforms with prompt
+    (KV) caching can reuse the prefill of the shared prefix.
+
+    :param token_budget: Token budget of the whole prompt. See story_seed_prompt.
+    :param reserved: Tokens of the per-chapter/per-scene instructions. The prefix is shared, so reserve the largest.
+    """
+    return [
+        {"role": "system", "content": settings.basic_system_prompt},
+        {"role": "user", "content": story_seed_prompt(story_data, token_budget, reserved)},
+    ]
+
+
+def serialize_messages(messages: list[dict[str, str]]) -> str:
+    """Approximates how a chat template lays the messages out, for prefix comparisons."""
+    return "".join(f"<|{message['role']}|>{message['content']}" for message in messages)
+
+
+class PrefixTracker:
+    """
+    Measures how much of each call's prompt is shared with the previous call in the same stage.
+    A high ratio means the LLM platform can serve most of the prompt from its prompt cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: dict[str, str] = {}
+
+    def shared_prefix_ratio(self, stage: str, messages: list[dict[str, str]]) -> float | None:
+        """Returns the share (0-1) of the prompt that matches the previous prompt of the stage. None if it's the first."""
+        serialized = serialize_messages(messages)
+        with self._lock:
+            previous = self._previous.get(stage)
+            self._previous[stage] = serialized
+        if previous is None or not serialized:
+            return None
+        return len(os.path.commonprefix([previous, serialized])) / len(serialized)
+
+
+prefix_tracker = PrefixTracker()
@@ -123,13 +123,14 @@ Story Structure/Outline:\n{story_data.structure.style}\n{story_data.structure.li
 # """
 
 
-def generate_story_chapters_prompt(story_data: StoryData) -> str:
+def generate_story_chapters_prompt(story_data: StoryData, seeded: bool = False) -> str:
     """
 
     :param story_data:
+    :param seeded: The story details and structure are already in the context (prompt_layout.build_prefix_messages).
     :return:
     """
-    return f"""Define {settings.chapter_minimum_count + 1}, or more, chapters.
+    instructions = f"""Define {settings.chapter_minimum_count + 1}, or more, chapters.
 Use the Title, Genres, Themes, story synopsis, and story structure to generate chapters.
 
 Define the chapter title.
@@ -140,7 +141,11 @@ What are the statuses of each character (ie, deceased, transformed, asleep, daze
 Multiple chapters can cover the same story structure parts.
 Use the character's name in place of any pronoun.
 And finally, define the general chapter synopsis.
+"""
+    if seeded:
+        return instructions
 
+    return f"""{instructions}
 Story Details:
 Title: {story_data.general.title}
 Themes: {", ".join(story_data.general.themes)}
@@ -151,7 +156,18 @@ Story Structure/Outline:\n{story_data.structure.style}\n{story_data.structure.li
 """
 
 
-def generate_story_chapter_scene_prompt(story_data: StoryData, chapter: ChapterData) -> str:
+def generate_story_chapter_scene_prompt(story_data: StoryData, chapter: ChapterData, seeded: bool = False) -> str:
+    """
+    :param seeded: The story details are already in the context (prompt_layout.build_prefix_messages), only the
+      chapter details are included.
+    """
+    if seeded:
+        story_details = ""
+    else:
+        story_details = f"""Themes: {", ".join(story_data.general.themes)}
+Genre: {", ".join(story_data.general.genres)}
+
+"""
     return f"""Define {settings.scenes_per_chapter_minimum_count + 1} or more scenes for this chapter. Scenes should expand 
 on the chapter synopsis. Output response as JSON.
 
@@ -161,12 +177,17 @@ Define the location the scene takes place in.
 Define a few story beats for this scene.
 Use the character's name in place of any pronoun.
 
-Themes: {", ".join(story_data.general.themes)}
-Genre: {", ".join(story_data.general.genres)}
-
-Chapter Title: {chapter.title}
+{story_details}Chapter Title: {chapter.title}
 Story Structure reference: {chapter.story_structure_point}
 Relevant Characters: {", ".join([f"{char.name}: {char.status}" for char in [char for char in chapter.characters]])}
 Chapter Location: {chapter.location}
 Chapter Synopsis: {chapter.synopsis}
 """
+
+
+def repair_output_prompt(validation_errors: str) -> str:
+    return f"""Your previous response did not pass validation. Errors (location: message):
+{validation_errors}
+
+Fix only these errors and keep everything else the same. Respond with the complete, corrected JSON.
+"""
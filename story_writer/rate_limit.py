@@ -0,0 +1,141 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from story_writer import settings
+
+log = logging.getLogger(__name__)
+
+
+CHARS_PER_TOKEN = 4  # Rough average for English text.
+
+
+def estimate_tokens(messages: list[dict[str, str]]) -> int:
+    """Rough token count of the messages."""
+    return sum(len(message["content"]) for message in messages) // CHARS_PER_TOKEN + 1
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count of a block of text."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def parse_retry_after(headers: httpx.Headers | None) -> float | None:
+    """Returns the number of seconds the server asked us to wait, from the retry-after(-ms) headers."""
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:  # Can also be an http date.
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter. attempt is zero-based."""
+    return random.uniform(0, min(maximum, base * 2**attempt))
+
+
+class TokenBucket:
+    """Refills at rate units per second, up to capacity. Not thread-safe, the RateLimiter holds the lock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available. Amounts larger than the capacity only wait for a full bucket."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Process-wide limiter shared by every LLM call, including calls made from worker threads.
+    Caps requests per second and tokens per minute, and pauses every call while the server has asked us to back off.
+    """
+
+    def __init__(self, requests_per_second: float | None = None, tokens_per_minute: int | None = None):
+        self._lock = threading.Lock()
+        self._requests = (
+            TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Blocks until a request of (estimated) tokens is allowed."""
+        while True:
+            with self._lock:
+                wait = max(
+                    self._paused_until - time.monotonic(),
+                    self._requests.wait_time(1) if self._requests else 0.0,
+                    self._tokens.wait_time(tokens) if self._tokens else 0.0,
+                )
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.consume(1)
+                    if self._tokens:
+                        self._tokens.consume(tokens)
+                    return
+            log.debug(f"Rate limited, waiting {wait:.2f}s.")
+            time.sleep(wait)
+
+    def adjust_tokens(self, estimated: int, actual: int) -> None:
+        """Corrects the tokens-per-minute bucket once the real token usage of a call is known."""
+        if self._tokens:
+            with self._lock:
+                self._tokens.consume(actual - estimated)
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every call, in every thread, for the given number of seconds. ie, on a 429 Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide rate limiter, creating it from the user settings on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_second=settings.rate_limit.requests_per_second,
+                tokens_per_minute=settings.rate_limit.tokens_per_minute,
+            )
+        return _rate_limiter
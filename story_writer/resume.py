@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO
+
+from story_writer import settings
+
+log = logging.getLogger(__name__)
+
+PROGRESS_FILE_NAME = "progress.json"
+
+# Read once, changing the umask to read it isn't thread-safe.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_open(file_path: Path, encoding: str = "utf-8", binary: bool = False) -> Iterator[IO]:
+    """
+    Opens a temporary file to write in place of file_path, which replaces file_path once it's closed without errors.
+    A crash halfway through leaves the previous version of the file, rather than a partly written one.
+    The file keeps the permissions of the file it replaces, or gets the default permissions of a new file.
+    """
+    with tempfile.NamedTemporaryFile(
+        mode="wb" if binary else "w",
+        encoding=None if binary else encoding,
+        dir=file_path.parent,
+        prefix=f".{file_path.name}.",
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        temp_path = Path(f.name)
+        try:
+            yield f
+        except BaseException:
+            f.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+    # Temporary files are only readable by the owner.
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, file_path)
+
+
+class RunProgress:
+    """
+    Completion markers of a story, saved in the story directory as progress.json. Used to resume a story that failed
+    halfway through (see generate_story_outline), skipping the stages and chapters that are already done.
+    {"stages": ["general", ...], "chapters": {"scenes": [1, 2], "draft": [1]}}
+    A marker is only saved after the data it marks is saved.
+    """
+
+    def __init__(self, story_dir: Path):
+        self.story_dir = story_dir
+        self.path = story_dir / PROGRESS_FILE_NAME
+        self.stages: list[str] = []
+        self.chapters: dict[str, list[int]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                progress = json.load(f)
+            self.stages = progress.get("stages", [])
+            self.chapters = progress.get("chapters", {})
+
+    def is_complete(self, stage: str, chapter: int | None = None) -> bool:
+        with self._lock:
+            if chapter is None:
+                return stage in self.stages
+            return chapter in self.chapters.get(stage, [])
+
+    def mark_complete(self, stage: str, chapter: int | None = None) -> None:
+        """Marks a stage, or one chapter of a stage, as complete."""
+        with self._lock:
+            if chapter is None:
+                if stage in self.stages:
+                    return
+                self.stages.append(stage)
+            else:
+                chapters = self.chapters.setdefault(stage, [])
+                if chapter in chapters:
+                    return
+                chapters.append(chapter)
+                chapters.sort()
+
+            self.story_dir.mkdir(parents=True, exist_ok=True)
+            with atomic_open(self.path) as f:
+                json.dump({"stages": self.stages, "chapters": self.chapters}, f, indent=4)
+
+
+_progress: RunProgress | None = None
+_progress_lock = threading.Lock()
+
+
+def get_run_progress() -> RunProgress:
+    """Returns the completion markers of the current story (settings.story_dir)."""
+    global _progress
+    with _progress_lock:
+        if _progress is None or _progress.story_dir != settings.story_dir:
+            _progress = RunProgress(settings.story_dir)
+        return _progress
+
+
+def reset_run_progress() -> None:
+    global _progress
+    with _progress_lock:
+        _progress = None
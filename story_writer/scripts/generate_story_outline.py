@@ -1,9 +1,13 @@
+import logging
 from datetime import datetime
 from pathlib import Path
 
 from openai import Client
 
 from story_writer import settings
+from story_writer.checkpoint import get_story_data_writer, reset_story_data_writer
+from story_writer.metrics import metrics
+from story_writer.models.outline import StoryData
 from story_writer.outline import (
     generate_chapters,
     generate_characters,
@@ -13,33 +17,78 @@ from story_writer.outline import (
     generate_worldbuilding,
     regenerate_general_story_details,
 )
+from story_writer.resume import get_run_progress, reset_run_progress
 
+log = logging.getLogger(__name__)
 
-def generate_story_outline(client: Client, prompt: str) -> None:
+
+def generate_story_outline(
+    client: Client, prompt: str, stories_dir: Path | None = None, resume_dir: Path | None = None
+) -> StoryData:
     """
     Define the steps and call the relevant functions to output a full story outline.
 
-    :return: Each section saves its data in a StoryData object, which is "cached"
+    :param stories_dir: Directory the story directory is created in. Defaults to /stories/ in the project root.
+    :param resume_dir: Story directory of a story that failed halfway through. The stages (and chapters) marked as
+             complete in its progress.json are skipped, the outline is loaded from the story directory.
+    :return: The outline. Each section saves its data in a StoryData object, which is "cached"
              as a file in /stories/<story title>/story_data.(json|yaml)
+             LLM call metrics (tokens, latency, retries) per stage are saved in /stories/<story title>/metrics.json
+             A resumed story adds the metrics of the resumed run to the ones already saved.
+             With settings.pipeline.in_memory, the StoryData is handed from stage to stage instead of each stage
+             loading it from the file, and the saves are coalesced (see checkpoint.StoryDataWriter).
     """
 
-    stories_dir = Path(__file__).parents[2]
-
-    settings.story_dir = stories_dir / "stories" / f"{datetime.now().timestamp() * 1000:.0f} - "
-
-    # Generates the Title, Genres, Themes, and a Synopsis.
-    generate_general_story_details(client, prompt.strip())
-
-    # Uses the user-setting STORY_STRUCTURE_STYLE and story general data (above) to fill out the given story structure.
-    generate_story_structure(client, story_structure=settings.story_structure_style)
-
-    # Redo the General Story data after getting the story structure.
-    regenerate_general_story_details(client)
-
-    generate_worldbuilding(client)
+    if resume_dir:
+        settings.story_dir = resume_dir
+    else:
+        stories_dir = stories_dir or Path(__file__).parents[2] / "stories"
+        settings.story_dir = stories_dir / f"{datetime.now().timestamp() * 1000:.0f} - "
 
-    generate_characters(client)
+    metrics.reset()
+    reset_story_data_writer()
+    reset_run_progress()
+    progress = get_run_progress()
+    story_data = None
+    if resume_dir:
+        # The story directory is named after the story title, so the general stage can't be redone in place.
+        if not progress.is_complete("general"):
+            raise ValueError(f"Story '{resume_dir}' has no completed stages to resume from.")
+        story_data = StoryData.load_from_file(saved_dir=resume_dir)
+        # metrics.json keeps covering the earlier runs too.
+        metrics.load(resume_dir)
+        log.info(f"Resuming story '{resume_dir}', completed stages: {progress.stages}")
 
-    generate_chapters(client)
+    # Without in_memory, every stage loads the outline saved by the previous stage.
+    in_memory = settings.pipeline.in_memory
+    stages = [
+        # Generates the Title, Genres, Themes, and a Synopsis.
+        ("general", lambda data: generate_general_story_details(client, prompt.strip())),
+        # Uses the user-setting STORY_STRUCTURE_STYLE and story general data (above) to fill out the given story structure.
+        (
+            "structure",
+            lambda data: generate_story_structure(
+                client, story_structure=settings.story_structure_style, story_data=data
+            ),
+        ),
+        # Redo the General Story data after getting the story structure.
+        ("revise_general", lambda data: regenerate_general_story_details(client, data)),
+        ("worldbuilding", lambda data: generate_worldbuilding(client, data)),
+        ("characters", lambda data: generate_characters(client, data)),
+        ("chapters", lambda data: generate_chapters(client, data)),
+        ("scenes", lambda data: generate_scenes_for_chapter(client, data)),
+    ]
+    try:
+        for stage, generate in stages:
+            if get_run_progress().is_complete(stage):
+                continue
+            story_data = generate(story_data if in_memory else None)
+            get_story_data_writer().mark_complete(stage)
+    finally:
+        # Saves the last changes, if the saves were coalesced.
+        get_story_data_writer().flush()
+        # The story directory doesn't exist until the general story details are generated.
+        if settings.story_dir.exists():
+            metrics.save(settings.story_dir)
 
-    generate_scenes_for_chapter(client)
+    return story_data
@@ -1,14 +1,31 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from openai import Client
 
 from story_writer import llm, settings
+from story_writer.batch import run_batch, select_batch_output
+from story_writer.checkpoint import load_story_data
+from story_writer.metrics import metrics
 from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import ChapterData, SceneData
+from story_writer.prompt_budget import (
+    SeedSection,
+    abbreviate_characters,
+    fit_to_budget,
+    split_characters,
+    truncate_text,
+)
+from story_writer.prompt_layout import build_prefix_messages, get_structure_point_details
+from story_writer.rate_limit import estimate_text_tokens
+from story_writer.resume import atomic_open, get_run_progress
 
 log = logging.getLogger(__name__)
 
 
-def generate_story_rough_draft(client: Client):
+def generate_story_rough_draft(
+    client: Client, story_data: StoryData | None = None, chapter_numbers: list[int] | None = None
+):
     """
     Using the story outline data, iterate over each scene in each chapter, seeding the context with story details.
 
@@ -21,6 +38,13 @@ def generate_story_rough_draft(client: Client):
     :client: Client - OpenAI Client object used to generate chat completions with the LLM platform of choice.
     :title: str - Story name as it appears in the /stories/ directory (Including timestamp)
         ex. "Clawed Heroine - The Rise of Lila Leclair - 1738285520077"
+    :story_data: StoryData - The outline, ie as returned by generate_story_outline. Loaded from the story directory
+        if None. Stories saved in the split layout are loaded lazily, only the drafted chapters are read.
+    :chapter_numbers: list[int] - Drafts only these chapters. By default, every chapter that isn't drafted yet (a
+        resumed story, see resume.RunProgress).
+
+    LLM call metrics of the draft are saved in /stories/<story title>/metrics-draft.json, next to the outline's
+    metrics.json.
     """
     # project_root = Path(__file__).parents[2]  # ../StoryWriter/
     # print(f"{project_root=}")
@@ -32,71 +56,317 @@ def generate_story_rough_draft(client: Client):
 
     # TODO: Consider renaming StoryData to Outline or something similar? OutlineData.
     # story_data: StoryData = StoryData.load_from_file(saved_dir=story_root)
-    story_data: StoryData = StoryData.load_from_file(saved_dir=settings.story_dir)
-
-    for chapter in story_data.chapters:
-
-        scene_draft_array = []
-        for scene in chapter.scenes:
-            prompt = f"""
-                Expand on the scene's story beats, creating a rough draft. Elaborate, add detail, and dialogue.
-                            
-                Themes: {", ".join(story_data.general.themes)}
-                Genre: {", ".join(story_data.general.genres)}
-                Synopsis: {story_data.general.synopsis}
-                
-                Chapter {chapter.number}
-                Chapter Synopsis: {chapter.synopsis}
-                Chapter Story Point: {chapter.story_structure_point}
-                
-                Relevant Story Structure: {story_data.structure.model_dump().get(chapter.story_structure_point, 'Failed to get story structure point details.')}
-                
-                Scene {scene.number}
-                Characters in scene: {", ".join([f"{char.name}: {char.status}" for char in scene.characters])}          
-                Scene Location: {scene.location}
-                Scene Story Beats: {", ".join(scene.story_beats)}         
-            """
-            character_seed_str = ""
-            for char_dict in [char.dict() for char in story_data.characters]:
-                character_seed_str += ", ".join([f"{key}: {val}" for key, val in char_dict.items()])
-
-            messages = [
-                {"role": "system", "content": settings.basic_system_prompt},
-                {"role": "user", "content": f"Story characters:\n{character_seed_str}"},
-                {"role": "user", "content": prompt},
-            ]
-
-            scene_draft_array.append(
-                llm.get_validated_llm_output(
-                    client=client, messages=messages, log_file_name="first-draft", model_settings=settings.draft
+    story_data = load_story_data(story_data, lazy=True)
+    # The outline's metrics are already saved, in metrics.json.
+    metrics.reset()
+
+    try:
+        (settings.story_dir / "draft").mkdir(parents=True, exist_ok=True)
+
+        character_seed_str = ""
+        for char_dict in [char.dict() for char in story_data.characters]:
+            character_seed_str += ", ".join([f"{key}: {val}" for key, val in char_dict.items()])
+        if chapter_numbers is None:
+            progress = get_run_progress()
+            numbers = [number for number in story_data.chapter_numbers if not progress.is_complete("draft", number)]
+            if len(numbers) < len(story_data.chapter_numbers):
+                log.info(f"Resuming, {len(story_data.chapter_numbers) - len(numbers)} chapters are already drafted.")
+        else:
+            numbers = [number for number in story_data.chapter_numbers if number in chapter_numbers]
+        chapters = [story_data.get_chapter(number) for number in numbers]
+
+        # Built once, so every scene's prompt starts with the exact same messages. The budget leaves room for the
+        # longest scene instructions that follow it.
+        prefix_messages = None
+        if settings.prefix_stable_prompts:
+            suffix_tokens = max(
+                (
+                    estimate_text_tokens(scene_draft_prompt_suffix(story_data, chapter, scene))
+                    for chapter in chapters
+                    for scene in chapter.scenes
+                ),
+                default=0,
+            )
+            prefix_messages = build_prefix_messages(
+                story_data, settings.draft.prompt_token_budget, reserved=suffix_tokens
+            )
+
+        scene_count = sum(len(chapter.scenes) for chapter in chapters)
+        max_workers = min(settings.draft_max_concurrency, scene_count)
+        if settings.batch.draft:
+            draft_scenes_in_batch(client, story_data, character_seed_str, prefix_messages, chapters)
+        elif max_workers > 1:
+            log.info(f"Drafting {scene_count} scenes, {max_workers} at a time.")
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="draft")
+            try:
+                # Every scene is queued up front. Chapters are written as soon as their last scene is drafted.
+                scene_futures = {}
+                chapter_futures = {}
+                for chapter in chapters:
+                    chapter_futures[chapter.number] = []
+                    for scene in chapter.scenes:
+                        future = executor.submit(
+                            generate_scene_draft,
+                            client,
+                            story_data,
+                            chapter,
+                            scene,
+                            character_seed_str,
+                            prefix_messages,
+                        )
+                        scene_futures[future] = chapter
+                        chapter_futures[chapter.number].append(future)
+
+                    if not chapter.scenes:
+                        save_chapter_draft(chapter, [])
+
+                remaining = {chapter.number: len(chapter.scenes) for chapter in chapters}
+                for future in as_completed(scene_futures):
+                    chapter = scene_futures[future]
+                    future.result()  # Raise any exception from the worker thread.
+                    remaining[chapter.number] -= 1
+                    if remaining[chapter.number] == 0:
+                        # Futures were submitted in scene order, so the chapter is assembled in scene order.
+                        save_chapter_draft(chapter, [f.result() for f in chapter_futures[chapter.number]])
+            finally:
+                # Don't start any queued scenes if one of the scenes failed.
+                executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for chapter in chapters:
+                scene_draft_array = []
+                for scene in chapter.scenes:
+                    scene_draft_array.append(
+                        generate_scene_draft(client, story_data, chapter, scene, character_seed_str, prefix_messages)
+                    )
+                save_chapter_draft(chapter, scene_draft_array)
+    finally:
+        metrics.save(settings.story_dir, filename="metrics-draft.json")
+
+
+def draft_scenes_in_batch(
+    client: Client,
+    story_data: StoryData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+    chapters: list[ChapterData] | None = None,
+) -> None:
+    """
+    Sends the draft prompt of every scene as one batch job (see settings.batch), then writes the chapters.
+    Scenes without a usable result are drafted with regular LLM calls instead.
+    :param chapters: The chapters to draft. Defaults to every chapter.
+    """
+    if chapters is None:
+        chapters = story_data.chapters
+    requests = {
+        f"chapter-{chapter_index}-scene-{scene_index}": build_scene_draft_messages(
+            story_data, chapter, scene, character_seed_str, prefix_messages
+        )
+        for chapter_index, chapter in enumerate(chapters)
+        for scene_index, scene in enumerate(chapter.scenes)
+    }
+    results = run_batch(client, stage="draft", requests=requests, model_settings=settings.draft) if requests else {}
+
+    for chapter_index, chapter in enumerate(chapters):
+        scene_drafts = []
+        for scene_index, scene in enumerate(chapter.scenes):
+            scene_draft = select_batch_output(results.get(f"chapter-{chapter_index}-scene-{scene_index}", []))
+            if scene_draft is None:
+                log.warning(
+                    f"No batch result for chapter {chapter.number}, scene {scene.number}. Drafting it directly."
                 )
+                scene_draft = generate_scene_draft(
+                    client, story_data, chapter, scene, character_seed_str, prefix_messages
+                )
+            scene_drafts.append(scene_draft)
+        save_chapter_draft(chapter, scene_drafts)
+
+
+def generate_scene_draft(
+    client: Client,
+    story_data: StoryData,
+    chapter: ChapterData,
+    scene: SceneData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+) -> str:
+    """
+    Generates the rough draft of a single scene.
+
+    :param client: OpenAI Client object used to generate chat completions with the LLM platform of choice.
+    :param story_data: The story outline, used to seed the draft prompt.
+    :param chapter: The chapter the scene belongs to.
+    :param scene: The scene to draft.
+    :param character_seed_str: Pre-formatted character data used to seed the context.
+    :param prefix_messages: Shared prompt prefix (prompt_layout.build_prefix_messages). When set, only the chapter and
+      scene details follow it, and character_seed_str is unused.
+    :return: The scene draft text.
+    """
+    log.info(f"Drafting chapter {chapter.number}, scene {scene.number}.")
+    messages = build_scene_draft_messages(story_data, chapter, scene, character_seed_str, prefix_messages)
+    scene_draft, elapsed = llm.get_validated_llm_output(
+        client=client, messages=messages, log_file_name="first-draft", model_settings=settings.draft, stage="draft"
+    )
+    return scene_draft
+
+
+def build_scene_draft_messages(
+    story_data: StoryData,
+    chapter: ChapterData,
+    scene: SceneData,
+    character_seed_str: str,
+    prefix_messages: list[dict[str, str]] | None = None,
+) -> list[dict[str, str]]:
+    """Builds the messages of a scene's draft prompt. See generate_scene_draft for the parameters."""
+    if prefix_messages:
+        return [*prefix_messages, {"role": "user", "content": scene_draft_prompt_suffix(story_data, chapter, scene)}]
+    if settings.draft.prompt_token_budget:
+        return budgeted_scene_draft_messages(story_data, chapter, scene, settings.draft.prompt_token_budget)
+    return scene_draft_messages(story_data, chapter, scene, character_seed_str)
+
+
+def scene_draft_prompt_suffix(story_data: StoryData, chapter: ChapterData, scene: SceneData) -> str:
+    """The chapter and scene details that follow the shared prefix (prompt_layout.build_prefix_messages)."""
+    return f"""Expand on the scene's story beats, creating a rough draft. Elaborate, add detail, and dialogue.
+
+Chapter {chapter.number}
+Chapter Synopsis: {chapter.synopsis}
+Chapter Story Point: {chapter.story_structure_point}
+Relevant Story Structure: {get_structure_point_details(story_data.structure, chapter.story_structure_point)}
+
+Scene {scene.number}
+Characters in scene: {", ".join([f"{char.name}: {char.status}" for char in scene.characters])}
+Scene Location: {scene.location}
+Scene Story Beats: {", ".join(scene.story_beats)}
+"""
+
+
+def scene_draft_messages(
+    story_data: StoryData, chapter: ChapterData, scene: SceneData, character_seed_str: str
+) -> list[dict[str, str]]:
+    """Scene draft prompt, seeded with every character. Used without a draft prompt_token_budget."""
+    prompt = f"""
+        Expand on the scene's story beats, creating a rough draft. Elaborate, add detail, and dialogue.
+                    
+        Themes: {", ".join(story_data.general.themes)}
+        Genre: {", ".join(story_data.general.genres)}
+        Synopsis: {story_data.general.synopsis}
+        
+        Chapter {chapter.number}
+        Chapter Synopsis: {chapter.synopsis}
+        Chapter Story Point: {chapter.story_structure_point}
+        
+        Relevant Story Structure: {story_data.structure.model_dump().get(chapter.story_structure_point, 'Failed to get story structure point details.')}
+        
+        Scene {scene.number}
+        Characters in scene: {", ".join([f"{char.name}: {char.status}" for char in scene.characters])}          
+        Scene Location: {scene.location}
+        Scene Story Beats: {", ".join(scene.story_beats)}         
+    """
+
+    return [
+        {"role": "system", "content": settings.basic_system_prompt},
+        {"role": "user", "content": f"Story characters:\n{character_seed_str}"},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def budgeted_scene_draft_messages(
+    story_data: StoryData, chapter: ChapterData, scene: SceneData, token_budget: int
+) -> list[dict[str, str]]:
+    """
+    Scene draft prompt that fits in token_budget. Only the characters in the scene are seeded in full, the rest of the
+    cast is abbreviated or dropped, followed by the themes, the story synopsis, and the story structure point.
+    """
+    featured, others = split_characters(story_data.characters, [char.name for char in scene.characters])
+    synopsis = f"Synopsis: {story_data.general.synopsis}"
+    sections = [
+        SeedSection(
+            "Expand on the scene's story beats, creating a rough draft. Elaborate, add detail, and dialogue.",
+            required=True,
+        ),
+        SeedSection(
+            f"Themes: {', '.join(story_data.general.themes)}\nGenre: {', '.join(story_data.general.genres)}", priority=1
+        ),
+        SeedSection(synopsis, priority=2, abbreviated=truncate_text(synopsis, max_tokens=100)),
+        SeedSection(
+            f"Chapter {chapter.number}\n"
+            f"Chapter Synopsis: {chapter.synopsis}\n"
+            f"Chapter Story Point: {chapter.story_structure_point}",
+            required=True,
+        ),
+        SeedSection(
+            "Relevant Story Structure: "
+            f"{get_structure_point_details(story_data.structure, chapter.story_structure_point)}",
+            priority=3,
+        ),
+    ]
+    if featured:
+        sections.append(
+            SeedSection(
+                "Scene characters:\n" + "\n".join([c.list_key_values_str() for c in featured]),
+                priority=4,
+                abbreviated="Scene characters:\n" + abbreviate_characters(featured),
+            )
+        )
+    if others:
+        sections.append(
+            SeedSection(
+                "Other story characters:\n" + "\n".join([c.list_key_values_str() for c in others]),
+                priority=0,
+                abbreviated="Other story characters: " + ", ".join([c.name for c in others]),
             )
+        )
+    sections.append(
+        SeedSection(
+            f"Scene {scene.number}\n"
+            f"Characters in scene: {', '.join([f'{char.name}: {char.status}' for char in scene.characters])}\n"
+            f"Scene Location: {scene.location}\n"
+            f"Scene Story Beats: {', '.join(scene.story_beats)}",
+            required=True,
+        )
+    )
+
+    prompt = "\n\n".join(
+        fit_to_budget(sections, token_budget, reserved=estimate_text_tokens(settings.basic_system_prompt))
+    )
+    return [
+        {"role": "system", "content": settings.basic_system_prompt},
+        {"role": "user", "content": prompt},
+    ]
 
-        chapter_draft = f"{chapter.title}\n\n  ********************  \n\n"
-        for scene_draft in scene_draft_array:
-            chapter_draft += f"{scene_draft}\n\n\n  ********************  \n\n"
 
-        file_path = settings.story_dir / "draft" / f"Chapter-{chapter.number}.txt"
-        with open(file_path, "w+", encoding="utf-8") as f:
-            f.write(chapter_draft)
+def save_chapter_draft(chapter: ChapterData, scene_drafts: list[str]) -> None:
+    """Assembles the scene drafts, in order, into /draft/Chapter-N.txt, and marks the chapter as drafted."""
+    chapter_draft = f"{chapter.title}\n\n  ********************  \n\n"
+    for scene_draft in scene_drafts:
+        chapter_draft += f"{scene_draft}\n\n\n  ********************  \n\n"
+
+    file_path = settings.story_dir / "draft" / f"Chapter-{chapter.number}.txt"
+    log.info(f"Saving the rough draft of chapter {chapter.number} to {file_path}")
+    with atomic_open(file_path) as f:
+        f.write(chapter_draft)
+    get_run_progress().mark_complete("draft", chapter.number)
 
 
 if __name__ == "__main__":
     import argparse
+    from pathlib import Path
 
-    from openai import OpenAI
-
+    from story_writer.client import get_client, override_llm_url
 
-    print(settings.story_dir)
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--port",
-        type=str,
-        default="1234",
-    )
-    parser.add_argument("--host", type=str, default="http://127.0.0.1")
-    parser.add_argument("--api-key", type=str, default="story-writer")
+    parser.add_argument("--port", type=str, help="Overrides the port in the llm_url setting.")
+    parser.add_argument("--host", type=str, help="Overrides the host in the llm_url setting.")
+    parser.add_argument("--api-key", type=str, help="Overrides the api_key setting.")
+    parser.add_argument("--story-dir", type=Path, help="Directory of the outlined story to draft.")
+    parser.add_argument("--chapter", type=int, action="append", help="Drafts only this chapter. Can be repeated.")
     args = parser.parse_args()
+    if args.story_dir:
+        settings.story_dir = args.story_dir
+    print(settings.story_dir)
+    if args.host or args.port:
+        settings.llm_url = override_llm_url(settings.llm_url, args.host, args.port)
+    if args.api_key:
+        settings.api_key = args.api_key
 
-    client = OpenAI(base_url=f"{args.host}:{args.port}/v1", api_key=args.api_key)
-    generate_story_rough_draft(client=client)
+    generate_story_rough_draft(client=get_client(), chapter_numbers=args.chapter)
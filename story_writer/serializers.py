@@ -0,0 +1,163 @@
+"""
+File formats the outline (StoryData) can be saved in, see settings.save_story_file_type.
+
+    yaml     Human-readable. Uses the libyaml C loader/dumper when PyYAML was built with it.
+    json     Human-readable. Uses orjson when it's installed.
+    msgpack  Compact binary working copy, needs `pip install msgpack`. Export it to yaml/json to read it:
+             python -m story_writer.serializers "stories/<story>" --to yaml
+"""
+
+import argparse
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from story_writer import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+log = logging.getLogger(__name__)
+
+
+class Serializer(ABC):
+    """Converts the outline data (json compatible dicts/lists) to and from the contents of a file."""
+
+    # File extension, without the dot.
+    extension: str
+    # Name of the package to install when the serializer isn't available.
+    requires: str | None = None
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def dumps(self, data: Any) -> bytes: ...
+
+    @abstractmethod
+    def loads(self, content: bytes) -> Any: ...
+
+
+class YamlSerializer(Serializer):
+    extension = "yaml"
+
+    def __init__(self):
+        # The C implementation parses large outlines many times faster than the pure-Python one.
+        self.loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        self.dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+    def dumps(self, data: Any) -> bytes:
+        return yaml.dump(data, Dumper=self.dumper, default_flow_style=False, sort_keys=False, encoding="utf-8")
+
+    def loads(self, content: bytes) -> Any:
+        return yaml.load(content, Loader=self.loader)
+
+
+class JsonSerializer(Serializer):
+    extension = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        # Same output with or without orjson, which only supports an indent of 2.
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, content: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(content)
+        return json.loads(content)
+
+
+class MsgpackSerializer(Serializer):
+    extension = "msgpack"
+    requires = "msgpack"
+
+    @property
+    def available(self) -> bool:
+        return msgpack is not None
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, content: bytes) -> Any:
+        return msgpack.unpackb(content, raw=False)
+
+
+SERIALIZERS: dict[str, Serializer] = {}
+
+
+def register_serializer(file_type: str, serializer: Serializer) -> None:
+    """Adds (or replaces) the serializer of a file type."""
+    SERIALIZERS[file_type] = serializer
+
+
+register_serializer("yaml", YamlSerializer())
+register_serializer("json", JsonSerializer())
+register_serializer("msgpack", MsgpackSerializer())
+
+
+def get_serializer(file_type: str) -> Serializer:
+    try:
+        serializer = SERIALIZERS[file_type]
+    except KeyError:
+        raise ValueError(f"No serializer for file type '{file_type}'. Available: {list(SERIALIZERS)}") from None
+    if not serializer.available:
+        raise ValueError(f"The '{file_type}' file type needs the '{serializer.requires}' package to be installed.")
+    return serializer
+
+
+def find_saved_file(story_dir: Path, filename: str, file_type: str) -> tuple[Path, Serializer]:
+    """
+    Returns the saved file, and its serializer. Prefers the file_type, but falls back to the other file types, so
+    stories saved with a different save_story_file_type (or exported) can still be loaded.
+    """
+    file_types = [file_type, *[other for other in SERIALIZERS if other != file_type]]
+    for candidate in file_types:
+        serializer = SERIALIZERS[candidate]
+        file_path = story_dir / f"{filename}.{serializer.extension}"
+        if file_path.exists() and serializer.available:
+            return file_path, serializer
+    # Nothing saved, the preferred file type gives the clearest error.
+    return story_dir / f"{filename}.{get_serializer(file_type).extension}", get_serializer(file_type)
+
+
+def export_story_data(story_dir: Path, file_type: str) -> Path:
+    """
+    Saves a copy of the story's outline (story_data.<type>) in another file type, ie to read a msgpack outline.
+    The outline is loaded as settings.save_story_file_type, and the export is not kept up to date.
+    """
+    from story_writer.models.outline import StoryData
+
+    story_data = StoryData.load_from_file(saved_dir=story_dir)
+    serializer = get_serializer(file_type)
+    file_path = story_dir / f"story_data.{serializer.extension}"
+    file_path.write_bytes(serializer.dumps(story_data.model_dump(mode="json")))
+    log.info(f"Exported the outline of '{story_dir}' ({settings.save_story_file_type}) to {file_path}")
+    return file_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exports a story's outline to another file type.")
+    parser.add_argument("story_dir", type=Path)
+    parser.add_argument("--to", choices=list(SERIALIZERS), default="yaml", help="File type to export to.")
+    parser.add_argument("--from", dest="from_type", choices=list(SERIALIZERS), help="File type the story is saved as.")
+    args = parser.parse_args()
+    if args.from_type:
+        settings.save_story_file_type = args.from_type
+    print(export_story_data(args.story_dir, args.to))
+
+
+if __name__ == "__main__":
+    main()
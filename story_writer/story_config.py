@@ -35,6 +35,15 @@ class StageOverrideSettings(OverrideSettingsBase):
     model: str | None = None
     temperature: float | None = None
     frequency_penalty: float | None = None
+    # Number of choices to request per call. Every choice is validated and the first usable one is kept,
+    #  so n > 1 trades completion tokens for fewer sequential retries.
+    n: int | None = Field(default=None, ge=1)
+    # Set to False to never use the LLM response cache for this stage. Defaults to llm_cache.enabled.
+    #  Not passed to the OpenAI package.
+    cache: bool | None = None
+    # Estimated token budget of the prompt. Lower priority seed data (ie, characters that aren't in the scene) is
+    #  abbreviated, then dropped, to fit. Only used by the scenes and draft stages. Not passed to the OpenAI package.
+    prompt_token_budget: int | None = Field(default=None, gt=0)
     # User Defined Settings that I didn't explicitly set
     # OpenAI supports more settings than I have set, and
     # I don't need to recreate their stuff.
@@ -62,6 +71,183 @@ class OpenAiChatDefaultSettings(OverrideSettingsBase):
     n: int | None = Field(default=1, ge=1, description="Number of chat completions to create per call.")
 
 
+class LLMCacheSettings(BaseModel):
+    """
+    Persistent cache of LLM responses, keyed on the messages, the LLM settings, and the response format.
+    Identical calls (ie, re-running an outline after a crash) are served from disk instead of the LLM.
+    Works best with a low/pinned temperature, otherwise a cached response is just one of many possible responses.
+    """
+
+    enabled: bool = False
+    # Defaults to /stories/.llm_cache/
+    directory: Path | None = None
+    # Least recently used responses are removed once the cache grows past this size.
+    max_size_mb: float = Field(default=256, gt=0)
+
+
+class HttpClientSettings(BaseModel):
+    """
+    Transport settings for the http client shared by every LLM call.
+    Connections are pooled and kept alive between calls, so concurrent stages don't pay for a new connection per call.
+    """
+
+    # Should be at least as large as the highest *_max_concurrency setting.
+    max_connections: int = Field(default=64, ge=1)
+    max_keepalive_connections: int = Field(default=32, ge=0)
+    # Seconds an idle connection is kept open.
+    keepalive_expiry: float = Field(default=60.0, ge=0)
+    # Seconds to wait on the LLM. Long completions can take minutes.
+    timeout: float = Field(default=600.0, gt=0)
+    connect_timeout: float = Field(default=10.0, gt=0)
+    # Requires the "h2" package (pip install httpx[http2]).
+    http2: bool = False
+
+
+class RateLimitSettings(BaseModel):
+    """
+    Process-wide limits shared by every LLM call, and the retry/backoff policy for transient errors
+    (429 rate limits, 5xx server errors, dropped connections and timeouts).
+    """
+
+    # None means unlimited.
+    requests_per_second: float | None = Field(default=None, gt=0)
+    # Estimated from the prompt length and max_tokens, then corrected with the reported usage.
+    tokens_per_minute: int | None = Field(default=None, gt=0)
+    # Number of times a call is retried on a transient error before giving up.
+    max_retries: int = Field(default=5, ge=0)
+    # Exponential backoff (with jitter), in seconds. A Retry-After header from the server takes precedence.
+    backoff_base: float = Field(default=1.0, gt=0)
+    backoff_max: float = Field(default=60.0, gt=0)
+
+
+class LLMBackendSettings(BaseModel):
+    # URL to the LLM instance, ie "http://192.168.1.20:1234/v1"
+    url: str
+    # Defaults to the api_key setting.
+    api_key: str | None = None
+    # Share of the requests sent to this backend, relative to the other backends.
+    weight: float = Field(default=1.0, gt=0)
+
+
+class LoadBalancerSettings(BaseModel):
+    """
+    Spreads the LLM calls over several LLM platform instances (backends). Pair it with scenes_max_concurrency and
+    draft_max_concurrency, so there are enough calls in flight to keep every backend busy.
+    """
+
+    # When empty, every call goes to llm_url.
+    backends: list[LLMBackendSettings] = []
+    # least_outstanding: the backend with the fewest in-flight calls (relative to its weight).
+    # round_robin: weighted round-robin.
+    strategy: Literal["least_outstanding", "round_robin"] = "least_outstanding"
+    # A backend that fails (connection errors, timeouts, 5xx) this many calls in a row is ejected from the pool...
+    max_failures: int = Field(default=3, ge=1)
+    # ...for this many seconds.
+    ejection_time: float = Field(default=30.0, ge=0)
+
+
+class HedgingSettings(BaseModel):
+    """
+    Cuts the tail latency of non-streaming calls. When a call takes longer than most recent calls of its stage, a
+    duplicate request is sent (to another backend, with a load balancer), and the first valid response is used.
+    Costs the tokens of the discarded responses, see "hedges" in metrics.json.
+    """
+
+    enabled: bool = False
+    # Percentile (0-100) of the stage's recent call latencies a call has to exceed before it's duplicated.
+    percentile: float = Field(default=95.0, gt=0, lt=100)
+    # Number of recent calls per stage the percentile is taken from...
+    window: int = Field(default=50, ge=1)
+    # ...and the number of calls a stage needs before any of its calls are duplicated.
+    min_samples: int = Field(default=10, ge=1)
+    # Calls are never duplicated sooner than this many seconds after they're sent.
+    min_delay: float = Field(default=1.0, ge=0)
+    # Maximum number of duplicates per call, sent min_delay/percentile apart.
+    max_hedges: int = Field(default=1, ge=1)
+    # Send the duplicates to a different backend than the original request, if the load balancer has one.
+    other_backend: bool = True
+
+
+class FakeLLMSettings(BaseModel):
+    """
+    Replaces the LLM platform with a local, deterministic stand-in (story_writer.fake_llm) that returns synthetic,
+    schema-valid output. For load testing and benchmarking the pipeline without a model. Can also be run as a
+    standalone OpenAI-compatible server: python -m story_writer.fake_llm --port 1234
+    """
+
+    enabled: bool = False
+    # Same seed (and same requests) gives the same responses, including the injected failures.
+    seed: int = 0
+    # Seconds before the first token...
+    latency: float = Field(default=0.0, ge=0)
+    # ...varied by up to this fraction of the latency, either way.
+    latency_jitter: float = Field(default=0.0, ge=0, le=1)
+    # Output speed. None returns the whole output at once.
+    tokens_per_second: float | None = Field(default=None, gt=0)
+    # Tokens per streamed chunk.
+    chunk_tokens: int = Field(default=4, ge=1)
+    # Share (0-1) of the requests that fail with a 500 server error.
+    failure_rate: float = Field(default=0.0, ge=0, le=1)
+    # Share (0-1) of the structured output responses with broken json (cut off, trailing commas, code fences...).
+    malformed_json_rate: float = Field(default=0.0, ge=0, le=1)
+    # Length of the plain text (ie scene draft) responses, in tokens.
+    text_tokens: int = Field(default=300, ge=1)
+    # Number of items in the generated lists, per response_format name. Other lists get 2 items.
+    array_items: dict[str, int] = {"CharacterData": 4, "ChapterData": 6, "SceneData": 4}
+
+
+class BatchSettings(BaseModel):
+    """
+    Sends every scenes/draft request at once, as a batch job (a JSONL file of requests), instead of one call at a time.
+    Batch APIs are cheaper and have higher rate limits, but results can take up to the completion window.
+    Requests that fail in the batch fall back to a regular LLM call.
+    """
+
+    scenes: bool = False
+    draft: bool = False
+    # "openai": The OpenAI Batch API.
+    # "local": Sends the batch file through the chat completions endpoint, one request at a time. For testing, or LLM
+    #  platforms without a batch API.
+    executor: Literal["openai", "local"] = "openai"
+    completion_window: str = "24h"
+    # Seconds between batch status checks.
+    poll_interval: float = Field(default=60.0, gt=0)
+
+
+class PipelineSettings(BaseModel):
+    """
+    in_memory: generate_story_outline keeps the outline (StoryData) in memory and hands it from stage to stage, instead
+    of every stage loading the outline file and saving it again. Saves are coalesced: the outline is saved at most once
+    per checkpoint_interval, and once more when the outline is done (or fails).
+    journal: The scenes of each chapter are appended to story_data.journal.jsonl, instead of rewriting the whole
+    outline file after every chapter. The journal is compacted into the outline file every journal_compact_every
+    chapters and at the end of the scenes stage. Loading the outline replays any journal left over (ie after a crash).
+    """
+
+    in_memory: bool = False
+    # Minimum seconds between saves of the outline. 0 saves on every change.
+    checkpoint_interval: float = Field(default=10.0, ge=0)
+    journal: bool = False
+    # Number of journal entries before the journal is compacted into the outline file.
+    journal_compact_every: int = Field(default=25, ge=1)
+
+
+class CassetteSettings(BaseModel):
+    """
+    Records every LLM call of a story (request and response), and replays the recording in a later run instead of
+    calling the LLM. Reruns a story, or just its later stages, without spending inference, ie to profile or debug it.
+    Calls are matched on the request (messages, LLM settings, response format). Identical requests are replayed in the
+    order they were recorded, so retries replay the same way too.
+    """
+
+    # "record": Saves the calls to /stories/<story>/cassette.jsonl (or path).
+    # "replay": Serves the calls from the cassette at path.
+    mode: Literal["off", "record", "replay"] = "off"
+    path: Path | None = None
+    # When replaying, call the LLM for requests that aren't in the cassette, instead of raising an error.
+    allow_misses: bool = False
+
+
 class OutlineConfig(BaseModel):
     general: StageOverrideSettings = StageOverrideSettings()
     structure: StageOverrideSettings = StageOverrideSettings()
@@ -84,34 +270,75 @@ class Settings(BaseSettings):
         default="You are an experienced story author. You fill your story "
         "with worldbuilding and character defining details to fill out the story."
     )
+    # Lay out the chapter, scene, and draft prompts with a shared prefix (system prompt, then the story outline data)
+    #  followed by only the per-chapter/per-scene instructions. Lets LLM platforms with prompt (KV) caching, ie vLLM
+    #  or llama.cpp, reuse the shared prefix instead of processing the whole prompt for every call.
+    prefix_stable_prompts: bool = Field(default=False)
     # URL to the LLM instance, local or remote.
     llm_url: str = Field(default="http://localhost:1234/v1")
     # API Key for LLM platform. Can also use a .env file with API_KEY
     api_key: str = Field(default="LM Studio")
+    # Several LLM instances to spread the calls over, instead of llm_url.
+    load_balancer: LoadBalancerSettings = LoadBalancerSettings()
+    # Connection pool, keep-alive, and timeout settings for the LLM client.
+    http_client: HttpClientSettings = HttpClientSettings()
+    # Request/token rate limits and the retry policy for rate limit and server errors.
+    rate_limit: RateLimitSettings = RateLimitSettings()
+    # Duplicate requests for slow (non-streaming) calls.
+    hedging: HedgingSettings = HedgingSettings()
+    # Local stand-in for the LLM platform, for benchmarks.
+    fake_llm: FakeLLMSettings = FakeLLMSettings()
     # The type of outline/structure generated to help keep the outline on track.
     story_structure_style: StoryStructureEnum = Field(default=StoryStructureEnum.SEVEN_POINT_STORY_STRUCTURE)
     # Minimum required chapters for the outline.
     chapter_minimum_count: int = Field(default=5, ge=1)
     # Minimum number of scenes required for each chapter.
     scenes_per_chapter_minimum_count: int = Field(default=3, ge=1)
-    # File format that the story_data (or the separate files) are saved as.
-    save_story_file_type: Literal["json", "yaml"] = "yaml"
+    # File format that the story_data (or the separate files) are saved as. See story_writer/serializers.py
+    # msgpack is a compact binary format (needs the msgpack package), export it to yaml/json to read it.
+    save_story_file_type: Literal["json", "yaml", "msgpack"] = "yaml"
     # True: Saves all outline data into one story_data.json|yaml file.
     # False: Saves each outline component in separate files. Chapters/Scenes are saved in directories.
     consolidate_saved_output: bool = Field(default=True)
     # Number of retries to generate the scenes data. This section has proven to be particularly finicky.
     #  Will retry if the generated scenes are fewer than SCENES_PER_CHAPTER_MINIMUM_COUNT.
     scenes_per_chapter_retry_count: int = Field(default=30, gt=0)
+    # Max number of chapters to generate scenes for at the same time. 1 generates the scenes one chapter at a time.
+    #  Raise this if the LLM platform can handle (or batch) multiple requests at once. ie, vLLM.
+    scenes_max_concurrency: int = Field(default=1, ge=1)
     # Number of times to retry the chat completion upon pydantic model validation failure.
     llm_invalid_output_retry_count: int = Field(default=10, gt=0)
+    # Number of times to ask the LLM to fix an output that failed validation (by sending back the output and the
+    #  validation errors), before falling back to regenerating the output from scratch. 0 (the default) always
+    #  regenerates. Repairs count towards llm_invalid_output_retry_count.
+    llm_validation_repair_attempts: int = Field(default=0, ge=0)
     # Number of times to retry the chat completion upon receiving an empty output or bad json data (
     #   if validating a structured output against a pydantic model.).
     llm_empty_output_retry_count: int = Field(default=10, gt=0)
+    # Repair invalid json output locally before retrying the call. Fixes code fences, text around the json, trailing
+    #  commas, unescaped newlines in strings, and output cut off by max_tokens. Off by default, the output is used as
+    #  the LLM returned it.
+    llm_local_json_repair: bool = Field(default=False)
+    # When streaming structured output, stop the stream as soon as the output can no longer match the json schema,
+    #  instead of waiting for the rest of the (invalid) output to generate. The call is then retried. Only checks what
+    #  can't be valid json for the schema whatever follows, ie 1. in an integer field may still become 1.0.
+    stream_abort_on_invalid_output: bool = Field(default=True)
     # Per-outline-stage settings.
     stage: OutlineConfig = OutlineConfig()
     # Default LLM Settings if not provided a per-STAGE setting to override it.
     llm: OpenAiChatDefaultSettings
     draft: StageOverrideSettings = StageOverrideSettings()
+    # On-disk cache of LLM responses. Can be disabled per-stage with "cache: false".
+    llm_cache: LLMCacheSettings = LLMCacheSettings()
+    # Pass the outline between stages in memory, and save it less often.
+    pipeline: PipelineSettings = PipelineSettings()
+    # Record/replay of every LLM call of a story.
+    cassette: CassetteSettings = CassetteSettings()
+    # Max number of scenes to draft at the same time. 1 drafts the scenes one at a time, in order.
+    #  Chapters are still assembled in scene order, as soon as all of their scenes are drafted.
+    draft_max_concurrency: int = Field(default=1, ge=1)
+    # Batch (offline) mode for the scenes and draft stages.
+    batch: BatchSettings = BatchSettings()
 
     class Config:
         extra = "ignore"
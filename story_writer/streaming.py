@@ -0,0 +1,286 @@
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "-+.eE0123456789"
+NUMBER_PATTERN = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+LITERALS = {"t": "true", "f": "false", "n": "null"}
+JSON_TYPE_BY_FIRST_CHAR = {"{": "object", "[": "array", '"': "string", "t": "boolean", "f": "boolean", "n": "null"}
+
+
+class StreamValidationError(ValueError):
+    """Raised once streamed output can no longer become valid json that matches the schema."""
+
+
+@dataclass
+class ObjectFrame:
+    candidates: list[dict]
+    keys: set[str] = field(default_factory=set)
+    key: str | None = None
+
+
+@dataclass
+class ArrayFrame:
+    candidates: list[dict]
+
+
+class IncrementalJsonValidator:
+    """
+    Validates LLM output, one streamed chunk at a time, against the json schema used as the response_format.
+
+    Only checks what can be known before the output is complete: the output is a prefix of valid json, every value has
+    a type the schema allows, object keys are allowed (if the schema disallows additional properties), and objects
+    have all of their required keys when they're closed. Full validation is still done by the pydantic models.
+
+    Usage:
+        validator = IncrementalJsonValidator(response_format["json_schema"]["schema"])
+        for chunk in stream:
+            validator.feed(chunk)  # Raises StreamValidationError as soon as the output goes wrong.
+    """
+
+    def __init__(self, schema: dict[str, Any], allow_repairable: bool = False):
+        """
+        :param allow_repairable: Don't fail on mistakes json_repair.repair_json fixes once the output is complete:
+          text before/after the json value (ie, markdown code fences), trailing commas, and control characters in strings.
+        """
+        self._allow_repairable = allow_repairable
+        self._defs: dict[str, Any] = schema.get("$defs", {})
+        self._stack: list[ObjectFrame | ArrayFrame] = []
+        # Schemas the next value may match. An empty dict accepts any value.
+        self._pending: list[dict] = self._expand(schema)
+        self._mode = "value"
+        self._token = ""  # The in-progress object key, number, or true/false/null literal.
+        self._token_candidates: list[dict] = []
+        self._is_key = False
+        self._escaped = False
+        self._unicode_digits = 0
+        self.consumed = 0  # Number of characters fed into the validator. Used for error messages.
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level json value has been closed."""
+        return self._mode == "end"
+
+    def feed(self, text: str) -> None:
+        """
+        Consumes the next chunk of the output.
+
+        :raises StreamValidationError: The output can no longer match the schema.
+        """
+        for char in text:
+            self._feed_char(char)
+            self.consumed += 1
+
+    def _fail(self, reason: str) -> None:
+        raise StreamValidationError(f"{reason} (at character {self.consumed})")
+
+    def _expand(self, schema: dict) -> list[dict]:
+        """Resolves $refs and flattens anyOf/oneOf/allOf into a list of plain schemas."""
+        if "$ref" in schema:
+            name = schema["$ref"].split("/")[-1]
+            return self._expand(self._defs.get(name, {}))
+        for key in ("anyOf", "oneOf"):
+            if key in schema:
+                return [expanded for sub_schema in schema[key] for expanded in self._expand(sub_schema)]
+        if "allOf" in schema and len(schema["allOf"]) == 1:
+            return self._expand(schema["allOf"][0])
+        return [schema]
+
+    @staticmethod
+    def _allows_type(schema: dict, json_type: str) -> bool:
+        if "type" not in schema:
+            return True  # No type restrictions, ie "any" or a schema this validator doesn't understand.
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        return json_type in types or (json_type == "number" and "integer" in types)
+
+    @staticmethod
+    def _allows_fraction(schema: dict) -> bool:
+        if "type" not in schema:
+            return True
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        return "number" in types
+
+    def _start_value(self, char: str) -> None:
+        json_type = "number" if char in "-0123456789" else JSON_TYPE_BY_FIRST_CHAR.get(char)
+        if json_type is None:
+            self._fail(f"Unexpected character {char!r}, expected a json value")
+
+        candidates = [schema for schema in self._pending if self._allows_type(schema, json_type)]
+        if not candidates:
+            self._fail(f"Value of type '{json_type}' does not match the schema")
+
+        if json_type == "object":
+            self._stack.append(ObjectFrame(candidates=candidates))
+            self._mode = "object_start"
+        elif json_type == "array":
+            self._stack.append(ArrayFrame(candidates=candidates))
+            self._pending = [item for schema in candidates for item in self._expand(schema.get("items", {}))]
+            self._mode = "array_start"
+        elif json_type == "string":
+            self._is_key = False
+            self._mode = "string"
+        else:
+            self._token = char
+            self._token_candidates = candidates
+            self._mode = "literal"
+
+    def _end_value(self) -> None:
+        self._mode = "after_value" if self._stack else "end"
+
+    def _end_literal(self) -> None:
+        token = self._token
+        if token[0] in LITERALS:
+            if token != LITERALS[token[0]]:
+                self._fail(f"Invalid literal '{token}'")
+        elif not NUMBER_PATTERN.fullmatch(token):
+            self._fail(f"Invalid number '{token}'")
+        elif not float(token).is_integer() and not any(
+            self._allows_fraction(schema) for schema in self._token_candidates
+        ):
+            # Only checked once the number ends: 1. is the start of 1.0, and 1.5e1 is 15, both valid integers.
+            self._fail(f"Expected an integer, got '{token}'")
+        self._token = ""
+        self._end_value()
+
+    def _end_key(self) -> None:
+        frame = self._stack[-1]
+        try:
+            key = json.loads(f'"{self._token}"')
+        except ValueError:
+            key = self._token
+        self._token = ""
+
+        candidates = []
+        pending = []
+        for schema in frame.candidates:
+            properties = schema.get("properties", {})
+            if key in properties:
+                candidates.append(schema)
+                pending.extend(self._expand(properties[key]))
+            elif schema.get("additionalProperties", True) is not False:
+                candidates.append(schema)
+                additional = schema.get("additionalProperties", True)
+                pending.extend(self._expand(additional if isinstance(additional, dict) else {}))
+        if not candidates:
+            self._fail(f"Key '{key}' is not allowed by the schema")
+
+        frame.candidates = candidates
+        frame.keys.add(key)
+        frame.key = key
+        self._pending = pending
+        self._mode = "colon"
+
+    def _close_object(self) -> None:
+        frame = self._stack.pop()
+        if not any(set(schema.get("required", [])) <= frame.keys for schema in frame.candidates):
+            missing = set(frame.candidates[0].get("required", [])) - frame.keys
+            self._fail(f"Object is missing required keys: {', '.join(sorted(missing))}")
+        self._end_value()
+
+    def _feed_char(self, char: str) -> None:
+        mode = self._mode
+
+        if mode == "string":
+            if self._unicode_digits:
+                if char not in "0123456789abcdefABCDEF":
+                    self._fail("Invalid unicode escape")
+                self._unicode_digits -= 1
+            elif self._escaped:
+                self._escaped = False
+                if char == "u":
+                    self._unicode_digits = 4
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                if self._is_key:
+                    self._end_key()
+                else:
+                    self._end_value()
+                return
+            elif ord(char) < 0x20 and not self._allow_repairable:
+                self._fail("Unescaped control character in string")
+
+            if self._is_key:
+                self._token += char
+            return
+
+        if mode == "literal":
+            if char in WHITESPACE or char in ",]}":
+                self._end_literal()
+                self._feed_char(char)  # The character ends the literal, but still needs to be processed.
+                return
+            expected = LITERALS.get(self._token[0])
+            if expected:
+                if not expected.startswith(self._token + char):
+                    self._fail(f"Invalid literal '{self._token + char}'")
+            elif char not in NUMBER_CHARS:
+                self._fail(f"Invalid character {char!r} in number")
+            self._token += char
+            return
+
+        if char in WHITESPACE:
+            return
+
+        if mode == "value" and self._allow_repairable and self._stack and char == "]":
+            # Trailing comma in an array.
+            if not isinstance(self._stack[-1], ArrayFrame):
+                self._fail(f"Unexpected character {char!r}, expected a json value")
+            self._stack.pop()
+            self._end_value()
+
+        elif mode == "value" and self._allow_repairable and not self._stack and char not in "{[":
+            return  # Text before the json value.
+
+        elif mode == "value":
+            self._start_value(char)
+
+        elif mode == "object_start" and char == "}":
+            self._close_object()
+
+        elif mode == "object_key" and char == "}" and self._allow_repairable:
+            self._close_object()  # Trailing comma in an object.
+
+        elif mode in ("object_start", "object_key"):
+            if char != '"':
+                self._fail(f"Unexpected character {char!r}, expected an object key")
+            self._is_key = True
+            self._mode = "string"
+
+        elif mode == "colon":
+            if char != ":":
+                self._fail(f"Unexpected character {char!r}, expected ':'")
+            self._mode = "value"
+
+        elif mode == "array_start" and char == "]":
+            self._stack.pop()
+            self._end_value()
+
+        elif mode == "array_start":
+            self._start_value(char)
+
+        elif mode == "after_value":
+            frame = self._stack[-1]
+            if char == ",":
+                if isinstance(frame, ObjectFrame):
+                    self._mode = "object_key"
+                else:
+                    self._pending = [item for s in frame.candidates for item in self._expand(s.get("items", {}))]
+                    self._mode = "value"
+            elif char == "}" and isinstance(frame, ObjectFrame):
+                self._close_object()
+            elif char == "]" and isinstance(frame, ArrayFrame):
+                self._stack.pop()
+                self._end_value()
+            else:
+                self._fail(f"Unexpected character {char!r} after value")
+
+        elif mode == "end" and self._allow_repairable:
+            return  # Text after the json value.
+
+        elif mode == "end":
+            self._fail(f"Unexpected character {char!r} after the end of the json output")
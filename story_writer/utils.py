@@ -45,7 +45,7 @@ def log_step(
         "messages": messages,
         "model": model,
         "settings": settings,
-        "response_format": create_json_schema(response_model),
+        "response_format": create_json_schema(response_model) if response_model else None,
         "response_time": duration,
     }
 
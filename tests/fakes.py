@@ -0,0 +1,107 @@
+import json
+import threading
+from collections.abc import Callable
+from types import SimpleNamespace
+from typing import Any
+
+from openai.types.chat import ChatCompletion
+
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import ChapterData, CharacterData, GeneralData, SceneData
+from story_writer.models.outline_models.story_structure_models.seven_point import SevenPointStoryStructure
+
+
+def make_completion(content: str, typed: bool = False) -> Any:
+    """A one-choice chat completion. typed=True returns an openai ChatCompletion, otherwise a lightweight stand-in."""
+    if not typed:
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=SimpleNamespace(content=content))], usage=None)
+    return ChatCompletion.model_validate(
+        {
+            "id": "completion",
+            "created": 0,
+            "model": "test-model",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }
+    )
+
+
+class FakeCompletions:
+    """
+    Stands in for client.chat.completions. Records the arguments of every call in `calls`, and responds with:
+      - the next queued output: a str (the message content), a dict or list (dumped as json), or an Exception (raised),
+      - once the queue is empty, reply(messages): the message content, ie computed from the prompt,
+      - or create(**kwargs): the whole response, ie a mock.
+    Thread-safe, for tests of the concurrent stages.
+    """
+
+    def __init__(
+        self,
+        outputs: list[str | dict | list | Exception] | None = None,
+        reply: Callable[[list[dict]], str | dict | list] | None = None,
+        create: Callable[..., Any] | None = None,
+        typed: bool = False,
+    ):
+        self.outputs = list(outputs or [])
+        self.reply = reply
+        self._create = create
+        self.typed = typed
+        self.calls: list[dict] = []
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs) -> Any:
+        with self._lock:
+            self.calls.append(kwargs)
+            output = self.outputs.pop(0) if self.outputs else None
+        if output is None:
+            if self._create is not None:
+                return self._create(**kwargs)
+            if self.reply is None:
+                raise AssertionError("Unexpected LLM call, no outputs left.")
+            output = self.reply(kwargs["messages"])
+        if isinstance(output, Exception):
+            raise output
+        content = output if isinstance(output, str) else json.dumps(output)
+        return make_completion(content, typed=self.typed)
+
+
+def fake_client(
+    outputs: list[str | dict | list | Exception] | None = None,
+    reply: Callable[[list[dict]], str | dict | list] | None = None,
+    create: Callable[..., Any] | None = None,
+    typed: bool = False,
+) -> SimpleNamespace:
+    """An OpenAI client stand-in, see FakeCompletions. The fake is client.chat.completions."""
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(outputs, reply, create, typed)))
+
+
+def make_story_data(chapters: int, scenes: int = 0) -> StoryData:
+    """An outline with a structure, one character, and the given number of chapters, each with `scenes` scenes."""
+    return StoryData(
+        general=GeneralData(title="Title", themes=["Loss"], genres=["Fantasy"], synopsis="A synopsis."),
+        structure=SevenPointStoryStructure(
+            hook="hook",
+            plot_turn_1="turn 1",
+            pinch_point_1="pinch 1",
+            mid_point="mid",
+            pinch_point_2="pinch 2",
+            plot_turn_2="turn 2",
+            resolution="resolution",
+        ),
+        characters=[CharacterData(name="Kit", age=20, role="Hero", description="Tall", personality="Brave")],
+        chapters=[
+            ChapterData(
+                title=f"Chapter {number}",
+                number=number,
+                story_structure_point="Hook",
+                location="Camelot",
+                characters=[],
+                synopsis="Things happen.",
+                scenes=[
+                    SceneData(summary=f"Scene {scene}", number=scene, characters=[], location="Camelot", story_beats=[])
+                    for scene in range(1, scenes + 1)
+                ],
+            )
+            for number in range(1, chapters + 1)
+        ],
+    )
@@ -0,0 +1,108 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from openai.types import CompletionUsage
+
+from story_writer import settings
+from story_writer.batch import build_batch_request, read_batch_output, run_batch, select_batch_output
+from story_writer.metrics import metrics
+from story_writer.models.outline_models import GeneralData
+from tests.fakes import fake_client, make_completion
+
+VALID = {"title": "Title", "themes": ["Hope"], "genres": ["Fantasy"], "synopsis": "A synopsis."}
+
+
+class TestBatchFiles(unittest.TestCase):
+
+    def test_build_batch_request(self):
+        messages = [{"role": "user", "content": "Hi"}]
+        request = build_batch_request("id-1", messages, None, {"model": "m", "stream": True, "temperature": 0.5})
+
+        self.assertEqual(request["custom_id"], "id-1")
+        self.assertEqual(request["url"], "/v1/chat/completions")
+        self.assertEqual(request["body"], {"model": "m", "temperature": 0.5, "messages": messages})
+
+    def test_read_batch_output(self):
+        lines = [
+            {
+                "custom_id": "ok",
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [
+                            {"index": 1, "message": {"content": " second "}},
+                            {"index": 0, "message": {"content": "first"}},
+                        ]
+                    },
+                },
+                "error": None,
+            },
+            {"custom_id": "error", "response": None, "error": {"code": "server_error", "message": "Oops"}},
+            {"custom_id": "bad-status", "response": {"status_code": 500, "body": {}}, "error": None},
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "output.jsonl"
+            path.write_text("\n".join(json.dumps(line) for line in lines) + "\n", encoding="utf-8")
+            self.assertEqual(read_batch_output(path), {"ok": ["first", "second"]})
+
+    def test_select_batch_output(self):
+        invalid = json.dumps(dict(VALID, title=""))
+        other = json.dumps(dict(VALID, title="Other"))
+
+        self.assertEqual(select_batch_output([invalid, json.dumps(VALID)], GeneralData).title, "Title")
+        self.assertEqual(
+            select_batch_output([json.dumps(VALID), other], GeneralData, accept=lambda m: m.title == "Other").title,
+            "Other",
+        )
+        self.assertIsNone(select_batch_output([invalid], GeneralData))
+        self.assertIsNone(select_batch_output([]))
+        self.assertEqual(select_batch_output(["", "Draft"]), "Draft")
+
+
+class TestRunBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir, self.executor = settings.story_dir, settings.batch.executor
+        settings.story_dir = Path(self.temp_dir.name)
+        settings.batch.executor = "local"
+        metrics.reset()
+
+    def tearDown(self):
+        settings.story_dir, settings.batch.executor = self.story_dir, self.executor
+        metrics.reset()
+        self.temp_dir.cleanup()
+
+    def test_local_batch(self):
+        client = fake_client(reply=lambda messages: f"Reply to: {messages[-1]['content']}", typed=True)
+        completions = client.chat.completions
+        requests = {f"scene-{i}": [{"role": "user", "content": f"Scene {i}"}] for i in range(3)}
+
+        results = run_batch(client, "draft", requests)
+
+        self.assertEqual(results, {f"scene-{i}": [f"Reply to: Scene {i}"] for i in range(3)})
+        self.assertTrue((settings.story_dir / "batch" / "draft" / "input.jsonl").exists())
+
+        # The same requests pick the finished batch back up, without calling the LLM again.
+        self.assertEqual(run_batch(client, "draft", requests), results)
+        self.assertEqual(len(completions.calls), 3)
+
+    def test_batch_calls_are_in_the_metrics(self):
+        def create(messages, **kwargs):
+            completion = make_completion(f"Reply to: {messages[-1]['content']}", typed=True)
+            usage = CompletionUsage(prompt_tokens=10, completion_tokens=20, total_tokens=30)
+            return completion.model_copy(update={"usage": usage})
+
+        requests = {f"scene-{i}": [{"role": "user", "content": f"Scene {i}"}] for i in range(3)}
+        run_batch(fake_client(create=create), "draft", requests)
+
+        draft = metrics.summary()["stages"]["draft"]
+        self.assertEqual(draft["llm_calls"], 3)
+        self.assertEqual(draft["prompt_tokens"], 30)
+        self.assertEqual(draft["completion_tokens"], 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from story_writer.benchmark import BASE_CASE, compare_results, get_cases, get_scaling, scaling_exponent
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_get_cases(self):
+        cases = get_cases({"chapters": [2, 4], "scenes": [4, 8]}, file_types=["json"], consolidate=[True, False])
+
+        # The base case (chapters=4, scenes=4) is part of both sweeps, but only run once per layout.
+        self.assertEqual(len(cases), 6)
+        self.assertEqual(len({case.key for case in cases}), 6)
+
+    def test_scaling_exponent(self):
+        self.assertEqual(scaling_exponent([(2, 3.0), (4, 6.0), (8, 12.0)]), 1.0)
+        self.assertEqual(scaling_exponent([(2, 4.0), (4, 16.0), (8, 64.0)]), 2.0)
+        self.assertIsNone(scaling_exponent([(4, 1.0)]))
+
+    def test_get_scaling(self):
+        results = [
+            dict(BASE_CASE, chapters=chapters, file_type="json", consolidate=True, bytes_written=chapters**2 * 100)
+            for chapters in (2, 4, 8)
+        ]
+        for result in results:
+            result.update(wall_time=1.0, cpu_time=1.0, output_bytes=result["chapters"] * 10, peak_rss=None)
+
+        scaling = get_scaling(results, {"chapters": [2, 4, 8]})["chapters"]["json/consolidated"]
+        self.assertEqual(scaling["bytes_written"], 2.0)
+        self.assertEqual(scaling["output_bytes"], 1.0)
+        self.assertEqual(scaling["wall_time"], 0.0)
+        self.assertIsNone(scaling["peak_rss"])
+
+    def test_compare_results(self):
+        baseline = [{"key": "a", "wall_time": 1.0, "cpu_time": 1.0, "bytes_written": 1000, "output_bytes": 500}]
+        results = [{"key": "a", "wall_time": 5.0, "cpu_time": 1.1, "bytes_written": 2000, "output_bytes": 500}]
+
+        regressions = compare_results(results, baseline, threshold=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("bytes_written", regressions[0])
+        self.assertEqual(compare_results([{"key": "new", "cpu_time": 9.0}], baseline), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from story_writer.cache import ResponseCache, make_cache_key
+
+
+class TestMakeCacheKey(unittest.TestCase):
+    messages = [{"role": "system", "content": "prompt"}, {"role": "user", "content": "instructions"}]
+
+    def test_key_is_stable(self):
+        key = make_cache_key(self.messages, {"model": "a", "temperature": 0}, None)
+        self.assertEqual(key, make_cache_key(self.messages, {"temperature": 0, "model": "a"}, None))
+
+    def test_key_changes_with_inputs(self):
+        key = make_cache_key(self.messages, {"model": "a"}, None)
+        self.assertNotEqual(key, make_cache_key(self.messages, {"model": "b"}, None))
+        self.assertNotEqual(key, make_cache_key(self.messages[:1], {"model": "a"}, None))
+        self.assertNotEqual(key, make_cache_key(self.messages, {"model": "a"}, {"type": "json_schema"}))
+
+    def test_key_ignores_stream(self):
+        key = make_cache_key(self.messages, {"model": "a", "stream": True}, None)
+        self.assertEqual(key, make_cache_key(self.messages, {"model": "a", "stream": False}, None))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_set(self):
+        cache = ResponseCache(self.cache_dir, max_size_bytes=1024 * 1024)
+        self.assertIsNone(cache.get("missing"))
+        cache.set("key", ['{"title": "A Story"}'])
+        self.assertEqual(cache.get("key"), ['{"title": "A Story"}'])
+
+    def test_persists_between_instances(self):
+        ResponseCache(self.cache_dir, max_size_bytes=1024 * 1024).set("key", ["output"])
+        self.assertEqual(ResponseCache(self.cache_dir, max_size_bytes=1024 * 1024).get("key"), ["output"])
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.cache_dir, max_size_bytes=100)
+        cache.set("a", ["x" * 30])
+        cache.set("b", ["x" * 30])
+        cache.get("a")  # "b" is now the least recently used entry.
+        cache.set("c", ["x" * 30])
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertFalse((self.cache_dir / "b.json").exists())
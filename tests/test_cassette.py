@@ -0,0 +1,69 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from story_writer import cassette, llm, settings
+from story_writer.cassette import Cassette, CassetteMissError
+from tests.fakes import fake_client
+
+MESSAGES = [{"role": "user", "content": "Write the scene."}]
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "cassette.jsonl"
+        self.cassette_settings = settings.cassette.model_copy()
+
+    def tearDown(self):
+        settings.cassette = self.cassette_settings
+        cassette._cassette = None
+        self.temp_dir.cleanup()
+
+    def use_cassette(self, mode: str, allow_misses: bool = False) -> None:
+        settings.cassette.mode = mode
+        settings.cassette.path = self.path
+        settings.cassette.allow_misses = allow_misses
+        cassette._cassette = None
+
+    def call(self, client, content: str = "Write the scene.") -> str:
+        messages = [{"role": "user", "content": content}]
+        return llm.call_llm(client, messages, None, {"model": "m"}, stage="draft")
+
+    def test_record_and_replay(self):
+        self.use_cassette("record")
+        # An empty output is retried. The retry is an identical request, recorded after the first.
+        self.assertEqual(self.call(fake_client(["", "First draft"])), "First draft")
+        self.assertEqual(self.call(fake_client(["Second draft"])), "Second draft")
+
+        lines = [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([line["outputs"] for line in lines], [[""], ["First draft"], ["Second draft"]])
+        self.assertEqual(lines[0]["messages"], MESSAGES)
+        self.assertEqual(lines[0]["stage"], "draft")
+
+        self.use_cassette("replay")
+        client = fake_client([])
+        self.assertEqual(self.call(client), "First draft")
+        # The last recording of a request is served to any further identical requests.
+        self.assertEqual(self.call(client), "Second draft")
+        self.assertEqual(self.call(client), "Second draft")
+        self.assertEqual(client.chat.completions.calls, [])
+
+    def test_replay_miss(self):
+        self.path.write_text("", encoding="utf-8")
+        self.use_cassette("replay")
+        with self.assertRaises(CassetteMissError):
+            self.call(fake_client(["Draft"]))
+
+        self.use_cassette("replay", allow_misses=True)
+        self.assertEqual(self.call(fake_client(["Draft"])), "Draft")
+
+    def test_replay_requires_path(self):
+        with self.assertRaises(ValueError):
+            Cassette("replay")
+
+
+if __name__ == "__main__":
+    unittest.main()
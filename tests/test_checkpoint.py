@@ -0,0 +1,167 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import settings
+from story_writer.checkpoint import StoryDataWriter, get_story_data_writer, load_story_data, reset_story_data_writer
+from story_writer.journal import StoryJournal
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import ChapterData, SceneData
+
+
+class TestStoryDataWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir = settings.story_dir
+        settings.story_dir = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        settings.story_dir = self.story_dir
+        self.temp_dir.cleanup()
+
+    def test_saves_every_change_without_interval(self):
+        writer = StoryDataWriter(interval=0)
+        story_data = mock.Mock()
+        for _ in range(3):
+            writer.save(story_data)
+
+        self.assertEqual(story_data.save_to_file.call_count, 3)
+        self.assertEqual(writer.skipped_saves, 0)
+
+    def test_coalesces_saves(self):
+        writer = StoryDataWriter(interval=60)
+        first, second = mock.Mock(), mock.Mock()
+        writer.save(first)
+        writer.save(second)
+        writer.save(second)
+
+        self.assertEqual(first.save_to_file.call_count, 1)
+        second.save_to_file.assert_not_called()
+        self.assertEqual(writer.skipped_saves, 2)
+
+        writer.flush()
+        second.save_to_file.assert_called_once()
+        writer.flush()  # Nothing changed since.
+        second.save_to_file.assert_called_once()
+
+        writer.save(second, force=True)
+        self.assertEqual(second.save_to_file.call_count, 2)
+
+    def test_in_memory_setting(self):
+        pipeline = settings.pipeline.model_copy()
+        try:
+            settings.pipeline.in_memory = True
+            settings.pipeline.checkpoint_interval = 5
+            reset_story_data_writer()
+            self.assertEqual(get_story_data_writer().interval, 5)
+
+            settings.pipeline.in_memory = False
+            reset_story_data_writer()
+            self.assertEqual(get_story_data_writer().interval, 0)
+        finally:
+            settings.pipeline = pipeline
+            reset_story_data_writer()
+
+    def test_load_story_data_prefers_handed_over_outline(self):
+        story_data = mock.Mock()
+        self.assertIs(load_story_data(story_data), story_data)
+
+
+def make_chapter(number: int) -> ChapterData:
+    return ChapterData(
+        title=f"Chapter {number}",
+        number=number,
+        story_structure_point="Hook",
+        location="Camelot",
+        characters=[],
+        synopsis="Things happen.",
+    )
+
+
+def make_scenes(summary: str) -> list[SceneData]:
+    return [SceneData(summary=summary, number=1, characters=[], location="Camelot", story_beats=["A beat."])]
+
+
+class TestStoryDataJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir = settings.story_dir
+        self.file_type = settings.save_story_file_type
+        self.consolidate = settings.consolidate_saved_output
+        settings.story_dir = Path(self.temp_dir.name)
+        settings.save_story_file_type = "json"
+        settings.consolidate_saved_output = True
+        self.journal = StoryJournal(settings.story_dir)
+
+    def tearDown(self):
+        settings.story_dir = self.story_dir
+        settings.save_story_file_type = self.file_type
+        settings.consolidate_saved_output = self.consolidate
+        self.temp_dir.cleanup()
+
+    def test_patches_are_journaled_and_replayed(self):
+        writer = StoryDataWriter(journal=True, compact_every=10)
+        story_data = StoryData(chapters=[make_chapter(1), make_chapter(2)])
+        writer.save(story_data)
+
+        for index, summary in enumerate(["First", "Second"]):
+            story_data.chapters[index].scenes = make_scenes(summary)
+            writer.save_patch(story_data, ["chapters", index, "scenes"], story_data.chapters[index].scenes)
+
+        self.assertEqual(writer.saves, 1)
+        self.assertEqual(len(self.journal.read()), 2)
+        self.assertEqual(StoryData.load_from_file(settings.story_dir), story_data)
+
+        writer.compact(story_data)
+        self.assertEqual(writer.saves, 2)
+        self.assertFalse(self.journal.path.exists())
+        self.assertEqual(StoryData.load_from_file(settings.story_dir), story_data)
+
+    def test_compacts_every_n_entries(self):
+        writer = StoryDataWriter(journal=True, compact_every=2)
+        story_data = StoryData(chapters=[make_chapter(number) for number in range(1, 4)])
+        writer.save(story_data)
+        for index in range(3):
+            story_data.chapters[index].scenes = make_scenes(f"Scene {index}")
+            writer.save_patch(story_data, ["chapters", index, "scenes"], story_data.chapters[index].scenes)
+
+        self.assertEqual(writer.saves, 2)
+        self.assertEqual(len(self.journal.read()), 1)
+        self.assertEqual(StoryData.load_from_file(settings.story_dir), story_data)
+
+    def test_unsaved_outline_is_written_before_journaling(self):
+        writer = StoryDataWriter(interval=60, journal=True)
+        story_data = StoryData(chapters=[make_chapter(1)])
+        writer.save(StoryData())
+        writer.save(story_data)  # Coalesced, so the outline file has no chapters to patch.
+
+        story_data.chapters[0].scenes = make_scenes("First")
+        writer.save_patch(story_data, ["chapters", 0, "scenes"], story_data.chapters[0].scenes)
+        self.assertEqual(writer.saves, 2)
+        self.assertEqual(self.journal.read(), [])
+        self.assertEqual(StoryData.load_from_file(settings.story_dir), story_data)
+
+    def test_partly_written_entry_is_skipped(self):
+        story_data = StoryData(chapters=[make_chapter(1)])
+        story_data.save_to_file(settings.story_dir)
+        self.journal.append(["chapters", 0, "scenes"], make_scenes("First"))
+        with open(self.journal.path, mode="a", encoding="utf-8") as f:
+            f.write('{"path": ["chapters", 0, "sce')
+
+        loaded = StoryData.load_from_file(settings.story_dir)
+        self.assertEqual(loaded.chapters[0].scenes, make_scenes("First"))
+
+    def test_without_journal_every_patch_is_a_full_save(self):
+        writer = StoryDataWriter()
+        story_data = StoryData(chapters=[make_chapter(1)])
+        writer.save_patch(story_data, ["chapters", 0, "scenes"], [])
+        writer.save_patch(story_data, ["chapters", 0, "scenes"], [])
+        self.assertEqual(writer.saves, 2)
+        self.assertFalse(self.journal.path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+from story_writer import settings
+from story_writer.cli import cli
+from story_writer.client import override_llm_url
+
+
+class TestOverrideLlmUrl(unittest.TestCase):
+
+    def test_port_only(self):
+        self.assertEqual(
+            override_llm_url("https://llm.example.com:8443/api/v1", port="8080"), "https://llm.example.com:8080/api/v1"
+        )
+
+    def test_host_only(self):
+        self.assertEqual(override_llm_url("http://localhost:1234/api", host="10.0.0.5"), "http://10.0.0.5:1234/api")
+        # A url without a port keeps its default port.
+        self.assertEqual(
+            override_llm_url("https://llm.example.com/v1", host="other.example.com"), "https://other.example.com/v1"
+        )
+
+    def test_host_with_scheme(self):
+        self.assertEqual(
+            override_llm_url("http://localhost:1234/v1", host="https://llm.example.com", port=443),
+            "https://llm.example.com:443/v1",
+        )
+
+    def test_nothing_to_override(self):
+        self.assertEqual(override_llm_url("http://localhost:1234/v1"), "http://localhost:1234/v1")
+        self.assertEqual(override_llm_url("http://[::1]:1234/v1", port="5000"), "http://[::1]:5000/v1")
+
+
+class TestCliUrlOptions(unittest.TestCase):
+
+    def run_cli(self, *args: str) -> str:
+        """Returns the llm_url the cli would create its client with."""
+        with (
+            mock.patch.object(settings, "llm_url", "https://llm.example.com:8443/api/v1"),
+            mock.patch("sys.argv", ["story-writer", *args]),
+            mock.patch("story_writer.cli.get_client", side_effect=InterruptedError),
+        ):
+            with self.assertRaises(InterruptedError):
+                cli()
+            return settings.llm_url
+
+    def test_port_only(self):
+        self.assertEqual(self.run_cli("--port", "8080"), "https://llm.example.com:8080/api/v1")
+
+    def test_host_only(self):
+        self.assertEqual(self.run_cli("--host", "10.0.0.5"), "https://10.0.0.5:8443/api/v1")
+
+
+if __name__ == "__main__":
+    unittest.main()
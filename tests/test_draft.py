@@ -0,0 +1,72 @@
+import json
+import re
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import settings
+from story_writer.resume import get_run_progress, reset_run_progress
+from story_writer.scripts.generate_story_rough_draft import generate_story_rough_draft
+from tests.fakes import fake_client, make_story_data
+
+
+def draft_reply(messages: list[dict]) -> str:
+    """Later scenes answer sooner, so the scenes of a chapter finish in reverse order."""
+    chapter = re.search(r"Chapter (\d+)\n", messages[-1]["content"]).group(1)
+    scene = int(re.search(r"Scene (\d+)\n", messages[-1]["content"]).group(1))
+    time.sleep(0.02 * (4 - scene))
+    return f"Draft of chapter {chapter}, scene {scene}."
+
+
+class TestConcurrentDraft(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.multiple(settings, story_dir=Path(self.temp_dir.name), draft_max_concurrency=4)
+        self.patch.start()
+        reset_run_progress()
+
+    def tearDown(self):
+        self.patch.stop()
+        reset_run_progress()
+        self.temp_dir.cleanup()
+
+    def test_chapters_are_written_in_scene_order(self):
+        finished = []
+
+        def reply(messages: list[dict]) -> str:
+            draft = draft_reply(messages)
+            finished.append(draft)
+            return draft
+
+        story_data = make_story_data(chapters=3, scenes=3)
+        story_data.chapters[1].scenes = []
+        generate_story_rough_draft(fake_client(reply=reply), story_data)
+
+        # The calls didn't finish in scene order.
+        self.assertNotEqual(finished, sorted(finished))
+        for number, scenes in [(1, [1, 2, 3]), (2, []), (3, [1, 2, 3])]:
+            with self.subTest(chapter=number):
+                chapter_draft = (settings.story_dir / "draft" / f"Chapter-{number}.txt").read_text(encoding="utf-8")
+                drafts = re.findall(r"Draft of chapter (\d+), scene (\d+)\.", chapter_draft)
+                self.assertEqual(drafts, [(str(number), str(scene)) for scene in scenes])
+                self.assertTrue(chapter_draft.startswith(f"Chapter {number}\n"))
+                self.assertTrue(get_run_progress().is_complete("draft", number))
+
+    def test_metrics_are_saved_apart_from_the_outline_metrics(self):
+        outline_metrics = settings.story_dir / "metrics.json"
+        outline_metrics.write_text('{"stages": {"general": {}}}', encoding="utf-8")
+
+        generate_story_rough_draft(fake_client(reply=draft_reply), make_story_data(chapters=1, scenes=2))
+
+        self.assertEqual(outline_metrics.read_text(encoding="utf-8"), '{"stages": {"general": {}}}')
+        with open(settings.story_dir / "metrics-draft.json", encoding="utf-8") as f:
+            draft_metrics = json.load(f)
+        self.assertEqual(list(draft_metrics["stages"]), ["draft"])
+        self.assertEqual(draft_metrics["stages"]["draft"]["llm_calls"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
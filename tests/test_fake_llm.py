@@ -0,0 +1,87 @@
+import json
+import random
+import unittest
+
+import httpx
+import openai
+from openai import OpenAI
+
+from story_writer.fake_llm import FakeLLM, FakeLLMTransport, generate_from_schema
+from story_writer.models.outline_models import ChapterData, SceneData
+from story_writer.models.utils import _schema_registry, build_schema_registry, create_json_schema, get_type_adapter
+from story_writer.story_config import FakeLLMSettings
+
+MESSAGES = [{"role": "user", "content": "Write the story."}]
+
+
+def fake_client(fake_llm: FakeLLM) -> OpenAI:
+    http_client = httpx.Client(transport=FakeLLMTransport(fake_llm))
+    return OpenAI(base_url="http://fake-llm/v1", api_key="fake", http_client=http_client, max_retries=0)
+
+
+class TestSyntheticOutput(unittest.TestCase):
+
+    def test_every_schema(self):
+        build_schema_registry()
+        for model, entry in _schema_registry.items():
+            with self.subTest(model=model.__name__):
+                schema = entry.response_format["json_schema"]["schema"]
+                output = generate_from_schema(schema, random.Random(0), root=schema)
+                get_type_adapter(model).validate_json(json.dumps(output))
+
+    def test_array_items(self):
+        fake_llm = FakeLLM(FakeLLMSettings(array_items={"SceneData": 7}))
+        output = fake_llm.generate_output(create_json_schema(SceneData), random.Random(0))
+        self.assertEqual(len(json.loads(output)), 7)
+
+
+class TestFakeLLM(unittest.TestCase):
+
+    def test_deterministic(self):
+        def completion(fake_llm: FakeLLM) -> str:
+            response = fake_client(fake_llm).chat.completions.create(
+                model="m", messages=MESSAGES, response_format=create_json_schema(ChapterData)
+            )
+            return response.choices[0].message.content
+
+        first, second = FakeLLM(), FakeLLM()
+        self.assertEqual(completion(first), completion(second))
+        # The same request sent again (a retry) gets a different response.
+        self.assertNotEqual(completion(first), completion(FakeLLM()))
+        self.assertNotEqual(completion(FakeLLM(FakeLLMSettings(seed=1))), completion(FakeLLM()))
+
+    def test_streaming(self):
+        fake_llm = FakeLLM(FakeLLMSettings(chunk_tokens=2, text_tokens=50))
+        stream = fake_client(fake_llm).chat.completions.create(
+            model="m", messages=MESSAGES, n=2, stream=True, stream_options={"include_usage": True}
+        )
+        chunks = list(stream)
+
+        outputs = {}
+        for chunk in chunks:
+            for choice in chunk.choices:
+                self.assertLessEqual(len(choice.delta.content or ""), 8)
+                outputs[choice.index] = outputs.get(choice.index, "") + (choice.delta.content or "")
+        self.assertEqual(len(outputs), 2)
+        self.assertGreaterEqual(len(outputs[0]), 200)
+        self.assertEqual(chunks[-1].usage.completion_tokens, sum(len(text) // 4 for text in outputs.values()))
+
+    def test_injected_failures(self):
+        client = fake_client(FakeLLM(FakeLLMSettings(failure_rate=1.0)))
+        with self.assertRaises(openai.InternalServerError):
+            client.chat.completions.create(model="m", messages=MESSAGES)
+
+        client = fake_client(FakeLLM(FakeLLMSettings(malformed_json_rate=1.0)))
+        response_format = create_json_schema(ChapterData)
+        for _ in range(5):
+            content = (
+                client.chat.completions.create(model="m", messages=MESSAGES, response_format=response_format)
+                .choices[0]
+                .message.content
+            )
+            with self.assertRaises(json.JSONDecodeError):
+                json.loads(content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from story_writer import hedging, llm, settings
+from story_writer.hedging import LatencyTracker, get_hedge_delay, latency_tracker, run_hedged
+from story_writer.load_balancer import Backend, LoadBalancedClient, LoadBalancer
+from story_writer.metrics import MetricsCollector
+from story_writer.models.outline_models import GeneralData
+from story_writer.models.utils import create_json_schema
+from story_writer.rate_limit import RateLimiter
+
+VALID = {"title": "Title", "themes": ["Hope"], "genres": ["Fantasy"], "synopsis": "A synopsis."}
+
+
+class TestRunHedged(unittest.TestCase):
+
+    def test_fast_call_is_not_hedged(self):
+        hedges = []
+        result, hedge_won = run_hedged(lambda: "fast", lambda r: True, delay=1.0, on_hedge=lambda: hedges.append(1))
+
+        self.assertEqual(result, "fast")
+        self.assertFalse(hedge_won)
+        self.assertEqual(hedges, [])
+
+    def test_duplicate_wins_and_loser_is_discarded(self):
+        calls = []
+        discarded = []
+        loser_done = threading.Event()
+
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                return "slow"
+            return "fast"
+
+        def discard(result):
+            discarded.append(result)
+            loser_done.set()
+
+        result, hedge_won = run_hedged(call, lambda r: True, delay=0.05, on_discard=discard)
+
+        self.assertEqual(result, "fast")
+        self.assertTrue(hedge_won)
+        self.assertTrue(loser_done.wait(2))
+        self.assertEqual(discarded, ["slow"])
+
+    def test_waits_for_a_valid_result(self):
+        calls = []
+        discarded = []
+
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                return "valid"
+            return "invalid"
+
+        result, hedge_won = run_hedged(call, lambda r: r == "valid", delay=0.05, on_discard=discarded.append)
+
+        self.assertEqual(result, "valid")
+        self.assertFalse(hedge_won)
+        self.assertEqual(discarded, ["invalid"])
+
+    def test_every_call_fails(self):
+        def call():
+            raise ValueError("Oops")
+
+        with self.assertRaises(ValueError):
+            run_hedged(call, lambda r: True, delay=0.05)
+
+    def test_queued_calls_are_not_hedged(self):
+        # More callers than hedge threads: a call's delay only starts counting once it runs.
+        hedges = []
+        with (
+            mock.patch.object(hedging, "_executor", ThreadPoolExecutor(max_workers=2)),
+            ThreadPoolExecutor(max_workers=6) as callers,
+        ):
+            futures = [
+                callers.submit(
+                    run_hedged,
+                    lambda: time.sleep(0.1) or "done",
+                    lambda r: True,
+                    delay=0.2,
+                    on_hedge=lambda: hedges.append(1),
+                )
+                for _ in range(6)
+            ]
+            results = [future.result()[0] for future in futures]
+
+        self.assertEqual(results, ["done"] * 6)
+        self.assertEqual(hedges, [])
+
+    def test_executor_fits_every_call_and_its_duplicates(self):
+        with (
+            mock.patch.object(hedging, "_executor", None),
+            mock.patch.multiple(settings, scenes_max_concurrency=4, draft_max_concurrency=8),
+            mock.patch.object(settings.hedging, "max_hedges", 2),
+        ):
+            self.assertEqual(hedging.get_hedge_executor()._max_workers, 24)
+            hedging._executor.shutdown()
+
+
+class TestHedgeDelay(unittest.TestCase):
+
+    def setUp(self):
+        self.hedging = settings.hedging.model_copy()
+        settings.hedging.enabled = True
+        settings.hedging.min_samples = 4
+        settings.hedging.min_delay = 0.0
+
+    def tearDown(self):
+        settings.hedging = self.hedging
+
+    def test_percentile(self):
+        tracker = LatencyTracker(window=4)
+        for latency in [9.0, 1.0, 2.0, 3.0, 4.0]:
+            tracker.record("scenes", latency)
+
+        self.assertEqual(tracker.percentile("scenes", 50), 2.0)
+        self.assertEqual(tracker.percentile("scenes", 95), 4.0)
+        self.assertIsNone(tracker.percentile("scenes", 95, min_samples=5))
+        self.assertIsNone(tracker.percentile("draft", 95))
+
+    def test_hedge_delay_needs_samples(self):
+        with mock.patch.object(latency_tracker, "_latencies", {}):
+            for latency in [0.1, 0.2, 0.3]:
+                latency_tracker.record("test", latency)
+            self.assertIsNone(get_hedge_delay("test"))
+
+            latency_tracker.record("test", 0.4)
+            self.assertEqual(get_hedge_delay("test"), 0.4)
+
+            settings.hedging.min_delay = 1.0
+            self.assertEqual(get_hedge_delay("test"), 1.0)
+
+            settings.hedging.enabled = False
+            self.assertIsNone(get_hedge_delay("test"))
+
+
+def completion(content: str, completion_tokens: int = 10) -> SimpleNamespace:
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=100, completion_tokens=completion_tokens, total_tokens=100 + completion_tokens
+        ),
+    )
+
+
+class TestHedgedCalls(unittest.TestCase):
+
+    def setUp(self):
+        self.hedging = settings.hedging.model_copy()
+        settings.hedging.enabled = True
+        settings.hedging.min_samples = 1
+        settings.hedging.min_delay = 0.0
+        self.response_format = create_json_schema(GeneralData)
+
+    def tearDown(self):
+        settings.hedging = self.hedging
+
+    def test_duplicate_goes_to_another_backend(self):
+        def slow(**kwargs):
+            time.sleep(0.3)
+            return completion(json.dumps(VALID), completion_tokens=50)
+
+        fast = mock.Mock(return_value=completion(json.dumps(VALID)))
+        backends = [
+            Backend(url="slow", client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=slow)))),
+            Backend(url="fast", client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=fast)))),
+        ]
+        client = LoadBalancedClient(LoadBalancer(backends, strategy="round_robin"))
+        collector = MetricsCollector()
+
+        with (
+            mock.patch.object(llm, "get_rate_limiter", return_value=RateLimiter()),
+            mock.patch.object(llm, "metrics", collector),
+            mock.patch.object(latency_tracker, "_latencies", {}),
+        ):
+            latency_tracker.record("test", 0.05)
+            outputs = llm.request_llm_outputs(
+                client, [{"role": "user", "content": "Hi"}], self.response_format, {"stream": False}, stage="test"
+            )
+            time.sleep(0.4)  # Let the slow request finish in the background.
+
+        self.assertEqual(json.loads(outputs[0]), VALID)
+        self.assertEqual(fast.call_count, 1)
+        self.assertEqual([backend.outstanding for backend in backends], [0, 0])
+        hedges = collector.summary()["stages"]["test"]["hedges"]
+        self.assertEqual(hedges, {"sent": 1, "won": 1, "wasted_prompt_tokens": 100, "wasted_completion_tokens": 50})
+
+    def test_usable_completion(self):
+        self.assertTrue(llm.is_usable_completion(completion(json.dumps(VALID)), self.response_format))
+        self.assertTrue(llm.is_usable_completion(completion("Plain text"), None))
+        self.assertFalse(llm.is_usable_completion(completion(""), None))
+        self.assertFalse(llm.is_usable_completion(completion('{"title": 5}'), self.response_format))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from story_writer.json_repair import repair_json
+
+
+class TestRepairJson(unittest.TestCase):
+
+    def test_repairs(self):
+        test_cases = [
+            ('{"a": 1}', {"a": 1}),
+            ('```json\n{"a": 1}\n```', {"a": 1}),
+            ('Here is the JSON:\n[1, 2] Hope this helps! {"not": "this"}', [1, 2]),
+            ('{"a": [1, 2,], "b": {"c": "d",},}', {"a": [1, 2], "b": {"c": "d"}}),
+            ('{"a": "line 1\nline 2\ttab"}', {"a": "line 1\nline 2\ttab"}),
+            ('{"a": "brace } and \\"quote\\" in a string"}', {"a": 'brace } and "quote" in a string'}),
+        ]
+        for text, expected in test_cases:
+            with self.subTest(text=text):
+                self.assertEqual(json.loads(repair_json(text)), expected)
+
+    def test_repairs_cut_off_output(self):
+        test_cases = [
+            ('[{"title": "One"}, {"title": "Tw', [{"title": "One"}, {"title": "Tw"}]),
+            ('[{"title": "One"}, {"ti', [{"title": "One"}, {}]),
+            ('{"a": 1, "b":', {"a": 1}),
+            ('{"a": 1, "b": ', {"a": 1}),
+            ('{"a": 1, "b"', {"a": 1}),
+            ('{"a": 1,', {"a": 1}),
+            ('{"a": tr', {}),
+            ('{"a": 1, "b": 2.', {"a": 1}),
+            ('{"a": 12', {"a": 12}),
+            ('{"a": ["x", "y', {"a": ["x", "y"]}),
+            ('{"a": "ends with a backslash \\', {"a": "ends with a backslash "}),
+            ('```json\n{"a": {"b": [', {"a": {"b": []}}),
+        ]
+        for text, expected in test_cases:
+            with self.subTest(text=text):
+                self.assertEqual(json.loads(repair_json(text)), expected)
+
+    def test_not_json(self):
+        self.assertIsNone(repair_json("No json here."))
+
+
+if __name__ == "__main__":
+    unittest.main()
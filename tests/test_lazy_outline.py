@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import settings
+from story_writer.journal import StoryJournal
+from story_writer.models.outline import LazyStoryData, StoryData
+from story_writer.models.outline_models import ChapterData, CharacterData, GeneralData, SceneData
+
+
+def make_story_data(chapters: int = 3) -> StoryData:
+    return StoryData(
+        general=GeneralData(title="Title", genres=["Fantasy"], themes=["Loss"], synopsis="Things happen."),
+        characters=[
+            CharacterData(name=name, age=30, role="Lead", description="Tall.", personality="Kind.")
+            for name in ["Zed", "Ann"]
+        ],
+        chapters=[
+            ChapterData(
+                title=f"Chapter {number}",
+                number=number,
+                story_structure_point="Hook",
+                location="Camelot",
+                characters=[],
+                synopsis="Things happen.",
+                scenes=[
+                    SceneData(summary=f"Scene {scene}", number=scene, characters=[], location="Camelot", story_beats=[])
+                    for scene in range(1, 12)
+                ],
+            )
+            for number in range(1, chapters + 1)
+        ],
+    )
+
+
+class TestLazyStoryData(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir = Path(self.temp_dir.name)
+        self.consolidate = settings.consolidate_saved_output
+        self.file_type = settings.save_story_file_type
+        settings.consolidate_saved_output = False
+        settings.save_story_file_type = "json"
+        self.story_data = make_story_data()
+        self.story_data.save_to_file(self.story_dir)
+
+    def tearDown(self):
+        settings.consolidate_saved_output = self.consolidate
+        settings.save_story_file_type = self.file_type
+        self.temp_dir.cleanup()
+
+    def test_matches_full_load(self):
+        lazy = StoryData.load_lazily(self.story_dir)
+        self.assertIsInstance(lazy, LazyStoryData)
+        self.assertEqual(lazy.to_story_data(), self.story_data)
+        # Characters keep their order, rather than the order of the files.
+        self.assertEqual([character.name for character in lazy.characters], ["Zed", "Ann"])
+        self.assertEqual([scene.number for scene in lazy.chapters[0].scenes], list(range(1, 12)))
+
+    def test_loads_only_what_is_used(self):
+        lazy = StoryData.load_lazily(self.story_dir)
+        with mock.patch.object(ChapterData, "load_from_file", wraps=ChapterData.load_from_file) as load_chapter:
+            self.assertEqual(lazy.chapter_numbers, [1, 2, 3])
+            self.assertEqual(lazy.get_chapter(2), self.story_data.chapters[1])
+            self.assertEqual(lazy.chapters[-2], self.story_data.chapters[1])
+            load_chapter.assert_called_once()
+
+        self.assertEqual(lazy.general, self.story_data.general)
+        self.assertEqual(list(lazy._sections), ["general"])
+
+    def test_applies_journal(self):
+        scenes = self.story_data.chapters[2].scenes[:1]
+        StoryJournal(self.story_dir).append(["chapters", 2, "scenes"], scenes)
+        StoryJournal(self.story_dir).append(["general", "title"], "New title")
+
+        lazy = StoryData.load_lazily(self.story_dir)
+        self.assertEqual(lazy.chapters[2].scenes, scenes)
+        self.assertEqual(lazy.chapters[1], self.story_data.chapters[1])
+        self.assertEqual(lazy.general.title, "New title")
+        self.assertEqual(lazy.to_story_data(), StoryData.load_from_file(self.story_dir))
+
+    def test_consolidated_story_is_loaded_in_full(self):
+        settings.consolidate_saved_output = True
+        self.story_data.save_to_file(self.story_dir)
+        self.assertIsInstance(StoryData.load_lazily(self.story_dir), StoryData)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import unittest
+from unittest import mock
+
+import pydantic
+
+from story_writer import llm, settings
+from story_writer.models.outline_models import GeneralData
+from tests.fakes import FakeCompletions, fake_client
+
+VALID = {"title": "Title", "themes": ["Hope"], "genres": ["Fantasy"], "synopsis": "A synopsis."}
+INVALID = dict(VALID, title="", synopsis="")
+
+
+class TestValidationRepair(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [{"role": "user", "content": "Generate the story."}]
+        self.repair_attempts = settings.llm_validation_repair_attempts
+        settings.llm_validation_repair_attempts = 2
+
+    def tearDown(self):
+        settings.llm_validation_repair_attempts = self.repair_attempts
+
+    def run_llm(self, outputs: list[dict | str]) -> tuple[GeneralData, FakeCompletions]:
+        client = fake_client(outputs)
+        model, _ = llm.get_validated_llm_output(client, self.messages, "test", GeneralData, stage="test")
+        return model, client.chat.completions
+
+    def test_repair_turn_sends_output_and_errors(self):
+        model, completions = self.run_llm([INVALID, VALID])
+
+        self.assertEqual(model.title, "Title")
+        repair_messages = completions.calls[1]["messages"]
+        self.assertEqual(repair_messages[:1], self.messages)
+        self.assertEqual(repair_messages[1], {"role": "assistant", "content": json.dumps(INVALID)})
+        self.assertIn("- title:", repair_messages[2]["content"])
+        self.assertIn("- synopsis:", repair_messages[2]["content"])
+        self.assertEqual(completions.calls[1]["n"], 1)
+
+    def test_falls_back_to_regeneration_after_failed_repairs(self):
+        model, completions = self.run_llm([INVALID, INVALID, INVALID, VALID])
+
+        self.assertEqual(model.title, "Title")
+        self.assertEqual([len(call["messages"]) for call in completions.calls], [1, 3, 3, 1])
+
+    def test_repairs_disabled(self):
+        settings.llm_validation_repair_attempts = 0
+        _, completions = self.run_llm([INVALID, VALID])
+
+        self.assertEqual(completions.calls[1]["messages"], self.messages)
+
+    def test_invalid_json_is_repaired_locally(self):
+        output = "```json\n" + json.dumps(VALID)[:-2]  # Code fence, and cut off before the closing quote.
+        with mock.patch.object(settings, "llm_local_json_repair", True):
+            model, completions = self.run_llm([output])
+
+        self.assertEqual(model.synopsis, "A synopsis.")
+        self.assertEqual(len(completions.calls), 1)
+
+
+class TestFormatValidationErrors(unittest.TestCase):
+
+    def test_compact_errors(self):
+        with self.assertRaises(pydantic.ValidationError) as context:
+            GeneralData.model_validate({"title": "Title", "themes": [""], "genres": ["Fantasy"]})
+        errors = llm.format_validation_errors(context.exception)
+
+        self.assertIn("- themes.0:", errors)
+        self.assertIn("- synopsis: Field required", errors)
+
+    def test_max_errors(self):
+        with self.assertRaises(pydantic.ValidationError) as context:
+            GeneralData.model_validate({})
+        errors = llm.format_validation_errors(context.exception, max_errors=2)
+
+        self.assertEqual(len(errors.splitlines()), 3)
+        self.assertIn("2 more errors", errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
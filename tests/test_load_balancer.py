@@ -0,0 +1,112 @@
+import time
+import unittest
+from collections import Counter
+from unittest import mock
+
+import httpx
+import openai
+
+from story_writer import llm
+from story_writer.load_balancer import Backend, LoadBalancedClient, LoadBalancer
+from story_writer.rate_limit import RateLimiter
+from tests.fakes import fake_client
+
+
+def connection_error() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://localhost:1234/v1/chat/completions"))
+
+
+class TestLoadBalancer(unittest.TestCase):
+
+    def make_balancer(self, weights: list[float], **kwargs) -> LoadBalancer:
+        backends = [Backend(url=f"backend-{i}", client=None, weight=weight) for i, weight in enumerate(weights)]
+        return LoadBalancer(backends, **kwargs)
+
+    def test_round_robin_weights(self):
+        balancer = self.make_balancer([1, 2, 1], strategy="round_robin")
+        picks = []
+        for _ in range(8):
+            backend = balancer.acquire()
+            picks.append(backend.url)
+            balancer.release(backend)
+        self.assertEqual(Counter(picks), {"backend-0": 2, "backend-1": 4, "backend-2": 2})
+
+    def test_least_outstanding(self):
+        balancer = self.make_balancer([1, 1, 2])
+        in_flight = [balancer.acquire() for _ in range(8)]
+        self.assertEqual(
+            Counter(backend.url for backend in in_flight), {"backend-0": 2, "backend-1": 2, "backend-2": 4}
+        )
+
+        for backend in in_flight:
+            if backend.url == "backend-0":
+                balancer.release(backend)
+        self.assertEqual(balancer.acquire().url, "backend-0")
+
+    def test_ejects_failing_backend(self):
+        balancer = self.make_balancer([1, 1], max_failures=2, ejection_time=0.05)
+        failing = balancer.backends[0]
+        for _ in range(2):
+            balancer.release(balancer.acquire(), failed=balancer.backends[0] is failing)
+        balancer.acquire()  # backend-1, now busy.
+        failing.outstanding += 1
+        balancer.release(failing, failed=True)
+
+        self.assertEqual(balancer.healthy_backends(), [balancer.backends[1]])
+        self.assertEqual({balancer.acquire().url for _ in range(3)}, {"backend-1"})
+
+        time.sleep(0.06)
+        self.assertIn(failing, balancer.healthy_backends())
+
+    def test_backend_with_one_failure_gets_traffic(self):
+        for strategy in ["least_outstanding", "round_robin"]:
+            with self.subTest(strategy=strategy):
+                balancer = self.make_balancer([1, 1], strategy=strategy, max_failures=3)
+                failed = balancer.acquire()
+                balancer.release(failed, failed=True)
+
+                in_flight = [balancer.acquire() for _ in range(10)]
+                self.assertEqual(Counter(backend.url for backend in in_flight), {"backend-0": 5, "backend-1": 5})
+                for backend in in_flight:
+                    balancer.release(backend)
+                self.assertEqual(failed.failures, 0)  # Reset by its next successful request.
+
+    def test_every_backend_ejected(self):
+        balancer = self.make_balancer([1, 1], max_failures=1, ejection_time=60)
+        for backend in balancer.backends:
+            backend.outstanding += 1
+            balancer.release(backend, failed=True)
+        self.assertEqual(balancer.healthy_backends(), [])
+        self.assertIsNotNone(balancer.acquire())
+
+
+class TestLoadBalancedCalls(unittest.TestCase):
+
+    def test_fails_over_to_another_backend(self):
+        down = mock.Mock(side_effect=connection_error())
+        up = mock.Mock(return_value="response")
+        balancer = LoadBalancer(
+            [Backend(url="down", client=fake_client(create=down)), Backend(url="up", client=fake_client(create=up))],
+            strategy="round_robin",
+        )
+        client = LoadBalancedClient(balancer)
+
+        with mock.patch.object(llm, "get_rate_limiter", return_value=RateLimiter()):
+            response, backend = llm.create_chat_completion(client, estimated_tokens=10, stage="test", messages=[])
+        balancer.release(backend)
+
+        self.assertEqual(response, "response")
+        self.assertEqual(backend.url, "up")
+        self.assertEqual(balancer.backends[0].failures, 1)
+        self.assertEqual([b.outstanding for b in balancer.backends], [0, 0])
+
+    def test_client_drop_in(self):
+        create = mock.Mock(return_value="response")
+        client = LoadBalancedClient(LoadBalancer([Backend(url="a", client=fake_client(create=create))]))
+
+        self.assertEqual(client.chat.completions.create(messages=[]), "response")
+        self.assertEqual(client.balancer.backends[0].outstanding, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from story_writer.metrics import CallMetrics, MetricsCollector
+
+
+class TestMetricsCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = MetricsCollector()
+        self.collector.record_call(CallMetrics(stage="scenes", latency=2.0, prompt_tokens=100, completion_tokens=50))
+        self.collector.record_call(
+            CallMetrics(stage="scenes", latency=4.0, time_to_first_token=0.5, prompt_tokens=100, completion_tokens=250)
+        )
+        self.collector.record_call(CallMetrics(stage="scenes", latency=0.0, cached=True))
+        self.collector.record_call(CallMetrics(stage="general", latency=1.0))
+        self.collector.record_retry("scenes", "validation")
+        self.collector.record_retry("general", "json_decode")
+
+    def test_stage_summary(self):
+        scenes = self.collector.summary()["stages"]["scenes"]
+        self.assertEqual(scenes["llm_calls"], 2)
+        self.assertEqual(scenes["cache_hits"], 1)
+        self.assertEqual(scenes["prompt_tokens"], 200)
+        self.assertEqual(scenes["completion_tokens"], 300)
+        self.assertEqual(scenes["total_latency"], 6.0)
+        self.assertEqual(scenes["mean_time_to_first_token"], 0.5)
+        self.assertEqual(scenes["tokens_per_second"], 50.0)
+        self.assertEqual(scenes["retries"]["validation"], 1)
+
+    def test_total_summary(self):
+        total = self.collector.summary()["total"]
+        self.assertEqual(total["llm_calls"], 3)
+        self.assertEqual(total["retries"]["validation"], 1)
+        self.assertEqual(total["retries"]["json_decode"], 1)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.collector.save(Path(tmp_dir))
+            with open(Path(tmp_dir) / "metrics.json", encoding="utf-8") as f:
+                saved = json.load(f)
+
+        self.assertEqual(set(saved["stages"]), {"scenes", "general"})
+        self.assertEqual(len(saved["calls"]), 4)
+        self.assertEqual(saved["calls"][0]["tokens_per_second"], 25.0)
+
+    def test_load(self):
+        self.collector.record_hedge("scenes")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.collector.save(Path(tmp_dir))
+            loaded = MetricsCollector()
+            loaded.record_call(CallMetrics(stage="draft", latency=1.0))
+            loaded.load(Path(tmp_dir))
+            loaded.load(Path(tmp_dir) / "missing")
+
+        summary = loaded.summary()
+        self.assertEqual(summary["stages"]["scenes"], self.collector.summary()["stages"]["scenes"])
+        self.assertEqual(summary["total"]["llm_calls"], 4)
+        self.assertEqual(summary["total"]["retries"]["json_decode"], 1)
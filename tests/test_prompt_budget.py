@@ -0,0 +1,60 @@
+import unittest
+
+from story_writer.models.outline_models import CharacterData
+from story_writer.prompt_budget import SeedSection, fit_to_budget, split_characters, truncate_text
+
+
+class TestFitToBudget(unittest.TestCase):
+
+    def setUp(self):
+        # ~25 tokens each at 4 characters per token.
+        self.sections = [
+            SeedSection("a" * 100, required=True),
+            SeedSection("b" * 100, priority=1, abbreviated="b"),
+            SeedSection("c" * 100, priority=0, abbreviated="c"),
+            SeedSection("d" * 100, priority=2),
+        ]
+
+    def test_no_budget_keeps_everything(self):
+        self.assertEqual(fit_to_budget(self.sections, None), [section.text for section in self.sections])
+
+    def test_within_budget_keeps_everything(self):
+        self.assertEqual(fit_to_budget(self.sections, 100), [section.text for section in self.sections])
+
+    def test_abbreviates_lowest_priority_first(self):
+        self.assertEqual(fit_to_budget(self.sections, 80), ["a" * 100, "b" * 100, "c", "d" * 100])
+
+    def test_abbreviates_before_dropping(self):
+        self.assertEqual(fit_to_budget(self.sections, 55), ["a" * 100, "b", "c", "d" * 100])
+
+    def test_drops_lowest_priority_first(self):
+        self.assertEqual(fit_to_budget(self.sections, 30), ["a" * 100])
+
+    def test_reserved_tokens_count_against_the_budget(self):
+        self.assertEqual(fit_to_budget(self.sections, 100, reserved=20), ["a" * 100, "b" * 100, "c", "d" * 100])
+
+    def test_keeps_required_sections_over_budget(self):
+        self.assertEqual(fit_to_budget(self.sections, 1), ["a" * 100])
+
+
+class TestPromptBudgetHelpers(unittest.TestCase):
+
+    def test_truncate_text_at_sentence(self):
+        text = "First sentence. Second sentence. " + "x" * 100
+        self.assertEqual(truncate_text(text, max_tokens=10), "First sentence. Second sentence. ...")
+
+    def test_truncate_short_text(self):
+        self.assertEqual(truncate_text("Short.", max_tokens=10), "Short.")
+
+    def test_split_characters(self):
+        characters = [
+            CharacterData(name=name, age=30, role="role", description="description", personality="personality")
+            for name in ("Kit", "Rex", "Ada")
+        ]
+        featured, others = split_characters(characters, ["kit", "Ada (disguised)"])
+        self.assertEqual([c.name for c in featured], ["Kit", "Ada"])
+        self.assertEqual([c.name for c in others], ["Rex"])
+
+
+if __name__ == "__main__":
+    unittest.main()
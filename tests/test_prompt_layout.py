@@ -0,0 +1,86 @@
+import unittest
+
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import CharacterData, GeneralData
+from story_writer.models.outline_models.story_structure_models.seven_point import SevenPointStoryStructure
+from story_writer.prompt_layout import (
+    PrefixTracker,
+    build_prefix_messages,
+    get_structure_point_details,
+    story_seed_prompt,
+)
+from story_writer.rate_limit import estimate_tokens
+
+
+def make_story_data() -> StoryData:
+    return StoryData(
+        general=GeneralData(title="Title", themes=["Loss", "Hope"], genres=["Fantasy"], synopsis="A synopsis."),
+        structure=SevenPointStoryStructure(
+            hook="hook",
+            plot_turn_1="turn 1",
+            pinch_point_1="pinch 1",
+            mid_point="mid",
+            pinch_point_2="pinch 2",
+            plot_turn_2="turn 2",
+            resolution="resolution",
+        ),
+        characters=[
+            CharacterData(name="Kit", age=20, role="Hero", description="Tall", personality="Brave"),
+            CharacterData(name="Rex", age=40, role="Villain", description="Short", personality="Cruel"),
+        ],
+    )
+
+
+class TestPromptLayout(unittest.TestCase):
+
+    def test_prefix_is_byte_identical(self):
+        self.assertEqual(build_prefix_messages(make_story_data()), build_prefix_messages(make_story_data()))
+
+    def test_prefix_reserves_room_for_the_suffix(self):
+        story_data = make_story_data()
+        full = estimate_tokens(build_prefix_messages(story_data))
+        self.assertLessEqual(estimate_tokens(build_prefix_messages(story_data, full + 10)), full + 10)
+        self.assertLessEqual(estimate_tokens(build_prefix_messages(story_data, full + 10, reserved=40)), full - 30)
+
+    def test_seed_prompt_sections(self):
+        seed = story_seed_prompt(make_story_data())
+        self.assertLess(seed.index("Title: Title"), seed.index("Seven Point Story Structure"))
+        self.assertLess(seed.index("Seven Point Story Structure"), seed.index("Characters:"))
+        self.assertIn("Kit", seed)
+        self.assertIn("Rex", seed)
+
+    def test_seed_prompt_skips_missing_sections(self):
+        story_data = make_story_data()
+        story_data.characters = None
+        story_data.structure = None
+        seed = story_seed_prompt(story_data)
+        self.assertNotIn("Characters:", seed)
+        self.assertNotIn("Story Structure/Outline:", seed)
+
+    def test_structure_point_details(self):
+        structure = make_story_data().structure
+        self.assertEqual(get_structure_point_details(structure, "Plot Turn 1"), "turn 1")
+        self.assertIn("not found", get_structure_point_details(structure, "Unknown Point"))
+
+
+class TestPrefixTracker(unittest.TestCase):
+
+    def test_shared_prefix_ratio(self):
+        tracker = PrefixTracker()
+        prefix = [{"role": "system", "content": "system"}, {"role": "user", "content": "x" * 100}]
+
+        self.assertIsNone(tracker.shared_prefix_ratio("scenes", [*prefix, {"role": "user", "content": "chapter 1"}]))
+        ratio = tracker.shared_prefix_ratio("scenes", [*prefix, {"role": "user", "content": "chapter 2"}])
+        self.assertGreater(ratio, 0.9)
+        self.assertLess(ratio, 1.0)
+
+    def test_stages_are_tracked_separately(self):
+        tracker = PrefixTracker()
+        messages = [{"role": "user", "content": "prompt"}]
+        tracker.shared_prefix_ratio("scenes", messages)
+        self.assertIsNone(tracker.shared_prefix_ratio("draft", messages))
+        self.assertEqual(tracker.shared_prefix_ratio("scenes", messages), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import openai
+
+from story_writer import llm
+from story_writer.rate_limit import RateLimiter, backoff_delay, parse_retry_after
+
+
+def rate_limit_error(headers: dict) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://localhost:1234/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Too many requests", response=response, body=None)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after(httpx.Headers({"retry-after": "3"})), 3.0)
+
+    def test_milliseconds_take_precedence(self):
+        self.assertEqual(parse_retry_after(httpx.Headers({"retry-after": "3", "retry-after-ms": "250"})), 0.25)
+
+    def test_http_date_in_the_past(self):
+        self.assertEqual(parse_retry_after(httpx.Headers({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0.0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(httpx.Headers({})))
+        self.assertIsNone(parse_retry_after(httpx.Headers({"retry-after": "soon"})))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_backoff_delay_is_bounded(self):
+        for attempt in range(10):
+            with self.subTest(msg=f"Attempt {attempt}"):
+                self.assertLessEqual(backoff_delay(attempt, base=1.0, maximum=8.0), min(8.0, 2**attempt))
+
+    def test_requests_per_second(self):
+        limiter = RateLimiter(requests_per_second=20)
+        start = time.monotonic()
+        for _ in range(25):  # The first 20 are the initial burst.
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_pause(self):
+        limiter = RateLimiter()
+        limiter.pause(0.1)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        start = time.monotonic()
+        for _ in range(1000):
+            limiter.acquire(tokens=10_000)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class TestCreateChatCompletion(unittest.TestCase):
+
+    def test_retries_rate_limit_errors_after_retry_after(self):
+        create = mock.Mock(side_effect=[rate_limit_error({"retry-after": "0.05"}), "response"])
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        with mock.patch.object(llm, "get_rate_limiter", return_value=RateLimiter()):
+            start = time.monotonic()
+            response, backend = llm.create_chat_completion(client, estimated_tokens=10, stage="test", messages=[])
+
+        self.assertEqual(response, "response")
+        self.assertIsNone(backend)
+        self.assertEqual(create.call_count, 2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_gives_up_after_max_retries(self):
+        create = mock.Mock(side_effect=rate_limit_error({"retry-after": "0"}))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        with (
+            mock.patch.object(llm, "get_rate_limiter", return_value=RateLimiter()),
+            mock.patch.object(llm.settings.rate_limit, "max_retries", 2),
+            self.assertRaises(openai.RateLimitError),
+        ):
+            llm.create_chat_completion(client, estimated_tokens=10, stage="test", messages=[])
+        self.assertEqual(create.call_count, 3)
@@ -0,0 +1,115 @@
+import json
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import settings
+from story_writer.checkpoint import StoryDataWriter
+from story_writer.metrics import CallMetrics, MetricsCollector
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import GeneralData
+from story_writer.resume import RunProgress, atomic_open, get_run_progress, reset_run_progress
+from story_writer.scripts.generate_story_outline import generate_story_outline
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir, self.file_type = settings.story_dir, settings.save_story_file_type
+        settings.story_dir = Path(self.temp_dir.name)
+        reset_run_progress()
+
+    def tearDown(self):
+        settings.story_dir, settings.save_story_file_type = self.story_dir, self.file_type
+        reset_run_progress()
+        self.temp_dir.cleanup()
+
+    def test_atomic_open_keeps_previous_file_on_error(self):
+        file_path = settings.story_dir / "story_data.json"
+        file_path.write_text("previous", encoding="utf-8")
+
+        with self.assertRaises(ValueError), atomic_open(file_path) as f:
+            f.write("partial")
+            raise ValueError("Failed halfway through.")
+        self.assertEqual(file_path.read_text(encoding="utf-8"), "previous")
+
+        with atomic_open(file_path) as f:
+            f.write("new")
+        self.assertEqual(file_path.read_text(encoding="utf-8"), "new")
+        # No temporary files left behind.
+        self.assertEqual([path.name for path in settings.story_dir.iterdir()], ["story_data.json"])
+
+    def test_atomic_open_file_permissions(self):
+        file_path = settings.story_dir / "story_data.json"
+        with atomic_open(file_path) as f:
+            f.write("new")
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(stat.S_IMODE(file_path.stat().st_mode), 0o666 & ~umask)
+
+        # A rewritten file keeps its permissions.
+        file_path.chmod(0o640)
+        with atomic_open(file_path) as f:
+            f.write("newer")
+        self.assertEqual(stat.S_IMODE(file_path.stat().st_mode), 0o640)
+
+    def test_progress_is_saved(self):
+        progress = RunProgress(settings.story_dir)
+        progress.mark_complete("general")
+        progress.mark_complete("scenes", 2)
+        progress.mark_complete("scenes", 1)
+        progress.mark_complete("scenes", 1)
+
+        loaded = RunProgress(settings.story_dir)
+        self.assertTrue(loaded.is_complete("general"))
+        self.assertFalse(loaded.is_complete("structure"))
+        self.assertEqual(loaded.chapters, {"scenes": [1, 2]})
+        self.assertTrue(loaded.is_complete("scenes", 1))
+        self.assertFalse(loaded.is_complete("draft", 1))
+
+    def test_markers_wait_for_coalesced_saves(self):
+        writer = StoryDataWriter(interval=60)
+        story_data = mock.Mock()
+        writer.save(story_data)
+        writer.mark_complete("structure")
+        self.assertTrue(get_run_progress().is_complete("structure"))
+
+        writer.save(story_data)  # Coalesced, the outline file doesn't have these changes yet.
+        writer.mark_complete("worldbuilding")
+        self.assertFalse(get_run_progress().is_complete("worldbuilding"))
+
+        writer.flush()
+        self.assertTrue(get_run_progress().is_complete("worldbuilding"))
+
+    def test_resume_requires_completed_general_stage(self):
+        with self.assertRaises(ValueError):
+            generate_story_outline(mock.Mock(), "A prompt", resume_dir=settings.story_dir)
+
+    def test_resume_keeps_earlier_metrics(self):
+        settings.save_story_file_type = "json"
+        StoryData(general=GeneralData(title="Title", genres=["Fantasy"], themes=["Loss"], synopsis="S.")).save_to_file(
+            settings.story_dir
+        )
+        earlier = MetricsCollector()
+        earlier.record_call(CallMetrics(stage="general", latency=1.0))
+        earlier.record_retry("general", "validation")
+        earlier.save(settings.story_dir)
+        progress = get_run_progress()
+        for stage in ["general", "structure", "revise_general", "worldbuilding", "characters", "chapters", "scenes"]:
+            progress.mark_complete(stage)
+
+        generate_story_outline(mock.Mock(), "A prompt", resume_dir=settings.story_dir)
+
+        with open(settings.story_dir / "metrics.json", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertEqual(saved["stages"]["general"]["llm_calls"], 1)
+        self.assertEqual(saved["stages"]["general"]["retries"]["validation"], 1)
+        self.assertEqual(len(saved["calls"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
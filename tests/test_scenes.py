@@ -0,0 +1,120 @@
+import re
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import settings
+from story_writer.checkpoint import reset_story_data_writer
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import CharacterData
+from story_writer.outline.scenes import generate_scenes_for_chapter
+from story_writer.rate_limit import estimate_tokens
+from story_writer.resume import reset_run_progress
+from tests.fakes import fake_client, make_story_data
+
+
+def chapter_number(messages: list[dict]) -> int:
+    return int(re.search(r"Chapter Title: Chapter (\d+)", messages[-1]["content"]).group(1))
+
+
+def scenes_reply(messages: list[dict]) -> list[dict]:
+    """Scenes named after their chapter. Later chapters answer sooner, so the calls finish in reverse order."""
+    number = chapter_number(messages)
+    time.sleep(0.02 * max(5 - number, 0))
+    return [
+        {
+            "summary": f"Chapter {number} scene {scene}",
+            "number": scene,
+            "characters": [],
+            "location": "Camelot",
+            "story_beats": [],
+        }
+        for scene in range(1, 5)
+    ]
+
+
+class TestConcurrentScenes(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.multiple(
+            settings,
+            story_dir=Path(self.temp_dir.name),
+            scenes_max_concurrency=4,
+            scenes_per_chapter_minimum_count=3,
+            consolidate_saved_output=True,
+            save_story_file_type="json",
+        )
+        self.patch.start()
+        reset_story_data_writer()
+        reset_run_progress()
+
+    def tearDown(self):
+        self.patch.stop()
+        reset_story_data_writer()
+        reset_run_progress()
+        self.temp_dir.cleanup()
+
+    def test_scenes_land_in_chapter_order(self):
+        finished = []
+
+        def reply(messages: list[dict]) -> list[dict]:
+            scenes = scenes_reply(messages)
+            finished.append(chapter_number(messages))
+            return scenes
+
+        story_data = generate_scenes_for_chapter(fake_client(reply=reply), make_story_data(chapters=4))
+
+        self.assertEqual(finished, [4, 3, 2, 1])
+        for chapter in story_data.chapters:
+            self.assertEqual(
+                [scene.summary for scene in chapter.scenes],
+                [f"Chapter {chapter.number} scene {scene}" for scene in range(1, 5)],
+            )
+        self.assertEqual(StoryData.load_from_file(settings.story_dir), story_data)
+
+    def test_queued_chapters_are_cancelled_after_a_failure(self):
+        settings.scenes_max_concurrency = 2
+
+        def reply(messages: list[dict]) -> list[dict]:
+            if chapter_number(messages) == 1:
+                raise RuntimeError("Chapter 1 failed.")
+            # Keeps both workers busy while the failure is handled, so the chapters after them are still queued.
+            time.sleep(0.2)
+            return scenes_reply(messages)
+
+        client = fake_client(reply=reply)
+        with self.assertRaisesRegex(RuntimeError, "Chapter 1 failed."):
+            generate_scenes_for_chapter(client, make_story_data(chapters=6))
+
+        called = {chapter_number(call["messages"]) for call in client.chat.completions.calls}
+        self.assertIn(1, called)
+        self.assertTrue(called.isdisjoint({4, 5, 6}), called)
+
+    def test_prefix_stable_prompts_fit_in_the_budget(self):
+        story_data = make_story_data(chapters=2)
+        story_data.characters = [
+            CharacterData(name=f"Kit {i}", age=20, role="Hero", description="Tall. " * 40, personality="Brave. " * 40)
+            for i in range(5)
+        ]
+        # The shared prefix has to leave room for the longest chapter instructions, not just the system prompt.
+        story_data.chapters[1].synopsis = "Things happen. " * 100
+
+        client = fake_client(reply=scenes_reply)
+        with (
+            mock.patch.object(settings, "prefix_stable_prompts", True),
+            mock.patch.object(settings.stage.scenes, "prompt_token_budget", 1000),
+        ):
+            generate_scenes_for_chapter(client, story_data)
+
+        prompts = [call["messages"] for call in client.chat.completions.calls]
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(prompts[0][:-1], prompts[1][:-1])
+        for messages in prompts:
+            self.assertLessEqual(estimate_tokens(messages), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
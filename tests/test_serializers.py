@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from story_writer import serializers, settings
+from story_writer.models.outline import StoryData
+from story_writer.models.outline_models import GeneralData
+from story_writer.serializers import (
+    SERIALIZERS,
+    Serializer,
+    export_story_data,
+    find_saved_file,
+    get_serializer,
+)
+
+DATA = {"title": "Café", "chapters": [{"number": 1, "scenes": [], "beats": ["One", "Two"]}], "done": False}
+
+
+class TestSerializers(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.story_dir = Path(self.temp_dir.name)
+        self.file_type = settings.save_story_file_type
+
+    def tearDown(self):
+        settings.save_story_file_type = self.file_type
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        for file_type, serializer in SERIALIZERS.items():
+            if not serializer.available:
+                continue
+            with self.subTest(file_type=file_type):
+                self.assertEqual(serializer.loads(serializer.dumps(DATA)), DATA)
+
+    def test_json_output_without_orjson(self):
+        serializer = get_serializer("json")
+        with mock.patch.object(serializers, "orjson", None):
+            stdlib_output = serializer.dumps(DATA)
+        if serializers.orjson is not None:
+            self.assertEqual(serializer.dumps(DATA), stdlib_output)
+        self.assertIn(b'\n  "title": "Caf\xc3\xa9"', stdlib_output)
+
+    def test_serializer_must_implement_dumps_and_loads(self):
+        class TextSerializer(Serializer):
+            extension = "txt"
+
+            def dumps(self, data):
+                return str(data).encode("utf-8")
+
+        with self.assertRaises(TypeError):
+            TextSerializer()
+
+    def test_unknown_or_unavailable_file_type(self):
+        with self.assertRaises(ValueError):
+            get_serializer("xml")
+        if serializers.msgpack is None:
+            with self.assertRaisesRegex(ValueError, "msgpack"):
+                get_serializer("msgpack")
+
+    def test_finds_file_saved_as_another_file_type(self):
+        (self.story_dir / "story_data.json").write_bytes(get_serializer("json").dumps(DATA))
+        file_path, serializer = find_saved_file(self.story_dir, "story_data", "yaml")
+        self.assertEqual(file_path.name, "story_data.json")
+        self.assertIs(serializer, SERIALIZERS["json"])
+
+        file_path, _ = find_saved_file(self.story_dir, "scene-1", "yaml")
+        self.assertEqual(file_path.name, "scene-1.yaml")
+
+    def test_export_story_data(self):
+        settings.save_story_file_type = "json"
+        story_data = StoryData(general=GeneralData(title="Title", genres=["Fantasy"], themes=["Loss"], synopsis="S."))
+        story_data.save_to_file(self.story_dir)
+
+        file_path = export_story_data(self.story_dir, "yaml")
+        self.assertEqual(file_path.name, "story_data.yaml")
+        settings.save_story_file_type = "yaml"
+        self.assertEqual(StoryData.load_from_file(self.story_dir), story_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
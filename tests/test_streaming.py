@@ -0,0 +1,102 @@
+import json
+import unittest
+
+from story_writer.models.outline_models import ChapterData, GeneralData, SceneData, WorldbuildingData
+from story_writer.models.utils import create_json_schema
+from story_writer.streaming import IncrementalJsonValidator, StreamValidationError
+
+
+def schema_for(model):
+    return create_json_schema(model)["json_schema"]["schema"]
+
+
+def feed_in_chunks(validator: IncrementalJsonValidator, text: str, chunk_size: int = 3):
+    for i in range(0, len(text), chunk_size):
+        validator.feed(text[i : i + chunk_size])
+
+
+class TestIncrementalJsonValidator(unittest.TestCase):
+    general = {"title": "A Story", "themes": ["Love"], "genres": ["Drama"], "synopsis": 'Things "happen" \u2014 twice.'}
+    scene = {
+        "summary": "A scene.",
+        "characters": [{"name": "Ann", "status": "awake"}],
+        "location": "Home",
+        "story_beats": ["Wakes up", "Eats"],
+    }
+
+    def test_valid_output(self):
+        test_cases = [
+            (GeneralData, json.dumps(self.general)),
+            (GeneralData, json.dumps(self.general, indent=4)),
+            (SceneData, json.dumps([self.scene, self.scene])),
+            (SceneData, json.dumps([dict(self.scene, number=None), dict(self.scene, number=2)])),
+            (WorldbuildingData, json.dumps({"culture": "c", "additional_details": "d", "history": None})),
+            (ChapterData, "[]"),
+            # Integral numbers are valid integers.
+            (SceneData, json.dumps([dict(self.scene, number=1)]).replace('"number": 1', '"number": 1.0')),
+            (SceneData, json.dumps([dict(self.scene, number=1)]).replace('"number": 1', '"number": 1.5e1')),
+        ]
+        for model, output in test_cases:
+            with self.subTest(msg=f"{model.__name__}: {output[:40]}"):
+                validator = IncrementalJsonValidator(schema_for(model))
+                feed_in_chunks(validator, output)
+                self.assertTrue(validator.complete)
+
+    def test_incomplete_output_is_not_an_error(self):
+        validator = IncrementalJsonValidator(schema_for(SceneData))
+        feed_in_chunks(validator, json.dumps([self.scene])[:-10])
+        self.assertFalse(validator.complete)
+
+        # A partial number in an integer field, ie the start of 1.0.
+        validator = IncrementalJsonValidator(schema_for(SceneData))
+        feed_in_chunks(validator, '[{"summary": "A", "number": 1.')
+        self.assertFalse(validator.complete)
+
+    def test_invalid_output_fails_early(self):
+        test_cases = [
+            (GeneralData, 'Sure! Here is the json: {"title": "A"}'),
+            (GeneralData, '["title"]'),
+            (GeneralData, '{"title": 5'),
+            (GeneralData, '{"title": "A", "themes": "Love"'),
+            (GeneralData, '{"title": "A",}'),
+            (GeneralData, '{"title": "A"}'),
+            (GeneralData, '{"title": "A" "themes"'),
+            (SceneData, '[{"summary": "A", "number": 1.5,'),
+            (SceneData, '[{"summary": "A", "number": 1e-1}'),
+            (SceneData, '[{"summary": "A", "number": tru '),
+            (SceneData, '[{"summary": "A", "characters": [{"name": 1'),
+            (SceneData, "[] extra"),
+        ]
+        for model, output in test_cases:
+            with self.subTest(msg=f"{model.__name__}: {output}"):
+                validator = IncrementalJsonValidator(schema_for(model))
+                with self.assertRaises(StreamValidationError):
+                    feed_in_chunks(validator, output)
+
+    def test_allow_repairable_output(self):
+        general = json.dumps(self.general)
+        test_cases = [
+            (GeneralData, f"Sure! Here is the json:\n```json\n{general}\n```"),
+            (GeneralData, general.replace('"Love"]', '"Love",]').replace("}", ",}")),
+            (GeneralData, general.replace("A Story", "A\nStory")),
+            (SceneData, json.dumps([self.scene]) + " extra"),
+        ]
+        for model, output in test_cases:
+            with self.subTest(msg=f"{model.__name__}: {output[:40]}"):
+                validator = IncrementalJsonValidator(schema_for(model), allow_repairable=True)
+                feed_in_chunks(validator, output)
+                self.assertTrue(validator.complete)
+
+    def test_allow_repairable_still_fails_on_schema_errors(self):
+        test_cases = [
+            (GeneralData, 'Here: {"title": 5'),
+            (GeneralData, '{"title": "A",}'),
+            (GeneralData, '{"title": ]'),
+            (SceneData, '[{"summary": "A", "number": 1.5,'),
+            (SceneData, '[{"summary": "A", "number": 1e-1}'),
+        ]
+        for model, output in test_cases:
+            with self.subTest(msg=f"{model.__name__}: {output}"):
+                validator = IncrementalJsonValidator(schema_for(model), allow_repairable=True)
+                with self.assertRaises(StreamValidationError):
+                    feed_in_chunks(validator, output)